@@ -3,3 +3,7 @@ from frappe.exceptions import ValidationError
 
 class SyncDisabledError(ValidationError):
 	pass
+
+
+class CircuitBreakerOpenError(ValidationError):
+	pass
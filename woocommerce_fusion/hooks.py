@@ -143,6 +143,13 @@ scheduler_events = {
 	# 	"all": [
 	# 		"woocommerce_fusion.tasks.all"
 	# 	],
+	"cron": {
+		"* * * * *": [
+			"woocommerce_fusion.tasks.stock_update.update_stock_levels_for_queued_items",
+			"woocommerce_fusion.tasks.utils.flush_woocommerce_request_logs",
+			"woocommerce_fusion.woocommerce.doctype.woocommerce_api_metric.woocommerce_api_metric.rollup_api_metrics",
+		],
+	},
 	# 	"weekly": [
 	# 		"woocommerce_fusion.tasks.daily"
 	# 	],
@@ -0,0 +1,8 @@
+import frappe
+
+
+def execute():
+	"""
+	Add an index on creation to WooCommerce Request Log, as old logs are cleared in order of creation
+	"""
+	frappe.db.add_index("WooCommerce Request Log", ["creation"])
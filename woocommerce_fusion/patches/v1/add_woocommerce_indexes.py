@@ -0,0 +1,31 @@
+import frappe
+
+# Indexes for looking up records by their WooCommerce fields, as (doctype, fields, index name)
+WOOCOMMERCE_INDEXES = [
+	(
+		"Sales Order",
+		["woocommerce_server", "woocommerce_id"],
+		"woocommerce_server_woocommerce_id_index",
+	),
+	("Customer", ["woocommerce_identifier"], "woocommerce_identifier_index"),
+	(
+		"Address",
+		["woocommerce_identifier", "address_type"],
+		"woocommerce_identifier_address_type_index",
+	),
+	(
+		"Item WooCommerce Server",
+		["woocommerce_server", "woocommerce_id"],
+		"woocommerce_server_woocommerce_id_index",
+	),
+]
+
+
+def execute():
+	"""
+	Add indexes for looking up Sales Orders, Customers, Addresses and Items by their WooCommerce
+	fields
+	"""
+	for doctype, fields, index_name in WOOCOMMERCE_INDEXES:
+		if all(frappe.db.has_column(doctype, field) for field in fields):
+			frappe.db.add_index(doctype, fields, index_name=index_name)
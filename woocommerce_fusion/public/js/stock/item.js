@@ -22,7 +22,8 @@ frappe.ui.form.on('Item', {
 		frappe.call({
 			method: "woocommerce_fusion.tasks.stock_update.update_stock_levels_on_woocommerce_site",
 			args: {
-				item_code: frm.doc.name
+				item_code: frm.doc.name,
+				force: 1
 			},
 			callback: function(r) {
 				frappe.dom.unfreeze();
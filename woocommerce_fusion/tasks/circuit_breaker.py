@@ -0,0 +1,118 @@
+import frappe
+from frappe import _
+
+from woocommerce_fusion.exceptions import CircuitBreakerOpenError
+
+WC_CIRCUIT_OPEN_KEY = "woocommerce_circuit_open"
+WC_CIRCUIT_FAILURES_KEY = "woocommerce_circuit_failures"
+WC_CIRCUIT_PROBE_KEY = "woocommerce_circuit_probe"
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 60
+# Consecutive failures are forgotten if there are no failures for this number of seconds
+FAILURES_EXPIRY = 3600
+
+# States returned by allow_request
+CIRCUIT_CLOSED = 1
+CIRCUIT_RECOVERING = 2
+
+# Returns 0 if the circuit is open, CIRCUIT_CLOSED if there were no recent failures, and
+# CIRCUIT_RECOVERING if there were failures. Once the circuit has been open for the cooldown
+# period (i.e. it is half-open), a single probe request at a time is allowed through
+ALLOW_REQUEST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+	return 0
+end
+local failures = tonumber(redis.call('GET', KEYS[2]) or '0')
+if failures == 0 then
+	return 1
+end
+if failures < tonumber(ARGV[1]) then
+	return 2
+end
+if redis.call('SET', KEYS[3], 1, 'NX', 'EX', ARGV[2]) then
+	return 2
+end
+return 0
+"""
+
+# Counts a failure, and opens the circuit for ARGV[2] seconds once there were ARGV[1] consecutive
+# failures. Returns 1 if the circuit was opened
+RECORD_FAILURE_SCRIPT = """
+local failures = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('DEL', KEYS[3])
+if failures >= tonumber(ARGV[1]) then
+	redis.call('SET', KEYS[1], 1, 'EX', ARGV[2])
+	return 1
+end
+return 0
+"""
+
+_scripts = {}
+
+
+def get_keys(url: str):
+	cache = frappe.cache()
+	return [
+		cache.make_key(f"{WC_CIRCUIT_OPEN_KEY}|{url}"),
+		cache.make_key(f"{WC_CIRCUIT_FAILURES_KEY}|{url}"),
+		cache.make_key(f"{WC_CIRCUIT_PROBE_KEY}|{url}"),
+	]
+
+
+def run_script(script: str, keys, args):
+	if script not in _scripts:
+		_scripts[script] = frappe.cache().register_script(script)
+	return _scripts[script](keys=keys, args=args)
+
+
+def allow_request(url: str, failure_threshold: int, probe_timeout: int) -> int:
+	"""
+	Check the circuit breaker of a WooCommerce site before sending a request, and raise
+	CircuitBreakerOpenError if requests to the site are paused after repeated failures.
+
+	Returns the state of the circuit, which should be passed on to record_result
+	"""
+	if not failure_threshold:
+		return CIRCUIT_CLOSED
+
+	state = run_script(
+		ALLOW_REQUEST_SCRIPT, keys=get_keys(url), args=[failure_threshold, max(probe_timeout, 1)]
+	)
+	if not state:
+		raise CircuitBreakerOpenError(
+			_("Requests to {0} are paused after repeated failures").format(url)
+		)
+	return state
+
+
+def record_result(
+	url: str, state: int, success: bool, failure_threshold: int, cooldown: int = DEFAULT_COOLDOWN
+):
+	"""
+	Record the outcome of a request to a WooCommerce site. A success closes the circuit, and
+	failure_threshold consecutive failures open it for the cooldown period (in seconds)
+	"""
+	if not failure_threshold:
+		return
+
+	if success:
+		# Nothing to reset if there were no recent failures, which saves a round trip to Redis
+		if state == CIRCUIT_RECOVERING:
+			frappe.cache().delete_value(
+				[f"{WC_CIRCUIT_FAILURES_KEY}|{url}", f"{WC_CIRCUIT_PROBE_KEY}|{url}"]
+			)
+		return
+
+	run_script(
+		RECORD_FAILURE_SCRIPT,
+		keys=get_keys(url),
+		args=[failure_threshold, max(cooldown, 1), FAILURES_EXPIRY],
+	)
+
+
+def is_circuit_open(url: str) -> bool:
+	"""
+	Returns True if requests to a WooCommerce site are paused after repeated failures
+	"""
+	return bool(frappe.cache().exists(f"{WC_CIRCUIT_OPEN_KEY}|{url}"))
@@ -0,0 +1,106 @@
+import random
+from email.utils import parsedate_to_datetime
+from time import sleep, time
+
+import frappe
+import requests
+
+WC_RATE_LIMIT_KEY = "woocommerce_rate_limit"
+WC_RATE_LIMIT_PAUSE_KEY = "woocommerce_rate_limit_pause"
+DEFAULT_BURST = 10
+BACKOFF_BASE = 0.5
+MAX_RETRY_DELAY = 60
+
+# Status codes after which a request is retried. 429 means that the request was not processed,
+# so it is retried for all methods, the others only for idempotent methods
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Token bucket shared by all workers, refilled at ARGV[1] tokens per millisecond up to a capacity
+# of ARGV[2] tokens. A token is always taken; the number of milliseconds to wait before sending
+# the request is returned, which is also the remaining time if requests to the site are paused
+RATE_LIMIT_SCRIPT = """
+local wait = math.max(redis.call('PTTL', KEYS[2]), 0)
+local rate = tonumber(ARGV[1])
+if rate > 0 then
+	local capacity = tonumber(ARGV[2])
+	local time = redis.call('TIME')
+	local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+	local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+	local tokens = tonumber(bucket[1]) or capacity
+	local timestamp = tonumber(bucket[2]) or now
+	tokens = math.min(capacity, tokens + (now - timestamp) * rate) - 1
+	if tokens < 0 then
+		wait = math.max(wait, math.ceil(-tokens / rate))
+	end
+	redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', now)
+	redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+end
+return wait
+"""
+
+_rate_limit_script = None
+
+
+def wait_for_rate_limit(url: str, rate_limit: float = 0, burst: int = DEFAULT_BURST):
+	"""
+	Block until a request may be sent to a WooCommerce site, according to its rate limit (in
+	requests per second) and any pause requested by the site through a Retry-After header
+	"""
+	global _rate_limit_script
+
+	cache = frappe.cache()
+	if _rate_limit_script is None:
+		_rate_limit_script = cache.register_script(RATE_LIMIT_SCRIPT)
+
+	wait_ms = _rate_limit_script(
+		keys=[
+			cache.make_key(f"{WC_RATE_LIMIT_KEY}|{url}"),
+			cache.make_key(f"{WC_RATE_LIMIT_PAUSE_KEY}|{url}"),
+		],
+		args=[rate_limit / 1000, max(burst or DEFAULT_BURST, 1)],
+	)
+	if wait_ms:
+		sleep(wait_ms / 1000)
+
+
+def pause_requests(url: str, seconds: float):
+	"""
+	Pause requests from all workers to a WooCommerce site for the given number of seconds
+	"""
+	cache = frappe.cache()
+	cache.set(cache.make_key(f"{WC_RATE_LIMIT_PAUSE_KEY}|{url}"), 1, px=max(int(seconds * 1000), 1))
+
+
+def should_retry(method: str, response: requests.Response) -> bool:
+	if response.status_code not in RETRY_STATUS_CODES:
+		return False
+	return response.status_code == 429 or method.upper() in IDEMPOTENT_METHODS
+
+
+def get_retry_after(response: requests.Response) -> float | None:
+	"""
+	Returns the number of seconds from the Retry-After header, which is either a number of seconds
+	or an HTTP date
+	"""
+	retry_after = response.headers.get("Retry-After")
+	if not retry_after:
+		return None
+	try:
+		return max(float(retry_after), 0)
+	except ValueError:
+		pass
+	try:
+		return max(parsedate_to_datetime(retry_after).timestamp() - time(), 0)
+	except (TypeError, ValueError):
+		return None
+
+
+def get_retry_delay(attempt: int, retry_after: float | None = None) -> float:
+	"""
+	Returns the number of seconds to wait before retrying, either as requested by the server or as
+	exponential backoff with full jitter
+	"""
+	if retry_after is not None:
+		return min(retry_after, MAX_RETRY_DELAY)
+	return random.uniform(0, min(BACKOFF_BASE * 2**attempt, MAX_RETRY_DELAY))
@@ -1,8 +1,26 @@
 import math
+from typing import Dict, List, Optional
 
 import frappe
+from frappe.query_builder.functions import Coalesce, IfNull, Sum
+from frappe.utils import cint
 
+from woocommerce_fusion.tasks.circuit_breaker import is_circuit_open
 from woocommerce_fusion.tasks.utils import APIWithRequestLogging
+from woocommerce_fusion.woocommerce.doctype.woocommerce_product.woocommerce_product import (
+	WooCommerceProduct,
+)
+from woocommerce_fusion.woocommerce.woocommerce_api import (
+	WC_BATCH_SIZE_LIMIT,
+	WooCommerceAPI,
+	get_wc_servers,
+)
+
+STOCK_SYNC_CHECKPOINT_KEY = "woocommerce_stock_sync_checkpoint"
+STOCK_SYNC_CHECKPOINT_EXPIRY = 2 * 24 * 60 * 60
+STOCK_SYNC_QUEUE_KEY = "woocommerce_stock_sync_queue"
+# Hash per WooCommerce Server of the stock quantity that was last posted, per WooCommerce ID
+STOCK_SYNC_LAST_QUANTITY_KEY = "woocommerce_last_stock_quantity"
 
 
 def update_stock_levels_for_woocommerce_item(doc, method):
@@ -20,51 +38,208 @@ def update_stock_levels_for_woocommerce_item(doc, method):
 				if doc.doctype == "Sales Invoice":
 					if doc.update_stock == 0:
 						return
-				item_codes = [row.item_code for row in doc.items]
-				for item_code in item_codes:
-					frappe.enqueue(
-						"woocommerce_fusion.tasks.stock_update.update_stock_levels_on_woocommerce_site",
-						enqueue_after_commit=True,
-						item_code=item_code,
-					)
+				item_codes = {row.item_code for row in doc.items if row.item_code}
+				if not item_codes:
+					return
+				# Queue the item codes once the transaction is committed. The queue is a set, so items
+				# from several transactions are posted at most once per run of update_stock_levels_for_queued_items
+				frappe.db.after_commit.add(
+					lambda item_codes=item_codes: frappe.cache().sadd(STOCK_SYNC_QUEUE_KEY, *item_codes)
+				)
+
+
+def update_stock_levels_for_queued_items():
+	"""
+	Post stock levels to WooCommerce for the items that were queued by stock transactions since the last run
+	"""
+	queued_item_codes = frappe.cache().smembers(STOCK_SYNC_QUEUE_KEY)
+	item_codes = [frappe.safe_decode(item_code) for item_code in queued_item_codes]
+	if not item_codes:
+		return
+
+	frappe.cache().srem(STOCK_SYNC_QUEUE_KEY, *item_codes)
+	try:
+		skipped_servers = update_stock_levels_for_all_enabled_items(item_codes=item_codes)
+	except Exception as err:
+		# Queue the items again, so that they are retried during the next run
+		frappe.cache().sadd(STOCK_SYNC_QUEUE_KEY, *item_codes)
+		raise err
+
+	# Queue the items again for servers that were skipped. Stock levels that were posted to the
+	# other servers are unchanged during the next run, so they are not posted again
+	if skipped_servers:
+		frappe.cache().sadd(STOCK_SYNC_QUEUE_KEY, *item_codes)
 
 
 def update_stock_levels_for_all_enabled_items_in_background():
 	"""
 	Get all enabled ERPNext Items and post stock updates to WooCommerce
 	"""
-	erpnext_items = []
-	current_page_length = 500
-	start = 0
-
-	# Get all items, 500 records at a time
-	while current_page_length == 500:
-		items = frappe.db.get_all(
-			doctype="Item",
-			filters={"disabled": 0},
-			fields=["name"],
-			start=start,
-			page_length=500,
+	frappe.enqueue(
+		"woocommerce_fusion.tasks.stock_update.update_stock_levels_for_all_enabled_items",
+		queue="long",
+		timeout=3600,
+	)
+
+
+def update_stock_levels_for_all_enabled_items(force=False, item_codes: Optional[List[str]] = None):
+	"""
+	Post stock levels of all linked, enabled ERPNext Items (or only those in item_codes) to every
+	WooCommerce Server with stock sync enabled, using WooCommerce's products/batch endpoint
+
+	Stock levels that are unchanged since they were last posted are skipped, unless force is set or the
+	WooCommerce Server is configured to post all stock levels daily. Servers whose circuit breaker is
+	open are skipped, and their names are returned.
+	"""
+	skipped_servers = []
+	wc_api_list = WooCommerceProduct._init_api()
+	for wc_server in get_wc_servers():
+		if not wc_server.enable_sync or not wc_server.enable_stock_level_synchronisation:
+			continue
+		if is_circuit_open(wc_server.woocommerce_server_url):
+			skipped_servers.append(wc_server.name)
+			continue
+		wc_api = next((api for api in wc_api_list if api.woocommerce_server == wc_server.name), None)
+		if wc_api:
+			if item_codes is not None:
+				update_stock_levels_for_woocommerce_server(wc_server, wc_api, item_codes=item_codes)
+			else:
+				update_stock_levels_for_woocommerce_server(
+					wc_server, wc_api, force=force or wc_server.post_all_stock_levels_daily
+				)
+	return skipped_servers
+
+
+def update_stock_levels_for_woocommerce_server(
+	wc_server, wc_api: WooCommerceAPI, force=False, item_codes: Optional[List[str]] = None
+):
+	"""
+	Post stock levels for all Items (or only those in item_codes) linked to a WooCommerce Server, in chunks
+	of up to 100 Items.
+
+	When posting all Items, progress is checkpointed after every chunk, so that an interrupted run
+	resumes where it stopped.
+	"""
+	checkpoint_key = f"{STOCK_SYNC_CHECKPOINT_KEY}:{wc_server.name}" if item_codes is None else None
+	checkpoint = frappe.cache().get_value(checkpoint_key) if checkpoint_key else None
+	stock_levels = get_stock_levels_for_woocommerce_server(
+		wc_server, after_item_code=checkpoint, item_codes=item_codes
+	)
+	for row in stock_levels:
+		row.stock_quantity = math.floor(row.stock_quantity)
+
+	# Skip stock levels that have been posted before
+	if not force:
+		last_stock_quantities = get_last_stock_quantities(
+			wc_server.name, [row.woocommerce_id for row in stock_levels]
+		)
+		stock_levels = [
+			row
+			for row in stock_levels
+			if last_stock_quantities.get(str(row.woocommerce_id)) != str(row.stock_quantity)
+		]
+
+	for i in range(0, len(stock_levels), WC_BATCH_SIZE_LIMIT):
+		chunk = stock_levels[i : i + WC_BATCH_SIZE_LIMIT]
+		data_to_post = {
+			"update": [{"id": row.woocommerce_id, "stock_quantity": row.stock_quantity} for row in chunk]
+		}
+
+		try:
+			response = wc_api.api.post("products/batch", data=data_to_post)
+		except Exception as err:
+			error_message = f"{frappe.get_traceback()}\n\nData in POST request: \n{str(data_to_post)}"
+			frappe.log_error("WooCommerce Error", error_message)
+			raise err
+		if response.status_code != 200:
+			error_message = f"Status Code not 200\n\nData in POST request: \n{str(data_to_post)}"
+			error_message += f"\n\nResponse: \n{response.status_code}\nResponse Text: {response.text}"
+			frappe.log_error("WooCommerce Error", error_message)
+			raise ValueError(error_message)
+
+		# Save the posted stock levels, and log the products that WooCommerce failed to update
+		results = response.json().get("update", [])
+		set_last_stock_quantities(
+			wc_server.name,
+			{
+				row.woocommerce_id: row.stock_quantity
+				for row, result in zip(chunk, results)
+				if "error" not in result
+			},
+		)
+		errors = [
+			f"{row.item_code} (WooCommerce ID {row.woocommerce_id}): {result['error'].get('message')}"
+			for row, result in zip(chunk, results)
+			if "error" in result
+		]
+		if errors:
+			frappe.log_error("WooCommerce Error", "Stock level update failed for:\n" + "\n".join(errors))
+
+		if checkpoint_key:
+			frappe.cache().set_value(
+				checkpoint_key, chunk[-1].item_code, expires_in_sec=STOCK_SYNC_CHECKPOINT_EXPIRY
+			)
+
+	if checkpoint_key:
+		frappe.cache().delete_value(checkpoint_key)
+
+
+def get_stock_levels_for_woocommerce_server(
+	wc_server, after_item_code: Optional[str] = None, item_codes: Optional[List[str]] = None
+):
+	"""
+	Get the stock quantity of every enabled stock Item linked to a WooCommerce Server, summed over the
+	WooCommerce Server's warehouses, with a single aggregate query
+	"""
+	iws = frappe.qb.DocType("Item WooCommerce Server")
+	item = frappe.qb.DocType("Item")
+	bin = frappe.qb.DocType("Bin")
+
+	warehouses = [row.warehouse for row in wc_server.warehouses]
+	bin_condition = bin.item_code == iws.parent
+	bin_condition &= bin.warehouse.isin(warehouses) if warehouses else bin.warehouse.isnull()
+
+	query = (
+		frappe.qb.from_(iws)
+		.inner_join(item)
+		.on(item.name == iws.parent)
+		.left_join(bin)
+		.on(bin_condition)
+		.select(
+			iws.name.as_("item_woocommerce_server"),
+			iws.parent.as_("item_code"),
+			iws.woocommerce_id,
+			Coalesce(Sum(bin.actual_qty), 0).as_("stock_quantity"),
 		)
-		erpnext_items.extend(items)
-		current_page_length = len(items)
-		start += current_page_length
-
-	for item in erpnext_items:
-		frappe.enqueue(
-			"woocommerce_fusion.tasks.stock_update.update_stock_levels_on_woocommerce_site",
-			item_code=item.name,
+		.where(
+			(iws.parenttype == "Item")
+			& (iws.woocommerce_server == wc_server.name)
+			& (iws.enabled == 1)
+			& (IfNull(iws.woocommerce_id, "") != "")
+			& (item.disabled == 0)
+			& (item.is_stock_item == 1)
 		)
+		.groupby(iws.name)
+		.orderby(iws.parent)
+	)
+	if after_item_code:
+		query = query.where(iws.parent > after_item_code)
+	if item_codes is not None:
+		query = query.where(iws.parent.isin(item_codes))
+
+	return query.run(as_dict=True)
 
 
 @frappe.whitelist()
-def update_stock_levels_on_woocommerce_site(item_code):
+def update_stock_levels_on_woocommerce_site(item_code, force=False):
 	"""
 	Updates stock levels of an item on all its associated WooCommerce sites.
 
 	This function fetches the item from the database, then for each associated
 	WooCommerce site, it retrieves the current inventory, calculates the new stock quantity,
 	and posts the updated stock levels back to the WooCommerce site.
+
+	Stock levels that are unchanged since they were last posted are skipped, unless force is set.
 	"""
 	item = frappe.get_doc("Item", item_code)
 
@@ -88,24 +263,35 @@ def update_stock_levels_on_woocommerce_site(item_code):
 			):
 				continue
 
+			# Sum all quantities from select warehouses and round the total down (WooCommerce API doesn't accept float values)
+			stock_quantity = math.floor(
+				sum(
+					bin.actual_qty
+					for bin in bins
+					if bin.warehouse in [row.warehouse for row in wc_server.warehouses]
+				)
+			)
+
+			# Skip the API call if this stock level has been posted before
+			last_stock_quantities = get_last_stock_quantities(woocommerce_server, [woocommerce_id])
+			if not cint(force) and last_stock_quantities.get(str(woocommerce_id)) == str(stock_quantity):
+				continue
+
 			wc_api = APIWithRequestLogging(
 				url=wc_server.woocommerce_server_url,
 				consumer_key=wc_server.api_consumer_key,
 				consumer_secret=wc_server.api_consumer_secret,
 				version="wc/v3",
-				timeout=40,
+				timeout=wc_server.api_timeout,
+				pool_maxsize=wc_server.api_pool_size,
+				max_retries=wc_server.api_max_retries,
+				rate_limit=wc_server.api_rate_limit,
+				burst=wc_server.api_burst,
+				failure_threshold=wc_server.circuit_breaker_threshold,
+				cooldown=wc_server.circuit_breaker_cooldown,
 			)
 
-			# Sum all quantities from select warehouses and round the total down (WooCommerce API doesn't accept float values)
-			data_to_post = {
-				"stock_quantity": math.floor(
-					sum(
-						bin.actual_qty
-						for bin in bins
-						if bin.warehouse in [row.warehouse for row in wc_server.warehouses]
-					)
-				)
-			}
+			data_to_post = {"stock_quantity": stock_quantity}
 
 			try:
 				response = wc_api.put(endpoint=f"products/{woocommerce_id}", data=data_to_post)
@@ -123,4 +309,52 @@ def update_stock_levels_on_woocommerce_site(item_code):
 				frappe.log_error("WooCommerce Error", error_message)
 				raise ValueError(error_message)
 
+			set_last_stock_quantities(woocommerce_server, {woocommerce_id: stock_quantity})
+
 		return True
+
+
+def get_last_stock_quantities(
+	woocommerce_server: str, woocommerce_ids: List[str]
+) -> Dict[str, str]:
+	"""
+	Returns the stock quantities that were last posted to the WooCommerce Products of a WooCommerce
+	Server, keyed by WooCommerce ID. Products without a posted stock quantity are left out
+	"""
+	if not woocommerce_ids:
+		return {}
+
+	cache = frappe.cache()
+	woocommerce_ids = [str(woocommerce_id) for woocommerce_id in woocommerce_ids]
+	stock_quantities = cache.hmget(
+		cache.make_key(f"{STOCK_SYNC_LAST_QUANTITY_KEY}|{woocommerce_server}"), woocommerce_ids
+	)
+	return {
+		woocommerce_id: frappe.safe_decode(stock_quantity)
+		for woocommerce_id, stock_quantity in zip(woocommerce_ids, stock_quantities)
+		if stock_quantity is not None
+	}
+
+
+def set_last_stock_quantities(woocommerce_server: str, stock_quantities: Dict[str, int]):
+	"""
+	Save the stock quantities that were posted to the WooCommerce Products of a WooCommerce Server,
+	keyed by WooCommerce ID.
+
+	These are kept in Redis rather than on the Item, so that saving an Item form that was opened
+	earlier does not overwrite them. If they are lost, every stock level is posted once more
+	"""
+	if not stock_quantities:
+		return
+
+	cache = frappe.cache()
+	# RedisWrapper.hset only sets a single (pickled) value, so the hash is set through a pipeline
+	pipeline = cache.pipeline()
+	pipeline.hset(
+		cache.make_key(f"{STOCK_SYNC_LAST_QUANTITY_KEY}|{woocommerce_server}"),
+		mapping={
+			str(woocommerce_id): str(stock_quantity)
+			for woocommerce_id, stock_quantity in stock_quantities.items()
+		},
+	)
+	pipeline.execute()
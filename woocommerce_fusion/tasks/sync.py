@@ -1,14 +1,19 @@
 import base64
 import hashlib
 import hmac
-from typing import List
+from typing import List, Tuple
 
 import frappe
 from frappe import _, _dict
 
+from woocommerce_fusion.tasks.circuit_breaker import is_circuit_open
 from woocommerce_fusion.woocommerce.doctype.woocommerce_server.woocommerce_server import (
 	WooCommerceServer,
 )
+from woocommerce_fusion.woocommerce.woocommerce_api import get_wc_servers
+
+WC_RECORD_LOCK_KEY = "woocommerce_record_lock"
+WC_RECORD_LOCK_TIMEOUT = 600
 
 
 class SynchroniseWooCommerce:
@@ -23,8 +28,36 @@ class SynchroniseWooCommerce:
 
 	@staticmethod
 	def get_wc_servers():
-		wc_servers = frappe.get_all("WooCommerce Server")
-		return [frappe.get_doc("WooCommerce Server", server.name) for server in wc_servers]
+		return get_wc_servers()
+
+
+def get_available_wc_servers() -> Tuple[List[str], List[str]]:
+	"""
+	Returns the names of the enabled WooCommerce Servers that accept requests, and the names of those
+	whose circuit breaker is open after repeated failures
+	"""
+	available, unavailable = [], []
+	for wc_server in get_wc_servers():
+		if wc_server.enable_sync:
+			if is_circuit_open(wc_server.woocommerce_server_url):
+				unavailable.append(wc_server.name)
+			else:
+				available.append(wc_server.name)
+	return available, unavailable
+
+
+def get_record_lock(woocommerce_server: str, resource: str, resource_id: int | str):
+	"""
+	Returns a Redis lock for a WooCommerce record (e.g. resource 'orders'), which is held while the
+	record is synchronised, so that webhooks and scheduled synchronisations never synchronise the same
+	record at the same time
+	"""
+	cache = frappe.cache()
+	return cache.lock(
+		cache.make_key(f"{WC_RECORD_LOCK_KEY}|{woocommerce_server}|{resource}|{resource_id}"),
+		timeout=WC_RECORD_LOCK_TIMEOUT,
+		blocking_timeout=WC_RECORD_LOCK_TIMEOUT,
+	)
 
 
 def log_and_raise_error(err):
@@ -1,16 +1,22 @@
-from time import sleep
-from typing import List, Optional
+from copy import deepcopy
+from typing import Dict, List, Optional
 
 import frappe
 from erpnext.stock.doctype.item_price.item_price import ItemPrice
 from frappe import qb
 from frappe.query_builder import Criterion
 
+from woocommerce_fusion.tasks.circuit_breaker import is_circuit_open
 from woocommerce_fusion.tasks.sync import SynchroniseWooCommerce
+from woocommerce_fusion.woocommerce.doctype.woocommerce_product.woocommerce_product import (
+	WooCommerceProduct,
+)
 from woocommerce_fusion.woocommerce.doctype.woocommerce_server.woocommerce_server import (
 	WooCommerceServer,
 )
 from woocommerce_fusion.woocommerce.woocommerce_api import (
+	WC_BATCH_SIZE_LIMIT,
+	WooCommerceBatchWriter,
 	generate_woocommerce_record_name_from_domain_and_id,
 )
 
@@ -65,6 +71,9 @@ class SynchroniseItemPrice(SynchroniseWooCommerce):
 		Run synchornisation
 		"""
 		for server in self.servers:
+			# Skip servers whose circuit breaker is open, the next run will catch up
+			if is_circuit_open(server.woocommerce_server_url):
+				continue
 			self.wc_server = server
 			self.get_erpnext_item_prices()
 			self.sync_items_with_woocommerce_products()
@@ -104,36 +113,78 @@ class SynchroniseItemPrice(SynchroniseWooCommerce):
 		"""
 		Synchronise Item Prices with WooCommerce Products
 		"""
-		for item_price in self.item_price_list:
-			# Get the WooCommerce Product doc
-			wc_product_name = generate_woocommerce_record_name_from_domain_and_id(
-				domain=item_price.woocommerce_server, resource_id=item_price.woocommerce_id
+		batch = WooCommerceProduct.get_batch_writer()
+		for i in range(0, len(self.item_price_list), WC_BATCH_SIZE_LIMIT):
+			item_prices = self.item_price_list[i : i + WC_BATCH_SIZE_LIMIT]
+			wc_products = self.get_woocommerce_products(item_prices)
+
+			for item_price in item_prices:
+				# Get the WooCommerce Product doc
+				wc_product_name = generate_woocommerce_record_name_from_domain_and_id(
+					domain=item_price.woocommerce_server, resource_id=item_price.woocommerce_id
+				)
+				wc_product = wc_products.get(wc_product_name) or frappe.get_doc(
+					{"doctype": "WooCommerce Product", "name": wc_product_name}
+				)
+
+				try:
+					# Variations are not returned when listing products, so load them individually
+					if wc_product_name not in wc_products:
+						wc_product.load_from_db()
+
+					# If self.item_price_doc is set, set the price_list_rate accordingly, else use the price_list_rate from the price list
+					price_list_rate = (
+						self.item_price_doc.price_list_rate
+						if self.item_price_doc and self.item_price_doc.price_list == self.wc_server.price_list
+						else item_price.price_list_rate
+					)
+					# Handle blank string for regular_price
+					if not wc_product.regular_price:
+						wc_product.regular_price = 0
+					# When the price is set, the WooCommerce API returns a string value, when the price is not set, it returns a float value of 0.0
+					wc_product_regular_price = (
+						float(wc_product.regular_price)
+						if isinstance(wc_product.regular_price, str)
+						else wc_product.regular_price
+					)
+					if wc_product_regular_price != price_list_rate:
+						wc_product._doc_before_save = deepcopy(wc_product)
+						wc_product.regular_price = price_list_rate
+						batch.update(wc_product)
+				except Exception:
+					error_message = f"{frappe.get_traceback()}\n\n Product Data: \n{str(wc_product.as_dict())}"
+					frappe.log_error("WooCommerce Error: Price List Sync", error_message)
+
+			self.write_batch(batch)
+
+	def get_woocommerce_products(self, item_prices: List) -> Dict:
+		"""
+		Get the WooCommerce Products for a list of Item Prices with a single API call
+		"""
+		woocommerce_ids = [str(item_price.woocommerce_id) for item_price in item_prices]
+		try:
+			wc_products = WooCommerceProduct.get_list_of_records(
+				{
+					"filters": [["WooCommerce Product", "id", "in", woocommerce_ids]],
+					"page_length": len(woocommerce_ids),
+					"servers": [self.wc_server.name],
+					"as_doc": True,
+				}
 			)
-			wc_product = frappe.get_doc({"doctype": "WooCommerce Product", "name": wc_product_name})
+		except Exception:
+			# Fall back to loading products individually
+			return {}
 
-			try:
-				wc_product.load_from_db()
+		return {wc_product.name: wc_product for wc_product in wc_products}
 
-				# If self.item_price_doc is set, set the price_list_rate accordingly, else use the price_list_rate from the price list
-				price_list_rate = (
-					self.item_price_doc.price_list_rate
-					if self.item_price_doc and self.item_price_doc.price_list == self.wc_server.price_list
-					else item_price.price_list_rate
-				)
-				# Handle blank string for regular_price
-				if not wc_product.regular_price:
-					wc_product.regular_price = 0
-				# When the price is set, the WooCommerce API returns a string value, when the price is not set, it returns a float value of 0.0
-				wc_product_regular_price = (
-					float(wc_product.regular_price)
-					if isinstance(wc_product.regular_price, str)
-					else wc_product.regular_price
-				)
-				if wc_product_regular_price != price_list_rate:
-					wc_product.regular_price = price_list_rate
-					wc_product.save()
-			except Exception:
-				error_message = f"{frappe.get_traceback()}\n\n Product Data: \n{str(wc_product.as_dict())}"
-				frappe.log_error("WooCommerce Error: Price List Sync", error_message)
+	def write_batch(self, batch: WooCommerceBatchWriter) -> None:
+		"""
+		Write the queued product price updates to WooCommerce and log failures
+		"""
+		if len(batch) == 0:
+			return
 
-			sleep(self.wc_server.price_list_delay_per_item)
+		for result in batch.flush():
+			if not result.success:
+				error_message = f"{result.error}\n\n Product Data: \n{str(result.doc.as_dict())}"
+				frappe.log_error("WooCommerce Error: Price List Sync", error_message)
@@ -1,16 +1,18 @@
 import json
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional, Tuple
+from time import monotonic
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import frappe
 from erpnext.stock.doctype.item.item import Item
 from frappe import _, _dict
-from frappe.query_builder import Criterion
-from frappe.utils import get_datetime, now
+from frappe.query_builder import Criterion, Order
+from frappe.utils import cstr, get_datetime, now
 
 from woocommerce_fusion.exceptions import SyncDisabledError
-from woocommerce_fusion.tasks.sync import SynchroniseWooCommerce
+from woocommerce_fusion.tasks.sync import SynchroniseWooCommerce, get_available_wc_servers
 from woocommerce_fusion.woocommerce.doctype.woocommerce_product.woocommerce_product import (
 	WooCommerceProduct,
 )
@@ -18,9 +20,16 @@ from woocommerce_fusion.woocommerce.doctype.woocommerce_server.woocommerce_serve
 	WooCommerceServer,
 )
 from woocommerce_fusion.woocommerce.woocommerce_api import (
+	WC_RECORDS_PER_PAGE_LIMIT,
 	generate_woocommerce_record_name_from_domain_and_id,
 )
 
+# Worker-level LRU cache of the Items linked to WooCommerce Products, as
+# (site, woocommerce_server, woocommerce_id) -> (expiry time, Item)
+LINKED_ITEM_CACHE_SIZE = 10000
+LINKED_ITEM_CACHE_TTL = 300
+_linked_items = OrderedDict()
+
 
 def run_item_sync_from_hook(doc, method):
 	"""
@@ -114,13 +123,20 @@ def sync_woocommerce_products_modified_since(date_time_from=None):
 		)
 		raise ValueError(error_text)
 
-	wc_products = get_list_of_wc_products(date_time_from=date_time_from)
-	for wc_product in wc_products:
-		try:
-			run_item_sync(woocommerce_product=wc_product, enqueue=True)
-		# Skip items with errors, as these exceptions will be logged
-		except Exception:
-			pass
+	# Skip servers whose circuit breaker is open after repeated failures
+	available_servers, unavailable_servers = get_available_wc_servers()
+
+	if available_servers or not unavailable_servers:
+		for wc_product in iterate_wc_products(date_time_from=date_time_from, servers=available_servers):
+			try:
+				run_item_sync(woocommerce_product=wc_product, enqueue=True)
+			# Skip items with errors, as these exceptions will be logged
+			except Exception:
+				pass
+
+	# Keep the last sync date, so that the skipped servers are synchronised once they are available
+	if unavailable_servers:
+		return
 
 	wc_settings.reload()
 	wc_settings.wc_last_sync_date_items = now()
@@ -210,8 +226,9 @@ class SynchroniseItem(SynchroniseWooCommerce):
 		iws = frappe.qb.DocType("Item WooCommerce Server")
 		itm = frappe.qb.DocType("Item")
 
+		# Links that were disabled when the product was deleted are matched as well, so that a restored
+		# product is linked to its Item again instead of creating a duplicate Item
 		and_conditions = [
-			iws.enabled == 1,
 			iws.woocommerce_server == self.woocommerce_product.woocommerce_server,
 			iws.woocommerce_id == self.woocommerce_product.woocommerce_id,
 		]
@@ -221,7 +238,8 @@ class SynchroniseItem(SynchroniseWooCommerce):
 			.join(itm)
 			.on(iws.parent == itm.name)
 			.where(Criterion.all(and_conditions))
-			.select(iws.parent, iws.name)
+			.select(iws.parent, iws.name, iws.enabled)
+			.orderby(iws.enabled, order=Order.desc)
 			.limit(1)
 		).run(as_dict=True)
 
@@ -233,6 +251,19 @@ class SynchroniseItem(SynchroniseWooCommerce):
 					server.idx for server in found_item.woocommerce_servers if server.name == item_codes[0].name
 				),
 			)
+			if not item_codes[0].enabled and self.woocommerce_product.status != "trash":
+				self.enable_item_woocommerce_server()
+
+	def enable_item_woocommerce_server(self):
+		"""
+		Enable the link of the ERPNext Item to a restored WooCommerce Product again. The Item's modified
+		timestamp is not updated, so that the restored product is still synchronised to the Item
+		"""
+		item_woocommerce_server = self.item.item_woocommerce_server
+		frappe.db.set_value(
+			"Item WooCommerce Server", item_woocommerce_server.name, "enabled", 1, update_modified=False
+		)
+		item_woocommerce_server.enabled = 1
 
 	def sync_wc_product_with_erpnext_item(self):
 		"""
@@ -525,23 +556,57 @@ class SynchroniseItem(SynchroniseWooCommerce):
 
 
 def get_list_of_wc_products(
-	item: Optional[ERPNextItemToSync] = None, date_time_from: Optional[datetime] = None
+	item: Optional[ERPNextItemToSync] = None,
+	date_time_from: Optional[datetime] = None,
+	fields: Optional[List[str]] = None,
 ) -> List[WooCommerceProduct]:
 	"""
 	Fetches a list of WooCommerce Products within a specified date range or linked with an Item, using pagination.
 
-	At least one of date_time_from, item parameters are required
+	At least one of date_time_from, item parameters are required. If fields are given, only those
+	WooCommerce fields are retrieved.
+	"""
+	return list(iterate_wc_products(item=item, date_time_from=date_time_from, fields=fields))
+
+
+def iterate_wc_products(
+	item: Optional[ERPNextItemToSync] = None,
+	date_time_from: Optional[datetime] = None,
+	fields: Optional[List[str]] = None,
+	servers: Optional[List[str]] = None,
+) -> Iterator[WooCommerceProduct]:
+	"""
+	Yields WooCommerce Products within a specified date range or linked with an Item, one at a time.
+
+	Products are retrieved from WooCommerce one page at a time, so only a single page is kept in memory.
+	"""
+	for wc_products in iterate_wc_products_in_chunks(
+		item=item, date_time_from=date_time_from, fields=fields, servers=servers
+	):
+		yield from wc_products
+
+
+def iterate_wc_products_in_chunks(
+	item: Optional[ERPNextItemToSync] = None,
+	date_time_from: Optional[datetime] = None,
+	chunk_size: int = WC_RECORDS_PER_PAGE_LIMIT,
+	fields: Optional[List[str]] = None,
+	servers: Optional[List[str]] = None,
+) -> Iterator[List[WooCommerceProduct]]:
+	"""
+	Yields pages of WooCommerce Products within a specified date range or linked with an Item. The
+	variations of variable products are included in the page of their parent product.
+
+	At least one of date_time_from, item parameters are required. If fields are given, only those
+	WooCommerce fields are retrieved. If servers are given, only those WooCommerce Servers are
+	queried.
 	"""
 	if not any([date_time_from, item]):
 		raise ValueError("At least one of date_time_from or item parameters are required")
 
-	wc_records_per_page_limit = 100
-	page_length = wc_records_per_page_limit
-	new_results = True
-	start = 0
+	page_length = min(chunk_size, WC_RECORDS_PER_PAGE_LIMIT)
+	cursor = None
 	filters = []
-	wc_products = []
-	servers = None
 
 	# Build filters
 	if date_time_from:
@@ -550,24 +615,21 @@ def get_list_of_wc_products(
 		filters.append(["WooCommerce Product", "id", "=", item.item_woocommerce_server.woocommerce_id])
 		servers = [item.item_woocommerce_server.woocommerce_server]
 
-	while new_results:
-		woocommerce_product = frappe.get_doc({"doctype": "WooCommerce Product"})
-		new_results = woocommerce_product.get_list(
-			args={
-				"filters": filters,
-				"page_lenth": page_length,
-				"start": start,
-				"servers": servers,
-				"as_doc": True,
-			}
-		)
-		for wc_product in new_results:
-			wc_products.append(wc_product)
-		start += page_length
-		if len(new_results) < page_length:
-			new_results = []
-
-	return wc_products
+	while True:
+		args = {
+			"filters": filters,
+			"page_length": page_length,
+			"cursor": cursor,
+			"servers": servers,
+			# 'type' is needed to find the variations of variable products
+			"_fields": [*fields, "type"] if fields else None,
+		}
+		wc_products, cursor = WooCommerceProduct.get_page_of_records(args)
+		wc_products = WooCommerceProduct.extend_with_variations(wc_products, args)
+		if wc_products:
+			yield [frappe.get_doc(wc_product) for wc_product in wc_products]
+		if not cursor:
+			break
 
 
 def get_item_price_rate(item: ERPNextItemToSync):
@@ -617,3 +679,72 @@ def clear_sync_hash_and_run_item_sync(item_code: str):
 
 	if len(iwss) > 0:
 		run_item_sync(item_code=item_code, enqueue=True)
+
+
+def disable_items_linked_to_woocommerce_product(woocommerce_server: str, woocommerce_id: int):
+	"""
+	Disable the links of ERPNext Items to a deleted WooCommerce Product, so that stock levels and
+	prices are no longer posted to it
+	"""
+	iws = frappe.qb.DocType("Item WooCommerce Server")
+	(
+		frappe.qb.update(iws)
+		.set(iws.enabled, 0)
+		.where(iws.woocommerce_server == woocommerce_server)
+		.where(iws.woocommerce_id == str(woocommerce_id))
+	).run()
+
+
+def get_items_linked_to_woocommerce_products(
+	woocommerce_server: str, woocommerce_ids: List[str | int]
+) -> Dict[str, _dict]:
+	"""
+	Returns the name and item_name of the enabled Items linked to WooCommerce Products (or product
+	variations) of a WooCommerce Server, keyed by WooCommerce ID.
+
+	Items that are not in the worker-level cache are looked up with a single query. Found Items are
+	cached for LINKED_ITEM_CACHE_TTL seconds, while products without an Item are not cached, as their
+	Items may be created by the next synchronisation
+	"""
+	site = frappe.local.site
+	now_monotonic = monotonic()
+	items = {}
+	uncached_ids = []
+	for woocommerce_id in {cstr(woocommerce_id) for woocommerce_id in woocommerce_ids}:
+		key = (site, woocommerce_server, woocommerce_id)
+		cached = _linked_items.get(key)
+		if cached and cached[0] > now_monotonic:
+			_linked_items.move_to_end(key)
+			items[woocommerce_id] = cached[1]
+		else:
+			uncached_ids.append(woocommerce_id)
+
+	if uncached_ids:
+		iws = frappe.qb.DocType("Item WooCommerce Server")
+		itm = frappe.qb.DocType("Item")
+		linked_items = (
+			frappe.qb.from_(iws)
+			.join(itm)
+			.on(iws.parent == itm.name)
+			.where(
+				(iws.woocommerce_id.isin(uncached_ids))
+				& (iws.woocommerce_server == woocommerce_server)
+				& (itm.disabled == 0)
+			)
+			.select(iws.woocommerce_id, itm.name, itm.item_name)
+		).run(as_dict=True)
+
+		expiry = now_monotonic + LINKED_ITEM_CACHE_TTL
+		for linked_item in linked_items:
+			# Keep the first Item if a product is linked to more than one
+			if linked_item.woocommerce_id in items:
+				continue
+			item = _dict(name=linked_item.name, item_name=linked_item.item_name)
+			items[linked_item.woocommerce_id] = item
+			_linked_items[(site, woocommerce_server, linked_item.woocommerce_id)] = (expiry, item)
+			_linked_items.move_to_end((site, woocommerce_server, linked_item.woocommerce_id))
+
+		while len(_linked_items) > LINKED_ITEM_CACHE_SIZE:
+			_linked_items.popitem(last=False)
+
+	return items
@@ -1,6 +1,7 @@
 import json
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import frappe
 from erpnext.selling.doctype.sales_order.sales_order import SalesOrder
@@ -9,17 +10,33 @@ from frappe.utils import get_datetime
 from frappe.utils.data import cstr, now
 
 from woocommerce_fusion.exceptions import SyncDisabledError
-from woocommerce_fusion.tasks.sync import SynchroniseWooCommerce
-from woocommerce_fusion.tasks.sync_items import run_item_sync
+from woocommerce_fusion.tasks.sync import (
+	SynchroniseWooCommerce,
+	get_available_wc_servers,
+	get_record_lock,
+)
+from woocommerce_fusion.tasks.sync_items import (
+	get_items_linked_to_woocommerce_products,
+	run_item_sync,
+)
 from woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order import (
 	WC_ORDER_STATUS_MAPPING,
 	WC_ORDER_STATUS_MAPPING_REVERSE,
 	WooCommerceOrder,
 )
+from woocommerce_fusion.woocommerce.doctype.woocommerce_server.woocommerce_server import (
+	WooCommerceServer,
+)
 from woocommerce_fusion.woocommerce.woocommerce_api import (
+	WC_RECORDS_PER_PAGE_LIMIT,
 	generate_woocommerce_record_name_from_domain_and_id,
 )
 
+# Fields needed to decide if a WooCommerce Order changed since it was last synchronised
+WC_ORDER_CHANGE_DETECTION_FIELDS = ["id", "date_modified", "status"]
+# Maximum number of WooCommerce Orders that are synchronised by a single background job
+WC_ORDER_SYNC_JOB_SIZE = 100
+
 
 def run_sales_order_sync_from_hook(doc, method):
 	if (
@@ -27,7 +44,9 @@ def run_sales_order_sync_from_hook(doc, method):
 		and not doc.flags.get("created_by_sync", None)
 		and doc.woocommerce_server
 	):
-		frappe.enqueue(run_sales_order_sync, queue="long", sales_order_name=doc.name)
+		frappe.enqueue(
+			clear_sync_hash_and_run_sales_order_sync, queue="long", sales_order_name=doc.name
+		)
 
 
 @frappe.whitelist()
@@ -80,6 +99,21 @@ def run_sales_order_sync(
 	)
 
 
+def clear_sync_hash_and_run_sales_order_sync(sales_order_name: str):
+	"""
+	Clear the last sync hash value using db.set_value, as it does not call the ORM triggers
+	and it does not update the modified timestamp (by using the update_modified parameter)
+	"""
+	frappe.db.set_value(
+		"Sales Order",
+		sales_order_name,
+		"custom_woocommerce_last_sync_hash",
+		None,
+		update_modified=False,
+	)
+	run_sales_order_sync(sales_order_name=sales_order_name)
+
+
 def sync_woocommerce_orders_modified_since(date_time_from=None):
 	"""
 	Get list of WooCommerce orders modified since date_time_from
@@ -100,14 +134,35 @@ def sync_woocommerce_orders_modified_since(date_time_from=None):
 		)
 		raise ValueError(error_text)
 
-	wc_orders = get_list_of_wc_orders(date_time_from=date_time_from)
-	wc_orders += get_list_of_wc_orders(date_time_from=date_time_from, status="trash")
-	for wc_order in wc_orders:
-		try:
-			run_sales_order_sync(woocommerce_order=wc_order, enqueue=True)
-		# Skip orders with errors, as these exceptions will be logged
-		except Exception:
-			pass
+	# Skip servers whose circuit breaker is open after repeated failures
+	available_servers, unavailable_servers = get_available_wc_servers()
+
+	# First get the fields needed to detect changes, then only fetch the full orders that changed
+	if available_servers or not unavailable_servers:
+		for status in (None, "trash"):
+			for wc_orders in iterate_wc_orders_in_chunks(
+				date_time_from=date_time_from,
+				status=status,
+				fields=WC_ORDER_CHANGE_DETECTION_FIELDS,
+				servers=available_servers,
+			):
+				# Only the IDs of the changed orders are passed on, and the full orders are fetched by
+				# the background jobs
+				wc_order_ids_to_sync = get_wc_order_ids_requiring_sync(wc_orders)
+				for woocommerce_server, wc_order_ids in wc_order_ids_to_sync.items():
+					for i in range(0, len(wc_order_ids), WC_ORDER_SYNC_JOB_SIZE):
+						frappe.enqueue(
+							sync_woocommerce_orders,
+							queue="long",
+							woocommerce_server=woocommerce_server,
+							woocommerce_ids=wc_order_ids[i : i + WC_ORDER_SYNC_JOB_SIZE],
+							status=status,
+						)
+
+	# Keep the last sync date, so that the skipped servers are synchronised once they are available
+	# again. Orders that were synchronised during this run are skipped then, as they are unchanged
+	if unavailable_servers:
+		return
 
 	wc_settings.reload()
 	wc_settings.wc_last_sync_date = now()
@@ -115,6 +170,60 @@ def sync_woocommerce_orders_modified_since(date_time_from=None):
 	wc_settings.save()
 
 
+def sync_woocommerce_orders(
+	woocommerce_server: str, woocommerce_ids: List[str], status: Optional[str] = None
+) -> Dict:
+	"""
+	Synchronise a chunk of WooCommerce Orders of a WooCommerce Server with Sales Orders.
+
+	The orders are fetched with a single request and their Sales Orders are looked up with a single
+	query. Every order is synchronised while holding its record lock (like webhooks), and is committed
+	separately, so that a failing order does not undo the others. Returns the IDs of the orders that
+	succeeded and the errors of those that failed, which are also logged
+	"""
+	wc_orders = get_wc_orders_by_id(woocommerce_server, woocommerce_ids, status=status)
+	sales_orders = get_sales_orders_for_wc_orders(wc_orders)
+	servers = SynchroniseSalesOrder.get_wc_servers()
+	# End the transaction, so that every order is read from a snapshot taken after it was locked
+	# nosemgrep
+	frappe.db.commit()
+
+	results = {"succeeded": [], "failed": {}}
+	tracebacks = []
+	for wc_order in wc_orders:
+		sales_order = sales_orders.get((wc_order.woocommerce_server, str(wc_order.id)))
+		sync = SynchroniseSalesOrder(
+			servers=servers,
+			woocommerce_order=wc_order,
+			sales_order_name=sales_order.name if sales_order else None,
+			# A webhook may have created the Sales Order while the order was waiting for its lock, so
+			# orders without a Sales Order are looked up again
+			sales_order_resolved=bool(sales_order),
+		)
+		try:
+			with get_record_lock(woocommerce_server, "orders", wc_order.id):
+				sync.run()
+				# nosemgrep
+				frappe.db.commit()
+			results["succeeded"].append(str(wc_order.id))
+		except Exception as err:
+			frappe.db.rollback()
+			results["failed"][str(wc_order.id)] = str(err)
+			tracebacks.append(f"WooCommerce Order {wc_order.name}\n{frappe.get_traceback()}")
+
+	# Orders that were deleted since the chunk was queued are not returned by WooCommerce
+	synced_ids = set(results["succeeded"]) | set(results["failed"])
+	for woocommerce_id in woocommerce_ids:
+		if str(woocommerce_id) not in synced_ids:
+			results["failed"][str(woocommerce_id)] = _("WooCommerce Order not found")
+
+	# The errors logged by the failed orders were rolled back, so they are logged here
+	if tracebacks:
+		frappe.log_error("WooCommerce Error", "\n\n".join(tracebacks))
+
+	return results
+
+
 class SynchroniseSalesOrder(SynchroniseWooCommerce):
 	"""
 	Class for managing synchronisation of a WooCommerce Order with an ERPNext Sales Order
@@ -124,10 +233,17 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 		self,
 		sales_order: Optional[SalesOrder] = None,
 		woocommerce_order: Optional[WooCommerceOrder] = None,
+		sales_order_name: Optional[str] = None,
+		sales_order_resolved: bool = False,
+		servers: List[WooCommerceServer | frappe._dict] = None,
 	) -> None:
-		super().__init__()
+		super().__init__(servers)
 		self.sales_order = sales_order
 		self.woocommerce_order = woocommerce_order
+		# The name of the linked Sales Order (or None if there is none), if it was already looked up
+		# for a whole page of WooCommerce Orders
+		self.sales_order_name = sales_order_name
+		self.sales_order_resolved = sales_order_resolved
 		self.settings = frappe.get_cached_doc("WooCommerce Integration Settings")
 
 	def run(self):
@@ -161,8 +277,13 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 
 	def get_erpnext_sales_order(self):
 		"""
-		Get erpnext item for a WooCommerce Product
+		Get the ERPNext Sales Order linked to the WooCommerce Order
 		"""
+		if self.sales_order_resolved:
+			if self.sales_order_name:
+				self.sales_order = frappe.get_doc("Sales Order", self.sales_order_name)
+			return
+
 		filters = [
 			["Sales Order", "woocommerce_id", "is", "set"],
 			["Sales Order", "woocommerce_server", "is", "set"],
@@ -197,9 +318,9 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 			self.create_sales_order(self.woocommerce_order)
 		elif self.sales_order and self.woocommerce_order:
 			# both exist, check sync hash
-			if (
-				self.woocommerce_order.woocommerce_date_modified
-				!= self.sales_order.custom_woocommerce_last_sync_hash
+			if is_modified_since_last_sync(
+				self.woocommerce_order.woocommerce_date_modified,
+				self.sales_order.custom_woocommerce_last_sync_hash,
 			):
 				if get_datetime(self.woocommerce_order.woocommerce_date_modified) > get_datetime(
 					self.sales_order.modified
@@ -209,17 +330,27 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 					self.sales_order.modified
 				):
 					self.update_woocommerce_order(self.woocommerce_order, self.sales_order)
+				self.set_sync_hash()
 
 			# If the Sales Order exists and has been submitted in the mean time, sync Payment Entries
-			if (
-				self.sales_order.docstatus == 1
-				and not self.sales_order.woocommerce_payment_entry
-				and not self.sales_order.custom_attempted_woocommerce_auto_payment_entry
-			):
+			if is_awaiting_payment_entry(self.sales_order):
 				self.sales_order.reload()
 				if self.create_and_link_payment_entry(self.woocommerce_order, self.sales_order):
 					self.sales_order.save()
 
+	def set_sync_hash(self):
+		"""
+		Set the last sync hash value using db.set_value, as it does not call the ORM triggers
+		and it does not update the modified timestamp (by using the update_modified parameter)
+		"""
+		frappe.db.set_value(
+			"Sales Order",
+			self.sales_order.name,
+			"custom_woocommerce_last_sync_hash",
+			get_datetime(self.woocommerce_order.woocommerce_date_modified),
+			update_modified=False,
+		)
+
 	def update_sales_order(self, woocommerce_order: WooCommerceOrder, sales_order: SalesOrder):
 		"""
 		Update the ERPNext Sales Order with fields from it's corresponding WooCommerce Order
@@ -439,6 +570,9 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 
 		new_sales_order.woocommerce_server = wc_order.woocommerce_server
 		new_sales_order.woocommerce_payment_method = wc_order.payment_method_title
+		new_sales_order.custom_woocommerce_last_sync_hash = get_datetime(
+			wc_order.woocommerce_date_modified
+		)
 		created_date = wc_order.date_created.split("T")
 		new_sales_order.transaction_date = created_date[0]
 		delivery_after = wc_server.delivery_after_days or 7
@@ -562,29 +696,25 @@ class SynchroniseSalesOrder(SynchroniseWooCommerce):
 		if not wc_server.warehouse:
 			frappe.throw(_("Please set Warehouse in WooCommerce Server"))
 
-		for item in json.loads(wc_order.line_items):
+		# Look up the Items of all line items at once
+		line_items = json.loads(wc_order.line_items)
+		linked_items = get_items_linked_to_woocommerce_products(
+			new_sales_order.woocommerce_server,
+			[
+				item.get("variation_id") or item.get("product_id")
+				for item in line_items
+				if item.get("variation_id") or item.get("product_id")
+			],
+		)
+
+		for item in line_items:
 			woocomm_item_id = item.get("variation_id") or item.get("product_id")
 
 			# Deleted items will have a "0" for variation_id/product_id
 			if woocomm_item_id == 0:
 				found_item = create_placeholder_item(new_sales_order)
 			else:
-				iws = frappe.qb.DocType("Item WooCommerce Server")
-				itm = frappe.qb.DocType("Item")
-				item_codes = (
-					frappe.qb.from_(iws)
-					.join(itm)
-					.on(iws.parent == itm.name)
-					.where(
-						(iws.woocommerce_id == cstr(woocomm_item_id))
-						& (iws.woocommerce_server == new_sales_order.woocommerce_server)
-						& (itm.disabled == 0)
-					)
-					.select(iws.parent)
-					.limit(1)
-				).run(as_dict=True)
-
-				found_item = frappe.get_doc("Item", item_codes[0].parent) if item_codes else None
+				found_item = linked_items.get(cstr(woocomm_item_id))
 
 			new_sales_order.append(
 				"items",
@@ -631,21 +761,59 @@ def get_list_of_wc_orders(
 	date_time_from: Optional[datetime] = None,
 	sales_order: Optional[SalesOrder] = None,
 	status: Optional[str] = None,
-):
+	fields: Optional[List[str]] = None,
+) -> List[WooCommerceOrder]:
 	"""
 	Fetches a list of WooCommerce Orders within a specified date range or linked with a Sales Order, using pagination.
 
-	At least one of date_time_from, or sales_order parameters are required
+	At least one of date_time_from, or sales_order parameters are required. If fields are given, only
+	those WooCommerce fields are retrieved.
+	"""
+	return list(
+		iterate_wc_orders(
+			date_time_from=date_time_from, sales_order=sales_order, status=status, fields=fields
+		)
+	)
+
+
+def iterate_wc_orders(
+	date_time_from: Optional[datetime] = None,
+	sales_order: Optional[SalesOrder] = None,
+	status: Optional[str] = None,
+	fields: Optional[List[str]] = None,
+) -> Iterator[WooCommerceOrder]:
+	"""
+	Yields WooCommerce Orders within a specified date range or linked with a Sales Order, one at a time.
+
+	Orders are retrieved from WooCommerce one page at a time, so only a single page is kept in memory.
+	"""
+	for wc_orders in iterate_wc_orders_in_chunks(
+		date_time_from=date_time_from, sales_order=sales_order, status=status, fields=fields
+	):
+		yield from wc_orders
+
+
+def iterate_wc_orders_in_chunks(
+	date_time_from: Optional[datetime] = None,
+	sales_order: Optional[SalesOrder] = None,
+	status: Optional[str] = None,
+	chunk_size: int = WC_RECORDS_PER_PAGE_LIMIT,
+	fields: Optional[List[str]] = None,
+	servers: Optional[List[str]] = None,
+) -> Iterator[List[WooCommerceOrder]]:
+	"""
+	Yields pages of WooCommerce Orders within a specified date range or linked with a Sales Order.
+
+	At least one of date_time_from, or sales_order parameters are required. If fields are given, only
+	those WooCommerce fields are retrieved. If servers are given, only those WooCommerce Servers are
+	queried.
 	"""
 	if not any([date_time_from, sales_order]):
 		raise ValueError("At least one of date_time_from or sales_order parameters are required")
 
-	wc_records_per_page_limit = 100
-	page_length = wc_records_per_page_limit
-	new_results = True
-	start = 0
+	page_length = min(chunk_size, WC_RECORDS_PER_PAGE_LIMIT)
+	cursor = None
 	filters = []
-	wc_orders = []
 
 	wc_settings = frappe.get_cached_doc("WooCommerce Integration Settings")
 	minimum_creation_date = wc_settings.minimum_creation_date
@@ -660,18 +828,128 @@ def get_list_of_wc_orders(
 	if status:
 		filters.append(["WooCommerce Order", "status", "=", status])
 
-	while new_results:
-		woocommerce_order = frappe.get_doc({"doctype": "WooCommerce Order"})
-		new_results = woocommerce_order.get_list(
-			args={"filters": filters, "page_lenth": page_length, "start": start, "as_doc": True}
+	while True:
+		wc_orders, cursor = WooCommerceOrder.get_page_of_records(
+			args={
+				"filters": filters,
+				"page_length": page_length,
+				"cursor": cursor,
+				"servers": servers,
+				"_fields": fields,
+				"as_doc": True,
+			}
 		)
-		for wc_order in new_results:
-			wc_orders.append(wc_order)
-		start += page_length
-		if len(new_results) < page_length:
-			new_results = []
+		if wc_orders:
+			yield wc_orders
+		if not cursor:
+			break
+
+
+def get_sales_orders_for_wc_orders(
+	wc_orders: List[WooCommerceOrder],
+) -> Dict[Tuple[str, str], frappe._dict]:
+	"""
+	Returns the Sales Orders linked to a page of WooCommerce Orders, keyed by WooCommerce Server and
+	WooCommerce ID, using a single query
+	"""
+	if not wc_orders:
+		return {}
+
+	woocommerce_servers = list({wc_order.woocommerce_server for wc_order in wc_orders})
+	sales_orders = frappe.get_all(
+		"Sales Order",
+		filters=[
+			["Sales Order", "woocommerce_server", "in", woocommerce_servers],
+			["Sales Order", "woocommerce_id", "in", [str(wc_order.id) for wc_order in wc_orders]],
+		],
+		fields=[
+			"name",
+			"woocommerce_server",
+			"woocommerce_id",
+			"docstatus",
+			"woocommerce_payment_entry",
+			"custom_attempted_woocommerce_auto_payment_entry",
+			"custom_woocommerce_last_sync_hash",
+		],
+	)
+	return {
+		(sales_order.woocommerce_server, sales_order.woocommerce_id): sales_order
+		for sales_order in sales_orders
+	}
+
+
+def get_wc_order_ids_requiring_sync(
+	wc_orders: List[WooCommerceOrder],
+	sales_orders: Optional[Dict[Tuple[str, str], frappe._dict]] = None,
+) -> Dict[str, List[str]]:
+	"""
+	Given a page of WooCommerce Orders that only have the fields needed to detect changes, returns the
+	IDs of the WooCommerce Orders that need to be synchronised with a Sales Order, per WooCommerce
+	Server.
+
+	An order is skipped if its Sales Order was last synchronised with the same version of the order,
+	and the Sales Order is not awaiting a Payment Entry. The linked Sales Orders are looked up, unless
+	they are given (as returned by get_sales_orders_for_wc_orders)
+	"""
+	if not wc_orders:
+		return {}
+
+	if sales_orders is None:
+		sales_orders = get_sales_orders_for_wc_orders(wc_orders)
+
+	wc_order_ids_to_sync = defaultdict(list)
+	for wc_order in wc_orders:
+		sales_order = sales_orders.get((wc_order.woocommerce_server, str(wc_order.id)))
+		if (
+			not sales_order
+			or is_modified_since_last_sync(
+				wc_order.woocommerce_date_modified, sales_order.custom_woocommerce_last_sync_hash
+			)
+			or is_awaiting_payment_entry(sales_order)
+		):
+			wc_order_ids_to_sync[wc_order.woocommerce_server].append(str(wc_order.id))
+
+	return dict(wc_order_ids_to_sync)
+
+
+def get_wc_orders_by_id(
+	woocommerce_server: str, woocommerce_ids: List[str], status: Optional[str] = None
+) -> List[WooCommerceOrder]:
+	"""
+	Fetch the full WooCommerce Orders with the given IDs from a WooCommerce Server in one request
+	"""
+	if not woocommerce_ids:
+		return []
 
-	return wc_orders
+	filters = [["WooCommerce Order", "id", "in", [str(wc_id) for wc_id in woocommerce_ids]]]
+	if status:
+		filters.append(["WooCommerce Order", "status", "=", status])
+	return WooCommerceOrder.get_list_of_records(
+		args={
+			"filters": filters,
+			"servers": [woocommerce_server],
+			"page_length": len(woocommerce_ids),
+			"as_doc": True,
+		}
+	)
+
+
+def is_modified_since_last_sync(date_modified: str, last_sync_hash) -> bool:
+	"""
+	Check if a WooCommerce Order's modification date differs from the one it was last synchronised at
+	"""
+	return not last_sync_hash or get_datetime(date_modified) != get_datetime(last_sync_hash)
+
+
+def is_awaiting_payment_entry(sales_order) -> bool:
+	"""
+	Check if a submitted Sales Order still needs a Payment Entry to be created automatically
+	"""
+	return bool(
+		sales_order.docstatus == 1
+		and not sales_order.woocommerce_payment_entry
+		and not sales_order.custom_attempted_woocommerce_auto_payment_entry
+	)
 
 
 def rename_address(address, customer):
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+import frappe
+import requests
+from frappe.tests.utils import FrappeTestCase
+
+from woocommerce_fusion.exceptions import CircuitBreakerOpenError
+from woocommerce_fusion.tasks.circuit_breaker import (
+	CIRCUIT_CLOSED,
+	CIRCUIT_RECOVERING,
+	WC_CIRCUIT_OPEN_KEY,
+	allow_request,
+	is_circuit_open,
+	record_result,
+)
+from woocommerce_fusion.tasks.utils import APIWithPooledSession
+
+
+class TestCircuitBreaker(FrappeTestCase):
+	def setUp(self):
+		self.url = f"https://{frappe.generate_hash(length=8)}.example.com"
+
+	def test_circuit_opens_after_consecutive_failures_and_probes_when_half_open(self):
+		for _ in range(3):
+			state = allow_request(self.url, failure_threshold=3, probe_timeout=10)
+			record_result(self.url, state, False, failure_threshold=3)
+
+		# Requests fail fast while the circuit is open
+		self.assertTrue(is_circuit_open(self.url))
+		with self.assertRaises(CircuitBreakerOpenError):
+			allow_request(self.url, failure_threshold=3, probe_timeout=10)
+
+		# Once the cooldown period has passed, a single probe request is let through
+		frappe.cache().delete_value(f"{WC_CIRCUIT_OPEN_KEY}|{self.url}")
+		self.assertFalse(is_circuit_open(self.url))
+		state = allow_request(self.url, failure_threshold=3, probe_timeout=10)
+		self.assertEqual(state, CIRCUIT_RECOVERING)
+		with self.assertRaises(CircuitBreakerOpenError):
+			allow_request(self.url, failure_threshold=3, probe_timeout=10)
+
+		# A successful probe closes the circuit
+		record_result(self.url, state, True, failure_threshold=3)
+		self.assertEqual(allow_request(self.url, failure_threshold=3, probe_timeout=10), CIRCUIT_CLOSED)
+
+	def test_success_resets_consecutive_failures(self):
+		for success in (False, False, True, False, False):
+			state = allow_request(self.url, failure_threshold=3, probe_timeout=10)
+			record_result(self.url, state, success, failure_threshold=3)
+
+		self.assertFalse(is_circuit_open(self.url))
+
+	def test_circuit_breaker_is_disabled_without_threshold(self):
+		for _ in range(5):
+			state = allow_request(self.url, failure_threshold=0, probe_timeout=10)
+			record_result(self.url, state, False, failure_threshold=0)
+
+		self.assertFalse(is_circuit_open(self.url))
+
+	@patch("woocommerce_fusion.tasks.utils.wait_for_rate_limit")
+	@patch("woocommerce_fusion.tasks.utils.get_session")
+	def test_api_fails_fast_after_connection_errors(self, mock_get_session, mock_wait):
+		mock_get_session.return_value.request.side_effect = requests.exceptions.ConnectTimeout()
+		api = APIWithPooledSession(
+			url=self.url, consumer_key="foo", consumer_secret="bar", failure_threshold=2, cooldown=30
+		)
+
+		for _ in range(2):
+			with self.assertRaises(requests.exceptions.ConnectTimeout):
+				api.get("orders")
+		with self.assertRaises(CircuitBreakerOpenError):
+			api.get("orders")
+
+		self.assertEqual(mock_get_session.return_value.request.call_count, 2)
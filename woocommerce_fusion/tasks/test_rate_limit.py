@@ -0,0 +1,101 @@
+from unittest.mock import Mock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from woocommerce_fusion.tasks.rate_limit import (
+	get_retry_after,
+	get_retry_delay,
+	pause_requests,
+	wait_for_rate_limit,
+)
+from woocommerce_fusion.tasks.utils import APIWithPooledSession
+
+
+def get_response(status_code, headers=None):
+	response = Mock()
+	response.status_code = status_code
+	response.headers = headers or {}
+	return response
+
+
+@patch("woocommerce_fusion.tasks.rate_limit.sleep")
+class TestRateLimit(FrappeTestCase):
+	def setUp(self):
+		self.url = f"https://{frappe.generate_hash(length=8)}.example.com"
+
+	def test_requests_wait_when_bucket_is_empty(self, mock_sleep):
+		wait_for_rate_limit(self.url, rate_limit=1, burst=2)
+		wait_for_rate_limit(self.url, rate_limit=1, burst=2)
+		mock_sleep.assert_not_called()
+
+		wait_for_rate_limit(self.url, rate_limit=1, burst=2)
+		mock_sleep.assert_called_once()
+		self.assertAlmostEqual(mock_sleep.call_args[0][0], 1, delta=0.2)
+
+	def test_requests_are_not_limited_without_rate_limit(self, mock_sleep):
+		for _ in range(20):
+			wait_for_rate_limit(self.url)
+		mock_sleep.assert_not_called()
+
+	def test_requests_wait_while_paused(self, mock_sleep):
+		pause_requests(self.url, 5)
+		wait_for_rate_limit(self.url)
+		self.assertAlmostEqual(mock_sleep.call_args[0][0], 5, delta=0.5)
+
+	def test_get_retry_after(self, mock_sleep):
+		self.assertEqual(get_retry_after(get_response(429, {"Retry-After": "3"})), 3)
+		self.assertIsNone(get_retry_after(get_response(429)))
+		self.assertEqual(
+			get_retry_after(get_response(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0
+		)
+
+	def test_get_retry_delay(self, mock_sleep):
+		self.assertEqual(get_retry_delay(0, retry_after=3), 3)
+		self.assertEqual(get_retry_delay(0, retry_after=600), 60)
+		for attempt in range(5):
+			self.assertLessEqual(get_retry_delay(attempt), 0.5 * 2**attempt)
+
+
+@patch("woocommerce_fusion.tasks.utils.sleep")
+@patch("woocommerce_fusion.tasks.utils.wait_for_rate_limit")
+@patch("woocommerce_fusion.tasks.utils.get_session")
+class TestAPIRetries(FrappeTestCase):
+	def get_api(self, max_retries=3):
+		return APIWithPooledSession(
+			url="https://woo1.example.com",
+			consumer_key="foo",
+			consumer_secret="bar",
+			max_retries=max_retries,
+			rate_limit=5,
+			failure_threshold=0,
+		)
+
+	@patch("woocommerce_fusion.tasks.utils.pause_requests")
+	def test_request_is_retried_after_retry_after(
+		self, mock_pause_requests, mock_get_session, mock_wait, mock_sleep
+	):
+		mock_get_session.return_value.request.side_effect = [
+			get_response(429, {"Retry-After": "2"}),
+			get_response(200),
+		]
+
+		response = self.get_api().post("orders", {"status": "completed"})
+
+		self.assertEqual(response.status_code, 200)
+		mock_pause_requests.assert_called_once_with("https://woo1.example.com", 2)
+		mock_sleep.assert_called_once_with(2)
+		self.assertEqual(mock_wait.call_count, 2)
+		mock_wait.assert_called_with("https://woo1.example.com", 5, 10)
+
+	def test_gateway_errors_are_only_retried_for_idempotent_methods(
+		self, mock_get_session, mock_wait, mock_sleep
+	):
+		mock_get_session.return_value.request.return_value = get_response(503)
+
+		self.assertEqual(self.get_api().post("orders", {}).status_code, 503)
+		self.assertEqual(mock_get_session.return_value.request.call_count, 1)
+
+		self.assertEqual(self.get_api(max_retries=2).get("orders").status_code, 503)
+		self.assertEqual(mock_get_session.return_value.request.call_count, 4)
+		self.assertEqual(mock_sleep.call_count, 2)
@@ -1,15 +1,44 @@
-from unittest.mock import MagicMock, Mock, call, patch
+from unittest.mock import MagicMock, Mock, patch
 
 import frappe
 from frappe import _dict
 from frappe.tests.utils import FrappeTestCase
 
 from woocommerce_fusion.tasks.stock_update import (
+	get_last_stock_quantities,
+	set_last_stock_quantities,
 	update_stock_levels_for_all_enabled_items_in_background,
+	update_stock_levels_for_queued_items,
+	update_stock_levels_for_woocommerce_item,
+	update_stock_levels_for_woocommerce_server,
 	update_stock_levels_on_woocommerce_site,
 )
 
 
+def get_batch_api(error_ids=()):
+	"""
+	Returns a mock WooCommerce API, that returns an update result for every posted row of a batch
+	request, or an error for the given WooCommerce IDs
+	"""
+
+	def post(endpoint, data):
+		response = Mock()
+		response.status_code = 200
+		response.json.return_value = {
+			"update": [
+				{"id": 0, "error": {"code": "woocommerce_rest_product_invalid_id", "message": "Invalid ID."}}
+				if row["id"] in error_ids
+				else {"id": int(row["id"])}
+				for row in data["update"]
+			]
+		}
+		return response
+
+	wc_api = MagicMock()
+	wc_api.api.post.side_effect = post
+	return wc_api
+
+
 class TestWooCommerceStockSync(FrappeTestCase):
 	@classmethod
 	def setUpClass(cls):
@@ -75,34 +104,197 @@ class TestWooCommerceStockSync(FrappeTestCase):
 		self.assertEqual(actual_put_endpoints, expected_put_endpoints)
 		self.assertEqual(actual_put_data, expected_put_data)
 
-	@patch("woocommerce_fusion.tasks.stock_update.frappe.db.get_all")
 	@patch("woocommerce_fusion.tasks.stock_update.frappe.enqueue")
-	def test_update_stock_levels_for_all_enabled_items_in_background(
-		self, mock_enqueue, mock_get_all
+	def test_update_stock_levels_for_all_enabled_items_in_background(self, mock_enqueue):
+		# Call the function
+		update_stock_levels_for_all_enabled_items_in_background()
+
+		# A single bulk job should be enqueued, instead of one job per item
+		mock_enqueue.assert_called_once_with(
+			"woocommerce_fusion.tasks.stock_update.update_stock_levels_for_all_enabled_items",
+			queue="long",
+			timeout=3600,
+		)
+
+	@patch("woocommerce_fusion.tasks.stock_update.get_last_stock_quantities", return_value={})
+	@patch("woocommerce_fusion.tasks.stock_update.set_last_stock_quantities")
+	@patch("woocommerce_fusion.tasks.stock_update.frappe.cache")
+	@patch("woocommerce_fusion.tasks.stock_update.get_stock_levels_for_woocommerce_server")
+	def test_update_stock_levels_for_woocommerce_server_posts_batches(
+		self,
+		mock_get_stock_levels,
+		mock_cache,
+		mock_set_last_stock_quantities,
+		mock_get_last_stock_quantities,
 	):
-		# Set up mock return values
-		mock_get_all.side_effect = [
-			[_dict({"name": f"Item-1-{x}"}) for x in range(500)],  # First page of results
-			[_dict({"name": f"Item-2-{x}"}) for x in range(500)],  # Second page of results
-			[],  # No more results, loop should exit
+		# Set up 150 items with stock, with no previous checkpoint
+		mock_cache.return_value.get_value.return_value = None
+		mock_get_stock_levels.return_value = [
+			_dict(
+				item_woocommerce_server=f"IWS-{x:03}",
+				item_code=f"Item-{x:03}",
+				woocommerce_id=str(x),
+				stock_quantity=x + 0.5,
+			)
+			for x in range(150)
 		]
 
-		# Call the function
-		update_stock_levels_for_all_enabled_items_in_background()
+		# Mock out calls to WooCommerce API's
+		wc_api = get_batch_api()
+
+		# Call function under test
+		wc_server = _dict(name="woo1.example.com")
+		update_stock_levels_for_woocommerce_server(wc_server, wc_api)
+
+		# Assert that two batch requests were made, with floored stock quantities
+		self.assertEqual(wc_api.api.post.call_count, 2)
+		first_call, second_call = wc_api.api.post.call_args_list
+		self.assertEqual(first_call.args[0], "products/batch")
+		self.assertEqual(len(first_call.kwargs["data"]["update"]), 100)
+		self.assertEqual(len(second_call.kwargs["data"]["update"]), 50)
+		self.assertEqual(first_call.kwargs["data"]["update"][3], {"id": "3", "stock_quantity": 3})
+
+		# Assert that progress was checkpointed after every batch, and cleared at the end
+		checkpoints = [c.args[1] for c in mock_cache.return_value.set_value.call_args_list]
+		self.assertEqual(checkpoints, ["Item-099", "Item-149"])
+		mock_cache.return_value.delete_value.assert_called_once()
+
+		# Assert that the posted stock levels were saved
+		self.assertEqual(mock_set_last_stock_quantities.call_count, 2)
+		self.assertEqual(mock_set_last_stock_quantities.call_args.args[0], "woo1.example.com")
+		self.assertEqual(mock_set_last_stock_quantities.call_args.args[1]["149"], 149)
+
+	@patch("woocommerce_fusion.tasks.stock_update.get_last_stock_quantities")
+	@patch("woocommerce_fusion.tasks.stock_update.set_last_stock_quantities")
+	@patch("woocommerce_fusion.tasks.stock_update.frappe.cache")
+	@patch("woocommerce_fusion.tasks.stock_update.get_stock_levels_for_woocommerce_server")
+	def test_update_stock_levels_for_woocommerce_server_skips_unchanged_stock_levels(
+		self,
+		mock_get_stock_levels,
+		mock_cache,
+		mock_set_last_stock_quantities,
+		mock_get_last_stock_quantities,
+	):
+		# Set up one item with an unchanged, and one with a changed stock level
+		mock_cache.return_value.get_value.return_value = None
+		mock_get_stock_levels.return_value = [
+			_dict(
+				item_woocommerce_server="IWS-1",
+				item_code="Item-1",
+				woocommerce_id="1",
+				stock_quantity=5,
+			),
+			_dict(
+				item_woocommerce_server="IWS-2",
+				item_code="Item-2",
+				woocommerce_id="2",
+				stock_quantity=7.9,
+			),
+		]
+		mock_get_last_stock_quantities.return_value = {"1": "5", "2": "5"}
+		wc_api = get_batch_api()
+
+		# Only the changed stock level should be posted
+		update_stock_levels_for_woocommerce_server(_dict(name="woo1.example.com"), wc_api)
+		self.assertEqual(
+			wc_api.api.post.call_args.kwargs["data"], {"update": [{"id": "2", "stock_quantity": 7}]}
+		)
+		mock_set_last_stock_quantities.assert_called_once_with("woo1.example.com", {"2": 7})
+		mock_get_last_stock_quantities.assert_called_once_with("woo1.example.com", ["1", "2"])
 
-		# Assertions to check if get_all was called correctly
-		self.assertEqual(mock_get_all.call_count, 3)
-		expected_calls = [
-			call(doctype="Item", filters={"disabled": 0}, fields=["name"], start=0, page_length=500),
-			call(doctype="Item", filters={"disabled": 0}, fields=["name"], start=500, page_length=500),
-			call(doctype="Item", filters={"disabled": 0}, fields=["name"], start=1000, page_length=500),
+		# Both stock levels should be posted when forced
+		mock_get_last_stock_quantities.return_value = {"1": "5", "2": "7"}
+		update_stock_levels_for_woocommerce_server(_dict(name="woo1.example.com"), wc_api, force=True)
+		self.assertEqual(len(wc_api.api.post.call_args.kwargs["data"]["update"]), 2)
+
+	@patch("woocommerce_fusion.tasks.stock_update.get_last_stock_quantities", return_value={})
+	@patch("woocommerce_fusion.tasks.stock_update.frappe.log_error")
+	@patch("woocommerce_fusion.tasks.stock_update.set_last_stock_quantities")
+	@patch("woocommerce_fusion.tasks.stock_update.frappe.cache")
+	@patch("woocommerce_fusion.tasks.stock_update.get_stock_levels_for_woocommerce_server")
+	def test_update_stock_levels_for_woocommerce_server_logs_failed_rows(
+		self,
+		mock_get_stock_levels,
+		mock_cache,
+		mock_set_last_stock_quantities,
+		mock_log_error,
+		mock_get_last_stock_quantities,
+	):
+		# Set up two items, of which WooCommerce fails to update the second
+		mock_cache.return_value.get_value.return_value = None
+		mock_get_stock_levels.return_value = [
+			_dict(
+				item_woocommerce_server=f"IWS-{x}",
+				item_code=f"Item-{x}",
+				woocommerce_id=str(x),
+				stock_quantity=x,
+			)
+			for x in (1, 2)
 		]
-		mock_get_all.assert_has_calls(expected_calls, any_order=True)
-
-		# Assertions to check if enqueue was called correctly
-		# This assumes we have 1000 items, based on the pagination logic above.
-		self.assertEqual(mock_enqueue.call_count, 1000)
-		mock_enqueue.assert_called_with(
-			"woocommerce_fusion.tasks.stock_update.update_stock_levels_on_woocommerce_site",
-			item_code="Item-2-499",  # Here we'd check for the last `item_code` being passed.
+		wc_api = get_batch_api(error_ids=("2",))
+
+		update_stock_levels_for_woocommerce_server(_dict(name="woo1.example.com"), wc_api)
+
+		# Only the stock level that was updated should be saved, and the failed one logged
+		mock_set_last_stock_quantities.assert_called_once_with("woo1.example.com", {"1": 1})
+		mock_log_error.assert_called_once()
+		self.assertIn("Item-2 (WooCommerce ID 2): Invalid ID.", mock_log_error.call_args.args[1])
+
+	def test_last_stock_quantities_are_saved_per_woocommerce_server(self):
+		woocommerce_server = f"{frappe.generate_hash(length=8)}.example.com"
+		set_last_stock_quantities(woocommerce_server, {"1": 5, 2: 7})
+
+		self.assertEqual(
+			get_last_stock_quantities(woocommerce_server, ["1", 2, "3"]), {"1": "5", "2": "7"}
+		)
+		self.assertEqual(get_last_stock_quantities("other.example.com", ["1"]), {})
+
+	@patch("woocommerce_fusion.tasks.stock_update.frappe")
+	def test_update_stock_levels_for_woocommerce_item_queues_items_after_commit(self, mock_frappe):
+		mock_frappe.flags.in_test = False
+		mock_frappe.get_list.return_value = [_dict(name="woo1.example.com")]
+
+		# Nothing is queued for a transaction without items
+		update_stock_levels_for_woocommerce_item(_dict(doctype="Stock Entry", items=[]), "on_submit")
+		mock_frappe.db.after_commit.add.assert_not_called()
+
+		# The item codes are queued once the transaction is committed
+		doc = _dict(doctype="Stock Entry", items=[_dict(item_code="Item-1"), _dict(item_code="Item-2")])
+		update_stock_levels_for_woocommerce_item(doc, "on_submit")
+		mock_frappe.db.after_commit.add.assert_called_once()
+		mock_frappe.cache.return_value.sadd.assert_not_called()
+
+		mock_frappe.db.after_commit.add.call_args.args[0]()
+		self.assertEqual(
+			sorted(mock_frappe.cache.return_value.sadd.call_args.args[1:]), ["Item-1", "Item-2"]
 		)
+
+	@patch("woocommerce_fusion.tasks.stock_update.update_stock_levels_for_all_enabled_items")
+	@patch("woocommerce_fusion.tasks.stock_update.frappe.cache")
+	def test_update_stock_levels_for_queued_items(self, mock_cache, mock_update_stock_levels):
+		# Set up two queued items
+		mock_cache.return_value.smembers.return_value = {b"Item-1", b"Item-2"}
+		mock_update_stock_levels.return_value = []
+
+		# Call function under test
+		update_stock_levels_for_queued_items()
+
+		# Assert that the queued items are posted in a single run, and removed from the queue
+		mock_update_stock_levels.assert_called_once()
+		self.assertEqual(
+			sorted(mock_update_stock_levels.call_args.kwargs["item_codes"]), ["Item-1", "Item-2"]
+		)
+		self.assertEqual(sorted(mock_cache.return_value.srem.call_args.args[1:]), ["Item-1", "Item-2"])
+		mock_cache.return_value.sadd.assert_not_called()
+
+		# Assert that nothing is posted if the queue is empty
+		mock_cache.return_value.smembers.return_value = set()
+		update_stock_levels_for_queued_items()
+		mock_update_stock_levels.assert_called_once()
+
+		# Assert that the items are queued again if a server was skipped by its circuit breaker
+		mock_cache.return_value.smembers.return_value = {b"Item-1"}
+		mock_update_stock_levels.return_value = ["woo1.example.com"]
+		update_stock_levels_for_queued_items()
+		mock_cache.return_value.sadd.assert_called_once()
+		self.assertEqual(mock_cache.return_value.sadd.call_args.args[1:], ("Item-1",))
@@ -1,9 +1,15 @@
+from collections import OrderedDict
 from unittest.mock import MagicMock, Mock, call, patch
 
 import frappe
 from frappe.tests.utils import FrappeTestCase
 
-from woocommerce_fusion.tasks.sync_items import ERPNextItemToSync, SynchroniseItem
+from woocommerce_fusion.tasks.sync_items import (
+	ERPNextItemToSync,
+	SynchroniseItem,
+	disable_items_linked_to_woocommerce_product,
+	get_items_linked_to_woocommerce_products,
+)
 from woocommerce_fusion.woocommerce.woocommerce_api import (
 	generate_woocommerce_record_name_from_domain_and_id,
 )
@@ -379,3 +385,99 @@ class TestWooCommerceSync(FrappeTestCase):
 
 		self.assertEqual(wc_product_mock.type, "variable")
 		item_mock.item.save.assert_called_once()
+
+
+@patch("woocommerce_fusion.tasks.sync_items._linked_items", OrderedDict())
+@patch("woocommerce_fusion.tasks.sync_items.frappe.qb")
+class TestLinkedItems(FrappeTestCase):
+	def test_linked_items_are_looked_up_once_and_cached(self, mock_qb):
+		mock_query = mock_qb.from_.return_value.join.return_value.on.return_value
+		mock_run = mock_query.where.return_value.select.return_value.run
+		mock_run.return_value = [
+			frappe._dict(woocommerce_id="1", name="ITEM-1", item_name="T-Shirt"),
+			frappe._dict(woocommerce_id="1", name="ITEM-1-DUPLICATE", item_name="T-Shirt"),
+		]
+
+		items = get_items_linked_to_woocommerce_products("site1.example.com", [1, 2])
+		self.assertEqual(items, {"1": {"name": "ITEM-1", "item_name": "T-Shirt"}})
+		mock_run.assert_called_once()
+
+		# Cached Items are not looked up again, but products without an Item are
+		mock_run.return_value = []
+		items = get_items_linked_to_woocommerce_products("site1.example.com", [1, 2])
+		self.assertEqual(items["1"].name, "ITEM-1")
+		self.assertEqual(mock_run.call_count, 2)
+
+		# The cache is per WooCommerce Server
+		self.assertEqual(get_items_linked_to_woocommerce_products("site2.example.com", [1]), {})
+
+
+@patch.object(SynchroniseItem, "set_sync_hash")
+@patch.object(SynchroniseItem, "update_woocommerce_product")
+@patch.object(SynchroniseItem, "update_item")
+@patch.object(SynchroniseItem, "create_item")
+class TestDeletedProducts(FrappeTestCase):
+	def setUp(self):
+		self.woocommerce_server = "site1.example.com"
+		self.woocommerce_id = frappe.generate_hash(length=8)
+		item = frappe.get_doc(
+			{
+				"doctype": "Item",
+				"item_code": f"ITEM-{self.woocommerce_id}",
+				"item_group": "All Item Groups",
+				"stock_uom": "Nos",
+				"woocommerce_servers": [
+					{"woocommerce_server": self.woocommerce_server, "woocommerce_id": self.woocommerce_id}
+				],
+			}
+		)
+		item.flags.ignore_links = True
+		item.flags.created_by_sync = True
+		self.item = item.insert()
+
+	def sync_product(self, status: str) -> SynchroniseItem:
+		wc_product = frappe.get_doc({"doctype": "WooCommerce Product"})
+		wc_product.woocommerce_server = self.woocommerce_server
+		wc_product.woocommerce_id = self.woocommerce_id
+		wc_product.status = status
+		wc_product.woocommerce_date_modified = "2099-01-01"
+		sync = SynchroniseItem(servers=Mock(), woocommerce_product=wc_product)
+		sync.get_corresponding_item_or_product()
+		sync.sync_wc_product_with_erpnext_item()
+		return sync
+
+	def get_link_enabled(self) -> int:
+		return frappe.db.get_value(
+			"Item WooCommerce Server", {"parent": self.item.name}, "enabled", order_by=None
+		)
+
+	def test_restored_and_updated_product_is_linked_to_its_item_again(
+		self, mock_create_item, mock_update_item, mock_update_woocommerce_product, mock_set_sync_hash
+	):
+		# A deleted product disables the link to its Item
+		disable_items_linked_to_woocommerce_product(self.woocommerce_server, self.woocommerce_id)
+		self.assertEqual(self.get_link_enabled(), 0)
+
+		# A restored product is synchronised to the same Item, and the link is enabled again
+		sync = self.sync_product("publish")
+		mock_create_item.assert_not_called()
+		self.assertEqual(sync.item.item.name, self.item.name)
+		self.assertEqual(sync.item.item_woocommerce_server.enabled, 1)
+		self.assertEqual(self.get_link_enabled(), 1)
+		mock_update_item.assert_called_once()
+
+		# A later update is synchronised to the same Item
+		sync = self.sync_product("publish")
+		mock_create_item.assert_not_called()
+		self.assertEqual(sync.item.item.name, self.item.name)
+		self.assertEqual(mock_update_item.call_count, 2)
+
+	def test_trashed_product_does_not_enable_the_link_again(
+		self, mock_create_item, mock_update_item, mock_update_woocommerce_product, mock_set_sync_hash
+	):
+		disable_items_linked_to_woocommerce_product(self.woocommerce_server, self.woocommerce_id)
+
+		sync = self.sync_product("trash")
+		mock_create_item.assert_not_called()
+		self.assertEqual(sync.item.item.name, self.item.name)
+		self.assertEqual(self.get_link_enabled(), 0)
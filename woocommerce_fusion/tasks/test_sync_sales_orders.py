@@ -5,7 +5,15 @@ import frappe
 from erpnext import get_default_company
 from frappe.tests.utils import FrappeTestCase
 
-from woocommerce_fusion.tasks.sync_sales_orders import SynchroniseSalesOrder
+from woocommerce_fusion.tasks.sync_sales_orders import (
+	SynchroniseSalesOrder,
+	get_wc_order_ids_requiring_sync,
+	iterate_wc_orders_in_chunks,
+	sync_woocommerce_orders,
+)
+from woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order import (
+	WooCommerceOrder,
+)
 from woocommerce_fusion.woocommerce.woocommerce_api import (
 	generate_woocommerce_record_name_from_domain_and_id,
 )
@@ -101,6 +109,148 @@ class TestWooCommerceSync(FrappeTestCase):
 		# Assert that the sales order need to be updated
 		mock_update_woocommerce_order.assert_called_once_with(wc_order, sales_order)
 
+	@patch.object(WooCommerceOrder, "get_page_of_records")
+	def test_iterate_wc_orders_in_chunks_yields_one_page_at_a_time(
+		self, mock_get_page_of_records, mock_get_wc_servers
+	):
+		"""
+		Test that WooCommerce Orders are yielded page by page, and that pages are only requested
+		when the previous page has been consumed, using the cursor returned with the previous page
+		"""
+		mock_get_page_of_records.side_effect = [
+			([Mock()] * 100, "cursor1"),
+			([Mock()] * 100, "cursor2"),
+			([Mock()] * 3, None),
+		]
+
+		chunks = iterate_wc_orders_in_chunks(date_time_from="2023-01-01")
+		first_chunk = next(chunks)
+		self.assertEqual(len(first_chunk), 100)
+		self.assertEqual(mock_get_page_of_records.call_count, 1)
+
+		remaining_chunks = list(chunks)
+		self.assertEqual([len(chunk) for chunk in remaining_chunks], [100, 3])
+		self.assertEqual(
+			[call.kwargs["args"]["cursor"] for call in mock_get_page_of_records.call_args_list],
+			[None, "cursor1", "cursor2"],
+		)
+
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.frappe.get_all")
+	def test_get_wc_order_ids_requiring_sync_only_returns_changed_orders(
+		self, mock_get_all, mock_get_wc_servers
+	):
+		"""
+		Test that only WooCommerce Orders that are new, that changed since their last sync, or whose
+		Sales Order is awaiting a Payment Entry are synchronised
+		"""
+		woocommerce_server = "site1.example.com"
+		wc_orders = [
+			frappe._dict(
+				id=wc_id,
+				woocommerce_server=woocommerce_server,
+				woocommerce_date_modified="2023-06-01T10:00:00",
+			)
+			for wc_id in range(1, 5)
+		]
+		synced_sales_order = dict(
+			woocommerce_server=woocommerce_server,
+			docstatus=0,
+			woocommerce_payment_entry=None,
+			custom_attempted_woocommerce_auto_payment_entry=0,
+			custom_woocommerce_last_sync_hash="2023-06-01 10:00:00",
+		)
+		mock_get_all.return_value = [
+			# Unchanged
+			frappe._dict(synced_sales_order, woocommerce_id="1"),
+			# Changed since last sync
+			frappe._dict(
+				synced_sales_order, woocommerce_id="2", custom_woocommerce_last_sync_hash="2023-05-01 10:00:00"
+			),
+			# Unchanged, but awaiting a Payment Entry
+			frappe._dict(synced_sales_order, woocommerce_id="3", docstatus=1),
+			# No Sales Order for WooCommerce Order 4
+		]
+
+		wc_order_ids_to_sync = get_wc_order_ids_requiring_sync(wc_orders)
+
+		self.assertEqual(wc_order_ids_to_sync, {woocommerce_server: ["2", "3", "4"]})
+		mock_get_all.assert_called_once()
+
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.get_record_lock")
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.frappe.log_error")
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.frappe.db")
+	@patch.object(SynchroniseSalesOrder, "get_wc_servers", return_value=[])
+	@patch.object(SynchroniseSalesOrder, "run")
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.get_sales_orders_for_wc_orders")
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.get_wc_orders_by_id")
+	def test_sync_woocommerce_orders_reports_result_per_order(
+		self,
+		mock_get_wc_orders_by_id,
+		mock_get_sales_orders,
+		mock_run,
+		mock_get_servers,
+		mock_db,
+		mock_log_error,
+		mock_get_record_lock,
+		mock_get_wc_servers,
+	):
+		"""
+		Test that a chunk of WooCommerce Orders is synchronised in one job, and that a failing order
+		does not stop the others
+		"""
+		woocommerce_server = "site1.example.com"
+		mock_get_wc_orders_by_id.return_value = [
+			frappe._dict(id=wc_id, name=f"site1.example.com~{wc_id}", woocommerce_server=woocommerce_server)
+			for wc_id in (1, 2)
+		]
+		mock_get_sales_orders.return_value = {
+			(woocommerce_server, "1"): frappe._dict(name="SO-0001"),
+		}
+		mock_run.side_effect = [None, ValueError("Missing item")]
+
+		results = sync_woocommerce_orders(woocommerce_server, ["1", "2", "3"])
+
+		self.assertEqual(results["succeeded"], ["1"])
+		self.assertEqual(results["failed"]["2"], "Missing item")
+		self.assertIn("3", results["failed"])
+		mock_get_wc_orders_by_id.assert_called_once_with(
+			woocommerce_server, ["1", "2", "3"], status=None
+		)
+		mock_get_sales_orders.assert_called_once()
+		mock_get_servers.assert_called_once()
+		self.assertEqual(mock_db.commit.call_count, 2)
+		mock_db.rollback.assert_called_once()
+		mock_log_error.assert_called_once()
+
+		# Every order is synchronised while holding the same lock as webhooks
+		self.assertEqual(
+			[c.args for c in mock_get_record_lock.call_args_list],
+			[(woocommerce_server, "orders", 1), (woocommerce_server, "orders", 2)],
+		)
+
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.frappe.get_doc")
+	@patch("woocommerce_fusion.tasks.sync_sales_orders.frappe.get_all")
+	def test_get_erpnext_sales_order_uses_pre_resolved_sales_order(
+		self, mock_get_all, mock_get_doc, mock_get_wc_servers
+	):
+		"""
+		Test that a Sales Order that was looked up for a whole page of WooCommerce Orders is not
+		looked up again
+		"""
+		wc_order = frappe._dict(id=1, woocommerce_server="site1.example.com")
+
+		sync = SynchroniseSalesOrder(
+			woocommerce_order=wc_order, sales_order_name="SO-0001", sales_order_resolved=True
+		)
+		sync.get_erpnext_sales_order()
+		mock_get_doc.assert_called_once_with("Sales Order", "SO-0001")
+
+		sync = SynchroniseSalesOrder(woocommerce_order=wc_order, sales_order_resolved=True)
+		sync.get_erpnext_sales_order()
+		self.assertIsNone(sync.sales_order)
+
+		mock_get_all.assert_not_called()
+
 	@patch.object(SynchroniseSalesOrder, "create_sales_order")
 	def test_sync_sales_order_should_create_so_if_no_so(
 		self, mock_create_sales_order, mock_get_wc_servers
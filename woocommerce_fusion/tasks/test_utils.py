@@ -1,9 +1,19 @@
 import unittest
 from unittest.mock import Mock, patch
 
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
 from woocommerce_fusion.tasks.utils import (  # Adjust the import according to your project structure
+	REQUEST_LOG_BUFFER_KEY,
+	APIWithPooledSession,
+	APIWithRequestLogging,
+	buffer_woocommerce_request_log,
+	clear_sessions,
+	flush_woocommerce_request_logs,
+	get_session,
+	get_woocommerce_request_log_entry,
+	limit_body_size,
 	log_woocommerce_request,
 )
 
@@ -37,3 +47,148 @@ class TestLogWooCommerceRequest(FrappeTestCase):
 	# @patch('woocommerce_fusion.tasks.utils.frappe')
 	# def test_no_response(self, mock_frappe):
 	# 	# Test the function when res is None
+
+
+class TestBufferedRequestLogs(FrappeTestCase):
+	def setUp(self):
+		frappe.cache().delete_value(REQUEST_LOG_BUFFER_KEY)
+
+	@patch("woocommerce_fusion.tasks.utils.frappe.enqueue")
+	def test_buffered_request_logs_are_bulk_inserted_on_flush(self, mock_enqueue):
+		# Setup
+		mock_response = Mock()
+		mock_response.status_code = 200
+		mock_response.text = "Success response text"
+		mock_response.elapsed.total_seconds.return_value = 0.5
+		endpoint = f"orders/{frappe.generate_hash(length=8)}"
+
+		# Execute
+		for _ in range(3):
+			buffer_woocommerce_request_log(
+				get_woocommerce_request_log_entry(
+					"http://example.com", endpoint, "GET", {"param": "value"}, None, mock_response
+				)
+			)
+
+		# Assert that nothing is logged until the buffer is flushed
+		mock_enqueue.assert_not_called()
+		self.assertEqual(frappe.db.count("WooCommerce Request Log", {"endpoint": endpoint}), 0)
+
+		flush_woocommerce_request_logs()
+
+		logs = frappe.get_all(
+			"WooCommerce Request Log",
+			filters={"endpoint": endpoint},
+			fields=["status", "params", "time_elapsed"],
+		)
+		self.assertEqual(len(logs), 3)
+		self.assertEqual(logs[0].status, "Success")
+		self.assertEqual(logs[0].time_elapsed, 0.5)
+		self.assertEqual(frappe.cache().llen(REQUEST_LOG_BUFFER_KEY), 0)
+
+	@patch("woocommerce_fusion.tasks.utils.insert_woocommerce_request_logs")
+	def test_buffered_request_logs_are_kept_if_the_flush_fails(self, mock_insert):
+		buffer_woocommerce_request_log(
+			get_woocommerce_request_log_entry("http://example.com", "orders/1", "GET", None, None)
+		)
+		mock_insert.side_effect = Exception("Lost connection to the database")
+
+		# Assert that the entry stays in the buffer for the next flush
+		with self.assertRaises(Exception):
+			flush_woocommerce_request_logs()
+		self.assertEqual(frappe.cache().llen(REQUEST_LOG_BUFFER_KEY), 1)
+
+
+class TestRequestLogPolicy(FrappeTestCase):
+	def setUp(self):
+		self.api = APIWithRequestLogging(
+			url="https://example.com", consumer_key="key", consumer_secret="secret"
+		)
+		self.response = Mock()
+		self.response.status_code = 200
+		self.response.text = "x" * 50
+		self.response.elapsed.total_seconds.return_value = 0.1
+
+		patcher = patch("woocommerce_fusion.tasks.utils.record_api_metric")
+		self.mock_record_api_metric = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	@patch("woocommerce_fusion.tasks.utils.random.random", return_value=0.5)
+	@patch("woocommerce_fusion.tasks.utils.buffer_woocommerce_request_log")
+	@patch("woocommerce_fusion.tasks.utils.get_request_log_policy")
+	def test_successful_requests_are_sampled_and_errors_are_always_logged(
+		self, mock_get_policy, mock_buffer, mock_random
+	):
+		mock_get_policy.return_value = frappe._dict(
+			sample_rate=10, max_body_size=0, large_body_handling="Truncate", debug_mode=0
+		)
+
+		self.api.log_request("GET", "orders", None, None, self.response)
+		mock_buffer.assert_not_called()
+
+		self.api.log_request("GET", "orders", None, None, None, error="Traceback")
+		mock_buffer.assert_called_once()
+		self.assertEqual(self.mock_record_api_metric.call_count, 2)
+		entry = mock_buffer.call_args[0][0]
+		self.assertEqual(entry["status"], "Error")
+		self.assertIsNone(entry["traceback"])
+
+	@patch("woocommerce_fusion.tasks.utils.buffer_woocommerce_request_log")
+	@patch("woocommerce_fusion.tasks.utils.get_request_log_policy")
+	def test_large_bodies_are_truncated_and_stack_is_captured_in_debug_mode(
+		self, mock_get_policy, mock_buffer
+	):
+		mock_get_policy.return_value = frappe._dict(
+			sample_rate=100, max_body_size=20, large_body_handling="Truncate", debug_mode=1
+		)
+
+		self.api.log_request("GET", "orders", None, None, self.response)
+
+		entry = mock_buffer.call_args[0][0]
+		self.assertTrue(entry["response"].startswith(str(self.response)[:20]))
+		self.assertIn("\n... (truncated,", entry["response"])
+		self.assertIsNotNone(entry["traceback"])
+
+	def test_limit_body_size(self):
+		self.assertEqual(limit_body_size("short", 10), "short")
+		self.assertIsNone(limit_body_size(None, 10))
+		self.assertEqual(limit_body_size("x" * 12, 10), f"{'x' * 10}\n... (truncated, 12 characters)")
+		self.assertTrue(limit_body_size("x" * 12, 10, "Hash").startswith("sha256:"))
+
+
+class TestPooledSessions(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()  # important to call super() methods when extending TestCase.
+
+	def tearDown(self):
+		clear_sessions()
+
+	def test_session_is_reused_for_same_site(self):
+		session = get_session("https://woo1.example.com")
+		self.assertIs(get_session("https://woo1.example.com"), session)
+		self.assertIsNot(get_session("https://woo2.example.com"), session)
+
+	def test_session_is_replaced_when_pool_config_changes(self):
+		session = get_session("https://woo1.example.com", pool_maxsize=10)
+		new_session = get_session("https://woo1.example.com", pool_maxsize=20)
+		self.assertIsNot(new_session, session)
+
+	def test_clear_sessions(self):
+		session = get_session("https://woo1.example.com")
+		clear_sessions("https://woo1.example.com")
+		self.assertIsNot(get_session("https://woo1.example.com"), session)
+
+	@patch("woocommerce_fusion.tasks.utils.get_session")
+	def test_request_uses_pooled_session(self, mock_get_session):
+		api = APIWithPooledSession(
+			url="https://woo1.example.com", consumer_key="foo", consumer_secret="bar", pool_maxsize=5
+		)
+		mock_get_session.return_value.request.return_value.status_code = 200
+		api.get("products", params={"per_page": 1})
+
+		mock_get_session.assert_called_once_with("https://woo1.example.com", pool_maxsize=5, max_retries=3)
+		request_kwargs = mock_get_session.return_value.request.call_args.kwargs
+		self.assertEqual(request_kwargs["method"], "GET")
+		self.assertEqual(request_kwargs["url"], "https://woo1.example.com/wp-json/wc/v3/products")
+		self.assertEqual(request_kwargs["params"], {"per_page": 1})
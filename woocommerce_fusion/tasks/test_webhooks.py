@@ -0,0 +1,127 @@
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from woocommerce_fusion.tasks.webhooks import (
+	flag_sales_orders_of_deleted_woocommerce_order,
+	process_webhook,
+	receive_webhook,
+)
+from woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order import (
+	WooCommerceOrder,
+)
+
+ORDER_PAYLOAD = {
+	"id": 11,
+	"status": "processing",
+	"date_created": "2026-01-01T10:00:00",
+	"date_created_gmt": "2026-01-01T08:00:00",
+	"date_modified": "2026-01-01T10:00:00",
+	"date_modified_gmt": "2026-01-01T08:00:00",
+	"line_items": [{"id": 1, "product_id": 5, "quantity": 2}],
+}
+
+PRODUCT_PAYLOAD = {
+	"id": 5,
+	"name": "T-Shirt",
+	"type": "simple",
+	"date_created": "2026-01-01T10:00:00",
+	"date_created_gmt": "2026-01-01T08:00:00",
+	"date_modified": "2026-01-01T10:00:00",
+	"date_modified_gmt": "2026-01-01T08:00:00",
+}
+
+
+@patch("woocommerce_fusion.tasks.webhooks.frappe.enqueue")
+class TestWebhookInbox(FrappeTestCase):
+	def setUp(self):
+		self.url = f"https://{frappe.generate_hash(length=8)}.example.com/"
+		self.server = self.url[8:-1]
+
+	def test_repeated_delivery_is_ignored(self, mock_enqueue):
+		self.assertTrue(receive_webhook("orders", "created", self.url, ORDER_PAYLOAD, "1"))
+		self.assertFalse(receive_webhook("orders", "created", self.url, ORDER_PAYLOAD, "1"))
+		mock_enqueue.assert_called_once()
+
+	def test_deliveries_for_waiting_record_are_collapsed(self, mock_enqueue):
+		receive_webhook("orders", "created", self.url, ORDER_PAYLOAD, "1")
+		receive_webhook("orders", "updated", self.url, dict(ORDER_PAYLOAD, status="completed"), "2")
+		mock_enqueue.assert_called_once()
+		self.assertEqual(mock_enqueue.call_args.kwargs["resource_id"], 11)
+
+		with patch("woocommerce_fusion.tasks.webhooks.run_sales_order_sync") as mock_sync:
+			process_webhook(**mock_enqueue.call_args.kwargs)
+			process_webhook(**mock_enqueue.call_args.kwargs)
+
+		# Only the latest delivery is processed
+		mock_sync.assert_called_once()
+		woocommerce_order = mock_sync.call_args.kwargs["woocommerce_order"]
+		self.assertEqual(woocommerce_order.status, "completed")
+
+		# Deliveries after the job started are processed by a new job
+		receive_webhook("orders", "updated", self.url, ORDER_PAYLOAD, "3")
+		self.assertEqual(mock_enqueue.call_count, 2)
+
+	@patch("woocommerce_fusion.tasks.webhooks.run_sales_order_sync")
+	def test_order_is_built_from_payload(self, mock_sync, mock_enqueue):
+		receive_webhook("orders", "created", self.url, ORDER_PAYLOAD, "1")
+		process_webhook(**mock_enqueue.call_args.kwargs)
+
+		woocommerce_order = mock_sync.call_args.kwargs["woocommerce_order"]
+		self.assertEqual(woocommerce_order.doctype, "WooCommerce Order")
+		self.assertEqual(woocommerce_order.name, f"{self.server}~11")
+		self.assertEqual(woocommerce_order.woocommerce_server, self.server)
+		self.assertEqual(json.loads(woocommerce_order.line_items)[0]["product_id"], 5)
+
+	@patch.object(WooCommerceOrder, "load_from_db")
+	@patch("woocommerce_fusion.tasks.webhooks.run_sales_order_sync")
+	def test_deleted_order_is_fetched_and_synced(self, mock_sync, mock_load_from_db, mock_enqueue):
+		receive_webhook("orders", "deleted", self.url, {"id": 11}, "1")
+		process_webhook(**mock_enqueue.call_args.kwargs)
+
+		mock_load_from_db.assert_called_once()
+		woocommerce_order = mock_sync.call_args.kwargs["woocommerce_order"]
+		self.assertEqual(woocommerce_order.name, f"{self.server}~11")
+
+	@patch.object(WooCommerceOrder, "load_from_db", side_effect=frappe.DoesNotExistError)
+	@patch("woocommerce_fusion.tasks.webhooks.run_sales_order_sync")
+	@patch("woocommerce_fusion.tasks.webhooks.flag_sales_orders_of_deleted_woocommerce_order")
+	def test_permanently_deleted_order_flags_its_sales_orders(
+		self, mock_flag, mock_sync, mock_load_from_db, mock_enqueue
+	):
+		receive_webhook("orders", "deleted", self.url, {"id": 11}, "1")
+		process_webhook(**mock_enqueue.call_args.kwargs)
+
+		# The order is not synced, and the job succeeds so that it isn't retried
+		mock_sync.assert_not_called()
+		mock_flag.assert_called_once_with(self.server, 11)
+
+	@patch("woocommerce_fusion.tasks.webhooks.frappe.get_doc")
+	@patch("woocommerce_fusion.tasks.webhooks.frappe.get_all", return_value=["SO-0001"])
+	def test_sales_orders_of_deleted_order_are_flagged(self, mock_get_all, mock_get_doc, mock_enqueue):
+		flag_sales_orders_of_deleted_woocommerce_order(self.server, 11)
+
+		self.assertEqual(
+			mock_get_all.call_args.kwargs["filters"],
+			{"woocommerce_server": self.server, "woocommerce_id": "11"},
+		)
+		mock_get_doc.assert_called_once_with("Sales Order", "SO-0001")
+		mock_get_doc.return_value.add_comment.assert_called_once()
+
+	@patch("woocommerce_fusion.tasks.webhooks.run_item_sync")
+	def test_product_is_built_from_payload(self, mock_sync, mock_enqueue):
+		receive_webhook("products", "updated", self.url, PRODUCT_PAYLOAD, "1")
+		process_webhook(**mock_enqueue.call_args.kwargs)
+
+		woocommerce_product = mock_sync.call_args.kwargs["woocommerce_product"]
+		self.assertEqual(woocommerce_product.name, f"{self.server}~5")
+		self.assertEqual(woocommerce_product.woocommerce_name, "T-Shirt")
+
+	@patch("woocommerce_fusion.tasks.webhooks.disable_items_linked_to_woocommerce_product")
+	def test_deleted_product_disables_linked_items(self, mock_disable, mock_enqueue):
+		receive_webhook("products", "deleted", self.url, {"id": 5}, "1")
+		process_webhook(**mock_enqueue.call_args.kwargs)
+
+		mock_disable.assert_called_once_with(woocommerce_server=self.server, woocommerce_id=5)
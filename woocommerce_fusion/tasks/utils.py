@@ -1,11 +1,195 @@
+import hashlib
+import json
+import random
+import threading
 import traceback
+from time import sleep
+from typing import List
+from urllib.parse import urlencode
 
 import frappe
 import requests
+from frappe.utils import cint, flt, now
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 from woocommerce import API
 
+from woocommerce_fusion.tasks.circuit_breaker import (
+	DEFAULT_COOLDOWN,
+	DEFAULT_FAILURE_THRESHOLD,
+	allow_request,
+	record_result,
+)
+from woocommerce_fusion.tasks.rate_limit import (
+	DEFAULT_BURST,
+	get_retry_after,
+	get_retry_delay,
+	pause_requests,
+	should_retry,
+	wait_for_rate_limit,
+)
+from woocommerce_fusion.woocommerce.doctype.woocommerce_api_metric.woocommerce_api_metric import (
+	record_api_metric,
+)
 
-class APIWithRequestLogging(API):
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_TIMEOUT = 40
+REQUEST_LOG_BUFFER_KEY = "woocommerce_request_log_buffer"
+REQUEST_LOG_FLUSH_SIZE = 100
+REQUEST_LOG_FLUSH_LOCK_KEY = "woocommerce_request_log_flush_lock"
+REQUEST_LOG_FLUSH_LOCK_TIMEOUT = 300
+REQUEST_LOG_FIELDS = (
+	"creation",
+	"user",
+	"url",
+	"endpoint",
+	"method",
+	"params",
+	"data",
+	"response",
+	"error",
+	"status",
+	"traceback",
+	"time_elapsed",
+)
+
+# Process-wide pool of HTTP sessions, keyed by WooCommerce site URL
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(
+	url: str, pool_maxsize: int = DEFAULT_POOL_MAXSIZE, max_retries: int = DEFAULT_MAX_RETRIES
+) -> requests.Session:
+	"""
+	Returns a pooled requests.Session for a WooCommerce site.
+
+	The session is shared by all API instances in this process (e.g. across jobs in the same RQ worker),
+	so that TCP connections and TLS handshakes are reused. If the pool configuration changed, the old
+	session is closed and replaced.
+	"""
+	config = (pool_maxsize, max_retries)
+	with _sessions_lock:
+		if url in _sessions:
+			session_config, session = _sessions[url]
+			if session_config == config:
+				return session
+			session.close()
+
+		# Only retry on connection errors; requests that reached the server are not retried here.
+		# Retries after 429 and gateway errors are done by APIWithPooledSession, honouring Retry-After
+		retry = Retry(
+			total=max_retries,
+			read=0,
+			status=0,
+			backoff_factor=0.5,
+			raise_on_status=False,
+		)
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+		session = requests.Session()
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		_sessions[url] = (config, session)
+		return session
+
+
+def clear_sessions(url: str = None):
+	"""
+	Close and discard pooled sessions, either for a single WooCommerce site URL or for all sites
+	"""
+	with _sessions_lock:
+		urls = [url] if url else list(_sessions.keys())
+		for key in urls:
+			if key in _sessions:
+				_sessions.pop(key)[1].close()
+
+
+class APIWithPooledSession(API):
+	"""WooCommerce API that sends requests through a pooled, keep-alive HTTP session."""
+
+	def __init__(self, url, consumer_key, consumer_secret, **kwargs):
+		self.pool_maxsize = kwargs.pop("pool_maxsize", None) or DEFAULT_POOL_MAXSIZE
+		max_retries = kwargs.pop("max_retries", None)
+		self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+		self.rate_limit = flt(kwargs.pop("rate_limit", None))
+		self.burst = cint(kwargs.pop("burst", None)) or DEFAULT_BURST
+		failure_threshold = kwargs.pop("failure_threshold", None)
+		self.failure_threshold = (
+			DEFAULT_FAILURE_THRESHOLD if failure_threshold is None else cint(failure_threshold)
+		)
+		self.cooldown = cint(kwargs.pop("cooldown", None)) or DEFAULT_COOLDOWN
+		kwargs["timeout"] = kwargs.get("timeout") or DEFAULT_TIMEOUT
+		super().__init__(url, consumer_key, consumer_secret, **kwargs)
+
+	def _API__request(self, method, endpoint, data, params=None, **kwargs):
+		"""
+		Same as API.__request, but uses the pooled session instead of requests.request, is rate
+		limited, retries after 429 responses and gateway errors, and fails fast while the circuit
+		breaker of the site is open
+		"""
+		# Copy the params, so that the authentication parameters aren't added to the caller's params
+		params = dict(params) if params else {}
+		url = self._API__get_url(endpoint)
+		auth = None
+		headers = {"user-agent": f"{self.user_agent}", "accept": "application/json"}
+
+		if self.is_ssl is True and self.query_string_auth is False:
+			auth = HTTPBasicAuth(self.consumer_key, self.consumer_secret)
+		elif self.is_ssl is True and self.query_string_auth is True:
+			params.update({"consumer_key": self.consumer_key, "consumer_secret": self.consumer_secret})
+		else:
+			encoded_params = urlencode(params)
+			url = f"{url}?{encoded_params}"
+			url = self._API__get_oauth_url(url, method, **kwargs)
+		kwargs.pop("oauth_timestamp", None)
+
+		if data is not None:
+			data = json.dumps(data, ensure_ascii=False).encode("utf-8")
+			headers["content-type"] = "application/json;charset=utf-8"
+
+		circuit_state = allow_request(self.url, self.failure_threshold, self.timeout)
+		try:
+			response = self.send_with_retries(
+				method=method,
+				url=url,
+				verify=self.verify_ssl,
+				auth=auth,
+				params=params,
+				data=data,
+				timeout=self.timeout,
+				headers=headers,
+				**kwargs,
+			)
+		except requests.exceptions.RequestException:
+			record_result(self.url, circuit_state, False, self.failure_threshold, self.cooldown)
+			raise
+		success = response.status_code < 500
+		record_result(self.url, circuit_state, success, self.failure_threshold, self.cooldown)
+		return response
+
+	def send_with_retries(self, method, **kwargs) -> requests.Response:
+		"""
+		Send a request through the pooled session, retrying after 429 responses and gateway errors
+		"""
+		session = get_session(self.url, pool_maxsize=self.pool_maxsize, max_retries=self.max_retries)
+		attempt = 0
+		while True:
+			wait_for_rate_limit(self.url, self.rate_limit, self.burst)
+			response = session.request(method=method, **kwargs)
+			if attempt >= self.max_retries or not should_retry(method, response):
+				return response
+
+			retry_after = get_retry_after(response)
+			if retry_after:
+				# Let other workers wait as well, instead of sending requests that will be rejected
+				pause_requests(self.url, retry_after)
+			sleep(get_retry_delay(attempt, retry_after))
+			attempt += 1
+
+
+class APIWithRequestLogging(APIWithPooledSession):
 	"""WooCommerce API with Request Logging."""
 
 	def _API__request(self, method, endpoint, data, params=None, **kwargs):
@@ -14,31 +198,171 @@ class APIWithRequestLogging(API):
 		try:
 			result = super()._API__request(method, endpoint, data, params, **kwargs)
 			if not frappe.flags.in_test:
-				frappe.enqueue(
-					"woocommerce_fusion.tasks.utils.log_woocommerce_request",
-					url=self.url,
-					endpoint=endpoint,
-					request_method=method,
-					params=params,
-					data=data,
-					res=result,
-					traceback="".join(traceback.format_stack(limit=8)),
-				)
+				self.log_request(method, endpoint, data, params, result)
 			return result
 		except Exception as e:
 			if not frappe.flags.in_test:
-				frappe.enqueue(
-					"woocommerce_fusion.tasks.utils.log_woocommerce_request",
-					url=self.url,
-					endpoint=endpoint,
-					request_method=method,
-					params=params,
-					data=data,
-					res=result,
-					traceback="".join(traceback.format_stack(limit=8)),
-				)
+				self.log_request(method, endpoint, data, params, result, error=frappe.get_traceback())
 			raise e
 
+	def request_without_logging(self, method, endpoint, data=None, params=None, **kwargs):
+		"""
+		Send a request without logging it, e.g. from a worker thread, which must not use the database
+		connection. The caller should log the request with log_request afterwards
+		"""
+		return super()._API__request(method, endpoint, data, params, **kwargs)
+
+	def log_request(self, method, endpoint, data, params, res, error=None):
+		"""
+		Record the request in the API metrics, and buffer a 'WooCommerce Request Log' for it according
+		to the logging policy on 'WooCommerce Integration Settings'. Failed requests are always logged.
+		"""
+		is_successful = not error and res is not None and res.status_code in [200, 201]
+		record_api_metric(self.url, endpoint, method, res, is_successful)
+
+		policy = get_request_log_policy()
+		if is_successful and random.random() * 100 >= policy.sample_rate:
+			return
+
+		entry = get_woocommerce_request_log_entry(
+			url=self.url,
+			endpoint=endpoint,
+			request_method=method,
+			params=params,
+			data=data,
+			res=res,
+			traceback="".join(traceback.format_stack(limit=8)) if policy.debug_mode else None,
+			error=error,
+		)
+		if policy.max_body_size:
+			for fieldname in ("params", "data", "response"):
+				entry[fieldname] = limit_body_size(
+					entry[fieldname], policy.max_body_size, policy.large_body_handling
+				)
+		buffer_woocommerce_request_log(entry)
+
+
+def get_request_log_policy() -> frappe._dict:
+	"""
+	Returns the request logging policy from 'WooCommerce Integration Settings'
+	"""
+	wc_settings = frappe.get_cached_doc("WooCommerce Integration Settings")
+	sample_rate = 100
+	if wc_settings.sample_successful_requests:
+		sample_rate = flt(wc_settings.request_log_sample_rate)
+	return frappe._dict(
+		sample_rate=sample_rate,
+		max_body_size=cint(wc_settings.request_log_max_body_size),
+		large_body_handling=wc_settings.request_log_large_body_handling or "Truncate",
+		debug_mode=cint(wc_settings.request_log_debug_mode),
+	)
+
+
+def limit_body_size(body: str | None, max_size: int, handling: str = "Truncate") -> str | None:
+	"""
+	Truncate or hash a request or response body if it is larger than max_size characters
+	"""
+	if not body or len(body) <= max_size:
+		return body
+	if handling == "Hash":
+		return f"sha256:{hashlib.sha256(body.encode()).hexdigest()} ({len(body)} characters)"
+	return f"{body[:max_size]}\n... (truncated, {len(body)} characters)"
+
+
+def get_woocommerce_request_log_entry(
+	url: str,
+	endpoint: str,
+	request_method: str,
+	params: dict,
+	data: dict,
+	res: requests.Response | None = None,
+	traceback: str = None,
+	error: str = None,
+) -> dict:
+	"""
+	Returns the field values of a 'WooCommerce Request Log' as plain, JSON serializable values
+	"""
+	return {
+		"creation": now(),
+		"user": frappe.session.user if frappe.session.user else None,
+		"url": url,
+		"endpoint": endpoint,
+		"method": request_method,
+		"params": frappe.as_json(params) if params else None,
+		"data": frappe.as_json(data) if data else None,
+		"response": f"{str(res)}\n{res.text}" if res is not None else None,
+		"error": error,
+		"status": "Success" if res and res.status_code in [200, 201] else "Error",
+		"traceback": traceback,
+		"time_elapsed": res.elapsed.total_seconds() if res is not None else None,
+	}
+
+
+def buffer_woocommerce_request_log(entry: dict):
+	"""
+	Add a 'WooCommerce Request Log' entry to the buffer in Redis, and enqueue a flush of the buffer
+	every REQUEST_LOG_FLUSH_SIZE entries. The buffer is also flushed every minute by a scheduled job.
+	"""
+	cache = frappe.cache()
+	cache.rpush(REQUEST_LOG_BUFFER_KEY, json.dumps(entry, default=str))
+
+	if cache.llen(REQUEST_LOG_BUFFER_KEY) % REQUEST_LOG_FLUSH_SIZE == 0:
+		frappe.enqueue(flush_woocommerce_request_logs, queue="short")
+
+
+def flush_woocommerce_request_logs():
+	"""
+	Insert the buffered 'WooCommerce Request Log' entries, with a single bulk insert per batch.
+
+	Entries are only removed from the buffer once they are committed, so that they are inserted by
+	the next flush if this one fails
+	"""
+	cache = frappe.cache()
+
+	# Flushes are run one at a time, so that concurrent flushes don't insert the same entries
+	lock = cache.lock(
+		cache.make_key(REQUEST_LOG_FLUSH_LOCK_KEY), timeout=REQUEST_LOG_FLUSH_LOCK_TIMEOUT
+	)
+	if not lock.acquire(blocking=False):
+		return
+
+	try:
+		while True:
+			entries = cache.lrange(REQUEST_LOG_BUFFER_KEY, 0, REQUEST_LOG_FLUSH_SIZE - 1)
+			if not entries:
+				break
+
+			insert_woocommerce_request_logs([json.loads(entry) for entry in entries])
+			# nosemgrep
+			frappe.db.commit()
+			# New entries are appended to the end of the buffer, so only the inserted ones are removed
+			cache.ltrim(REQUEST_LOG_BUFFER_KEY, len(entries), -1)
+
+			if len(entries) < REQUEST_LOG_FLUSH_SIZE:
+				break
+	finally:
+		lock.release()
+
+
+def insert_woocommerce_request_logs(entries: List[dict]):
+	"""
+	Insert 'WooCommerce Request Log' documents with a single query. Entries are created with
+	get_woocommerce_request_log_entry.
+	"""
+	fields = ["name", "owner", "modified_by", "modified", "docstatus", *REQUEST_LOG_FIELDS]
+	values = [
+		[
+			frappe.generate_hash(length=10),
+			entry["user"] or "Administrator",
+			entry["user"] or "Administrator",
+			entry["creation"],
+			0,
+			*(entry[fieldname] for fieldname in REQUEST_LOG_FIELDS),
+		]
+		for entry in entries
+	]
+	frappe.db.bulk_insert("WooCommerce Request Log", fields=fields, values=values)
+
 
 def log_woocommerce_request(
 	url: str,
@@ -49,6 +373,10 @@ def log_woocommerce_request(
 	res: requests.Response | None = None,
 	traceback: str = None,
 ):
+	"""
+	Create a single 'WooCommerce Request Log'. Requests are now logged through the buffer, this is
+	kept for jobs that were enqueued before the buffer was introduced.
+	"""
 	request_log = frappe.get_doc(
 		{
 			"doctype": "WooCommerce Request Log",
@@ -0,0 +1,172 @@
+import json
+from typing import Dict, Optional
+
+import frappe
+from frappe import _
+
+from woocommerce_fusion.tasks.sync import get_record_lock
+from woocommerce_fusion.tasks.sync_items import (
+	disable_items_linked_to_woocommerce_product,
+	run_item_sync,
+)
+from woocommerce_fusion.tasks.sync_sales_orders import run_sales_order_sync
+from woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order import (
+	WooCommerceOrder,
+)
+from woocommerce_fusion.woocommerce.doctype.woocommerce_product.woocommerce_product import (
+	WooCommerceProduct,
+)
+from woocommerce_fusion.woocommerce.woocommerce_api import (
+	generate_woocommerce_record_name_from_domain_and_id,
+	parse_domain_from_url,
+)
+
+WC_WEBHOOK_DELIVERY_KEY = "woocommerce_webhook_delivery"
+WC_WEBHOOK_INBOX_KEY = "woocommerce_webhook_inbox"
+WC_WEBHOOK_PENDING_KEY = "woocommerce_webhook_pending"
+# Deliveries that WooCommerce retries within this number of seconds are ignored
+WC_WEBHOOK_DELIVERY_EXPIRY = 86400
+WC_WEBHOOK_INBOX_EXPIRY = 3600
+
+WC_WEBHOOK_EVENTS = {
+	"orders": ("created", "updated", "deleted", "restored"),
+	"products": ("created", "updated", "deleted", "restored"),
+}
+
+
+def receive_webhook(
+	resource: str,
+	event: str,
+	woocommerce_server_url: str,
+	payload: Dict,
+	delivery_id: Optional[str] = None,
+) -> bool:
+	"""
+	Put a webhook delivery in the inbox, and enqueue a job to process it.
+
+	Deliveries that were received before (WooCommerce retries deliveries) are ignored. Deliveries for
+	a record that is already waiting in the inbox replace the waiting one, so that a burst of
+	webhooks for the same record is processed once. Returns False if the delivery was ignored
+	"""
+	cache = frappe.cache()
+	woocommerce_server = parse_domain_from_url(woocommerce_server_url)
+	record_key = f"{woocommerce_server}|{resource}|{payload['id']}"
+
+	if delivery_id and not cache.set(
+		cache.make_key(f"{WC_WEBHOOK_DELIVERY_KEY}|{woocommerce_server}|{delivery_id}"),
+		1,
+		nx=True,
+		ex=WC_WEBHOOK_DELIVERY_EXPIRY,
+	):
+		return False
+
+	message = {"event": event, "woocommerce_server_url": woocommerce_server_url, "payload": payload}
+	pipeline = cache.pipeline()
+	pipeline.set(
+		cache.make_key(f"{WC_WEBHOOK_INBOX_KEY}|{record_key}"),
+		json.dumps(message),
+		ex=WC_WEBHOOK_INBOX_EXPIRY,
+	)
+	pipeline.set(
+		cache.make_key(f"{WC_WEBHOOK_PENDING_KEY}|{record_key}"),
+		1,
+		nx=True,
+		ex=WC_WEBHOOK_INBOX_EXPIRY,
+	)
+	_stored, is_new = pipeline.execute()
+
+	# A job is already waiting for this record, and it will process the latest delivery
+	if is_new:
+		frappe.enqueue(
+			process_webhook,
+			queue="long",
+			woocommerce_server=woocommerce_server,
+			resource=resource,
+			resource_id=payload["id"],
+		)
+	return True
+
+
+def process_webhook(woocommerce_server: str, resource: str, resource_id: int):
+	"""
+	Process the latest webhook delivery for a record from the inbox. Deliveries for the same record
+	are processed one at a time
+	"""
+	cache = frappe.cache()
+	record_key = f"{woocommerce_server}|{resource}|{resource_id}"
+
+	# Take the delivery off the inbox, so that later deliveries enqueue a new job
+	pipeline = cache.pipeline()
+	pipeline.delete(cache.make_key(f"{WC_WEBHOOK_PENDING_KEY}|{record_key}"))
+	pipeline.get(cache.make_key(f"{WC_WEBHOOK_INBOX_KEY}|{record_key}"))
+	pipeline.delete(cache.make_key(f"{WC_WEBHOOK_INBOX_KEY}|{record_key}"))
+	_, message, _ = pipeline.execute()
+	if not message:
+		return
+
+	message = json.loads(message)
+	with get_record_lock(woocommerce_server, resource, resource_id):
+		if resource == "orders":
+			process_order_webhook(
+				message["event"], message["woocommerce_server_url"], message["payload"]
+			)
+		elif resource == "products":
+			process_product_webhook(
+				message["event"], message["woocommerce_server_url"], message["payload"]
+			)
+
+
+def process_order_webhook(event: str, woocommerce_server_url: str, payload: Dict):
+	if event == "deleted":
+		# The payload of a deleted order only contains its ID, so the order is fetched before the sync
+		woocommerce_server = parse_domain_from_url(woocommerce_server_url)
+		woocommerce_order = frappe.get_doc(
+			{
+				"doctype": "WooCommerce Order",
+				"name": generate_woocommerce_record_name_from_domain_and_id(woocommerce_server, payload["id"]),
+			}
+		)
+		try:
+			woocommerce_order.load_from_db()
+		except frappe.DoesNotExistError:
+			# The order was permanently deleted, so there is nothing to sync and retrying won't help
+			flag_sales_orders_of_deleted_woocommerce_order(woocommerce_server, payload["id"])
+			return
+		run_sales_order_sync(woocommerce_order=woocommerce_order)
+	else:
+		# Build the WooCommerce Order from the signed payload, instead of fetching it again
+		woocommerce_order = frappe.get_doc(
+			WooCommerceOrder.pre_init_document(payload, woocommerce_server_url=woocommerce_server_url)
+		)
+		run_sales_order_sync(woocommerce_order=woocommerce_order)
+
+
+def flag_sales_orders_of_deleted_woocommerce_order(woocommerce_server: str, woocommerce_id: int):
+	"""
+	Add a comment to the Sales Orders of a WooCommerce Order that was permanently deleted, so that
+	they can be cancelled by hand if needed
+	"""
+	for sales_order_name in frappe.get_all(
+		"Sales Order",
+		filters={"woocommerce_server": woocommerce_server, "woocommerce_id": str(woocommerce_id)},
+		pluck="name",
+	):
+		frappe.get_doc("Sales Order", sales_order_name).add_comment(
+			"Comment",
+			text=_("WooCommerce Order {0} was deleted on {1}").format(woocommerce_id, woocommerce_server),
+		)
+
+
+def process_product_webhook(event: str, woocommerce_server_url: str, payload: Dict):
+	if event == "deleted":
+		disable_items_linked_to_woocommerce_product(
+			woocommerce_server=parse_domain_from_url(woocommerce_server_url),
+			woocommerce_id=payload["id"],
+		)
+	else:
+		# Build the WooCommerce Product from the signed payload, instead of fetching it again
+		record = WooCommerceProduct.pre_init_document(
+			payload, woocommerce_server_url=woocommerce_server_url
+		)
+		woocommerce_product = frappe.get_doc(WooCommerceProduct.during_get_list_of_records(record))
+		run_item_sync(woocommerce_product=woocommerce_product)
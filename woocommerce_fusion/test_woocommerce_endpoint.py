@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import hmac
+import json
+from http import HTTPStatus
+from unittest.mock import Mock, patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from woocommerce_fusion.woocommerce_endpoint import order, order_created, product, validate_request
+
+
+@patch("woocommerce_fusion.woocommerce_endpoint.validate_request", return_value=(True, None, None))
+@patch("woocommerce_fusion.woocommerce_endpoint.receive_webhook")
+@patch("woocommerce_fusion.woocommerce_endpoint.frappe.get_request_header")
+class TestWooCommerceEndpoint(FrappeTestCase):
+	def set_request(self, mock_get_request_header, payload, event):
+		headers = {
+			"x-wc-webhook-source": "https://woo1.example.com/",
+			"x-wc-webhook-event": event,
+			"x-wc-webhook-delivery-id": "123",
+		}
+		mock_get_request_header.side_effect = lambda key, default=None: headers.get(key, default)
+		return patch(
+			"woocommerce_fusion.woocommerce_endpoint.frappe.request",
+			Mock(data=json.dumps(payload).encode()),
+			create=True,
+		)
+
+	def test_order_created_is_put_in_webhook_inbox(
+		self, mock_get_request_header, mock_receive_webhook, mock_validate_request
+	):
+		payload = {"id": 11, "status": "processing"}
+
+		with self.set_request(mock_get_request_header, payload, "created"):
+			response = order_created()
+
+		self.assertEqual(response.status_code, HTTPStatus.OK)
+		mock_receive_webhook.assert_called_once_with(
+			"orders",
+			"created",
+			woocommerce_server_url="https://woo1.example.com/",
+			payload=payload,
+			delivery_id="123",
+		)
+
+	def test_product_deleted_is_put_in_webhook_inbox(
+		self, mock_get_request_header, mock_receive_webhook, mock_validate_request
+	):
+		with self.set_request(mock_get_request_header, {"id": 5}, "deleted"):
+			response = product()
+
+		self.assertEqual(response.status_code, HTTPStatus.OK)
+		self.assertEqual(mock_receive_webhook.call_args.args, ("products", "deleted"))
+
+	def test_unsupported_event_is_rejected(
+		self, mock_get_request_header, mock_receive_webhook, mock_validate_request
+	):
+		with self.set_request(mock_get_request_header, {"id": 11}, "archived"):
+			response = order()
+
+		self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+		mock_receive_webhook.assert_not_called()
+
+
+@patch("woocommerce_fusion.woocommerce_endpoint.frappe.set_user")
+@patch("woocommerce_fusion.woocommerce_endpoint.frappe.get_cached_doc")
+@patch("woocommerce_fusion.woocommerce_endpoint.frappe.get_request_header")
+class TestValidateRequest(FrappeTestCase):
+	def validate(self, mock_get_request_header, data, signature):
+		headers = {
+			"x-wc-webhook-source": "https://woo1.example.com/",
+			"x-wc-webhook-signature": signature,
+		}
+		mock_get_request_header.side_effect = lambda key, default=None: headers.get(key, default)
+		with patch(
+			"woocommerce_fusion.woocommerce_endpoint.frappe.request", Mock(data=data), create=True
+		):
+			return validate_request()
+
+	def test_signed_request_is_accepted(
+		self, mock_get_request_header, mock_get_cached_doc, mock_set_user
+	):
+		mock_get_cached_doc.return_value = Mock(secret="secret", creation_user="Administrator")
+		data = b'{"id": 11}'
+		signature = base64.b64encode(hmac.new(b"secret", data, hashlib.sha256).digest()).decode()
+
+		self.assertEqual(self.validate(mock_get_request_header, data, signature), (True, None, None))
+		mock_set_user.assert_called_once_with("Administrator")
+
+	def test_unsigned_request_is_rejected(
+		self, mock_get_request_header, mock_get_cached_doc, mock_set_user
+	):
+		mock_get_cached_doc.return_value = Mock(secret="secret", creation_user="Administrator")
+
+		valid, status, _msg = self.validate(mock_get_request_header, b'{"id": 11}', "forged")
+
+		self.assertFalse(valid)
+		self.assertEqual(status, HTTPStatus.UNAUTHORIZED)
+		mock_set_user.assert_not_called()
@@ -0,0 +1,74 @@
+# Copyright (c) 2026, Dirk van der Laarse and Contributors
+# See license.txt
+
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import get_datetime
+
+from woocommerce_fusion.patches.v1 import add_api_metric_log_settings
+from woocommerce_fusion.woocommerce.doctype.woocommerce_api_metric.woocommerce_api_metric import (
+	get_api_metrics,
+	record_api_metric,
+	rollup_api_metrics,
+)
+
+MODULE = "woocommerce_fusion.woocommerce.doctype.woocommerce_api_metric.woocommerce_api_metric"
+
+
+class TestWooCommerceAPIMetric(FrappeTestCase):
+	def get_response(self, status_code, elapsed):
+		response = Mock()
+		response.status_code = status_code
+		response.content = b"x" * 100
+		response.request.body = '{"status": "completed"}'
+		response.elapsed = timedelta(seconds=elapsed)
+		return response
+
+	def test_metrics_are_rolled_up_per_minute_and_aggregated(self):
+		server = f"{frappe.generate_hash(length=8)}.example.com"
+		minute = get_datetime("2026-01-01 10:15:30")
+
+		with patch(f"{MODULE}.now_datetime", return_value=minute):
+			for order_id, elapsed in ((1, 0.08), (2, 0.4), (3, 2.5)):
+				record_api_metric(
+					f"https://{server}", f"orders/{order_id}", "PUT", self.get_response(200, elapsed), True
+				)
+			record_api_metric(f"https://{server}", "orders/4", "PUT", None, False)
+
+			# Metrics of the current minute are not rolled up yet
+			rollup_api_metrics()
+			self.assertFalse(frappe.db.exists("WooCommerce API Metric", {"woocommerce_server": server}))
+
+		with patch(f"{MODULE}.now_datetime", return_value=minute + timedelta(minutes=1)):
+			rollup_api_metrics()
+
+		metric = frappe.get_doc("WooCommerce API Metric", {"woocommerce_server": server})
+		self.assertEqual(metric.endpoint, "orders/:id")
+		self.assertEqual(metric.request_count, 4)
+		self.assertEqual(metric.error_count, 1)
+		self.assertEqual(metric.bytes_received, 300)
+		self.assertEqual(metric.bytes_sent, 3 * len('{"status": "completed"}'))
+		self.assertEqual(metric.p50, 0.5)
+		self.assertEqual(metric.p99, 3)
+		self.assertEqual(frappe.parse_json(metric.status_codes), {"200": 3, "0": 1})
+
+		metrics = get_api_metrics(
+			from_datetime="2026-01-01 10:00:00",
+			to_datetime="2026-01-01 11:00:00",
+			woocommerce_server=server,
+		)
+		self.assertEqual(len(metrics), 1)
+		self.assertEqual(metrics[0].request_count, 4)
+		self.assertEqual(metrics[0].p95, 3)
+
+	def test_old_metrics_are_cleared_by_log_settings(self):
+		add_api_metric_log_settings.execute()
+		add_api_metric_log_settings.execute()
+
+		log_settings = frappe.get_single("Log Settings")
+		logtypes = [d for d in log_settings.logs_to_clear if d.ref_doctype == "WooCommerce API Metric"]
+		self.assertEqual(len(logtypes), 1)
+		self.assertEqual(logtypes[0].days, 30)
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Dirk van der Laarse and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('WooCommerce API Metric', {
+	// refresh: function(frm) {
+
+	// }
+});
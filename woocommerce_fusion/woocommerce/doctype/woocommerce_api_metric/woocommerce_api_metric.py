@@ -0,0 +1,286 @@
+# Copyright (c) 2026, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+import json
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, List
+from urllib.parse import urlparse
+
+import frappe
+import requests
+from frappe.model.document import Document
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+WC_API_METRICS_KEY = "woocommerce_api_metrics"
+WC_API_METRICS_MINUTES_KEY = "woocommerce_api_metrics_minutes"
+WC_API_METRICS_EXPIRY = 3600
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+	0.05,
+	0.1,
+	0.2,
+	0.3,
+	0.5,
+	0.75,
+	1,
+	1.5,
+	2,
+	3,
+	5,
+	7.5,
+	10,
+	15,
+	20,
+	30,
+	45,
+	60,
+	120,
+)
+OVERFLOW_BUCKET = "+Inf"
+
+
+class WooCommerceAPIMetric(Document):
+	@staticmethod
+	def clear_old_logs(days=30):
+		table = frappe.qb.DocType("WooCommerce API Metric")
+		frappe.db.delete(table, filters=(table.minute < add_to_date(now_datetime(), days=-days)))
+
+
+def record_api_metric(
+	url: str,
+	endpoint: str,
+	method: str,
+	res: requests.Response | None = None,
+	is_successful: bool = False,
+):
+	"""
+	Add a WooCommerce API request to the metrics of the current minute in Redis. The metrics are
+	saved as 'WooCommerce API Metric' documents by rollup_api_metrics
+	"""
+	minute = now_datetime().strftime("%Y-%m-%d %H:%M:00")
+	series = "|".join((urlparse(url).netloc, normalise_endpoint(endpoint), method))
+
+	cache = frappe.cache()
+	key = cache.make_key(f"{WC_API_METRICS_KEY}|{minute}")
+	pipeline = cache.pipeline(transaction=False)
+	pipeline.hincrby(key, f"{series}|count", 1)
+	if not is_successful:
+		pipeline.hincrby(key, f"{series}|errors", 1)
+	# Status code 0 means that no response was received
+	pipeline.hincrby(key, f"{series}|status|{res.status_code if res is not None else 0}", 1)
+	if res is not None:
+		elapsed = res.elapsed.total_seconds()
+		pipeline.hincrbyfloat(key, f"{series}|time", elapsed)
+		pipeline.hincrby(key, f"{series}|latency|{get_latency_bucket(elapsed)}", 1)
+		pipeline.hincrby(key, f"{series}|bytes_received", len(res.content or b""))
+		body = res.request.body if res.request is not None else None
+		if isinstance(body, (str, bytes)):
+			pipeline.hincrby(key, f"{series}|bytes_sent", len(body))
+	pipeline.expire(key, WC_API_METRICS_EXPIRY)
+	pipeline.sadd(cache.make_key(WC_API_METRICS_MINUTES_KEY), minute)
+	pipeline.execute()
+
+
+def normalise_endpoint(endpoint: str) -> str:
+	"""
+	Replace record ID's and strip query strings, e.g. 'orders/123/notes?x=1' -> 'orders/:id/notes'
+	"""
+	return re.sub(r"(^|/)\d+(?=/|$)", r"\1:id", endpoint.split("?")[0])
+
+
+def get_latency_bucket(elapsed: float) -> str:
+	index = bisect_left(LATENCY_BUCKETS, elapsed)
+	return str(LATENCY_BUCKETS[index]) if index < len(LATENCY_BUCKETS) else OVERFLOW_BUCKET
+
+
+def get_percentile(histogram: Dict[str, int], percentile: float) -> float | None:
+	"""
+	Returns the upper bound of the latency bucket containing the given percentile
+	"""
+	buckets = sorted(histogram.items(), key=lambda bucket: float(bucket[0]))
+	total = sum(count for _bucket, count in buckets)
+	if not total:
+		return None
+
+	rank = total * percentile / 100
+	seen = 0
+	for bucket, count in buckets:
+		seen += count
+		if seen >= rank:
+			return LATENCY_BUCKETS[-1] if bucket == OVERFLOW_BUCKET else float(bucket)
+
+
+def rollup_api_metrics():
+	"""
+	Save the metrics of all completed minutes from Redis as 'WooCommerce API Metric' documents
+	"""
+	cache = frappe.cache()
+	current_minute = now_datetime().strftime("%Y-%m-%d %H:%M:00")
+	minutes = sorted(minute.decode() for minute in cache.smembers(WC_API_METRICS_MINUTES_KEY))
+
+	for minute in minutes:
+		if minute >= current_minute:
+			continue
+
+		# Take the metrics of this minute off Redis atomically, so that they are only saved once
+		key = cache.make_key(f"{WC_API_METRICS_KEY}|{minute}")
+		pipeline = cache.pipeline()
+		pipeline.hgetall(key)
+		pipeline.delete(key)
+		pipeline.srem(cache.make_key(WC_API_METRICS_MINUTES_KEY), minute)
+		values, _deleted, _removed = pipeline.execute()
+
+		insert_api_metrics(minute, parse_api_metrics(values))
+
+
+def parse_api_metrics(values: Dict[bytes, bytes]) -> Dict[tuple, frappe._dict]:
+	"""
+	Parse the Redis hash of a minute's metrics into a dict of metrics per server, endpoint and method
+	"""
+	metrics = defaultdict(
+		lambda: frappe._dict(
+			count=0, errors=0, time=0.0, bytes_sent=0, bytes_received=0, status={}, latency={}
+		)
+	)
+	for field, value in values.items():
+		server, endpoint, method, metric = field.decode().split("|", 3)
+		series = metrics[(server, endpoint, method)]
+		if metric.startswith(("status|", "latency|")):
+			metric, bucket = metric.split("|")
+			series[metric][bucket] = int(value)
+		elif metric == "time":
+			series.time = float(value)
+		else:
+			series[metric] = int(value)
+	return metrics
+
+
+def insert_api_metrics(minute: str, metrics: Dict[tuple, frappe._dict]):
+	"""
+	Insert a 'WooCommerce API Metric' per server, endpoint and method with a single query
+	"""
+	if not metrics:
+		return
+
+	fields = [
+		"name",
+		"owner",
+		"modified_by",
+		"creation",
+		"modified",
+		"docstatus",
+		"minute",
+		"woocommerce_server",
+		"endpoint",
+		"method",
+		"request_count",
+		"error_count",
+		"bytes_sent",
+		"bytes_received",
+		"total_time",
+		"p50",
+		"p95",
+		"p99",
+		"status_codes",
+		"latency_histogram",
+	]
+	now = now_datetime()
+	values = [
+		[
+			frappe.generate_hash(length=10),
+			"Administrator",
+			"Administrator",
+			now,
+			now,
+			0,
+			minute,
+			server,
+			endpoint,
+			method,
+			series.count,
+			series.errors,
+			series.bytes_sent,
+			series.bytes_received,
+			series.time,
+			get_percentile(series.latency, 50),
+			get_percentile(series.latency, 95),
+			get_percentile(series.latency, 99),
+			json.dumps(series.status),
+			json.dumps(series.latency),
+		]
+		for (server, endpoint, method), series in metrics.items()
+	]
+	frappe.db.bulk_insert("WooCommerce API Metric", fields=fields, values=values)
+
+
+@frappe.whitelist()
+def get_api_metrics(
+	from_datetime: str = None, to_datetime: str = None, woocommerce_server: str = None
+) -> List[dict]:
+	"""
+	Returns the WooCommerce API metrics per server, endpoint and method for the given period,
+	which defaults to the last hour
+	"""
+	frappe.has_permission("WooCommerce API Metric", throw=True)
+
+	to_datetime = get_datetime(to_datetime) if to_datetime else now_datetime()
+	from_datetime = (
+		get_datetime(from_datetime) if from_datetime else add_to_date(to_datetime, hours=-1)
+	)
+	filters = {"minute": ["between", [from_datetime, to_datetime]]}
+	if woocommerce_server:
+		filters["woocommerce_server"] = woocommerce_server
+
+	rows = frappe.get_all(
+		"WooCommerce API Metric",
+		filters=filters,
+		fields=[
+			"woocommerce_server",
+			"endpoint",
+			"method",
+			"request_count",
+			"error_count",
+			"bytes_sent",
+			"bytes_received",
+			"total_time",
+			"status_codes",
+			"latency_histogram",
+		],
+	)
+
+	totals = {}
+	for row in rows:
+		series = totals.setdefault(
+			(row.woocommerce_server, row.endpoint, row.method),
+			frappe._dict(
+				woocommerce_server=row.woocommerce_server,
+				endpoint=row.endpoint,
+				method=row.method,
+				request_count=0,
+				error_count=0,
+				bytes_sent=0,
+				bytes_received=0,
+				total_time=0.0,
+				status_codes=Counter(),
+				latency_histogram=Counter(),
+			),
+		)
+		series.request_count += row.request_count
+		series.error_count += row.error_count
+		series.bytes_sent += row.bytes_sent
+		series.bytes_received += row.bytes_received
+		series.total_time += row.total_time
+		series.status_codes.update(json.loads(row.status_codes or "{}"))
+		series.latency_histogram.update(json.loads(row.latency_histogram or "{}"))
+
+	for series in totals.values():
+		series.p50 = get_percentile(series.latency_histogram, 50)
+		series.p95 = get_percentile(series.latency_histogram, 95)
+		series.p99 = get_percentile(series.latency_histogram, 99)
+		series.status_codes = dict(series.status_codes)
+		series.latency_histogram = dict(series.latency_histogram)
+
+	return sorted(totals.values(), key=lambda series: series.request_count, reverse=True)
@@ -2,6 +2,7 @@
 # See license.txt
 
 import json
+import threading
 from copy import deepcopy
 from unittest.mock import Mock, patch
 from urllib.parse import urlparse
@@ -9,15 +10,18 @@ from urllib.parse import urlparse
 import frappe
 from frappe.tests.utils import FrappeTestCase
 
-from woocommerce_fusion.tasks.utils import API, APIWithRequestLogging
+from woocommerce_fusion.tasks.utils import APIWithPooledSession, APIWithRequestLogging
 from woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order import (
 	WC_ORDER_DELIMITER,
 	WooCommerceOrder,
 	WooCommerceOrderAPI,
 )
 from woocommerce_fusion.woocommerce.woocommerce_api import (
+	WC_COUNT_CACHE_KEY,
+	WooCommerceAPI,
 	generate_woocommerce_record_name_from_domain_and_id,
 	get_domain_and_id_from_woocommerce_record_name,
+	get_from_wc_servers_concurrently,
 )
 
 
@@ -103,19 +107,12 @@ class TestWooCommerceOrder(FrappeTestCase):
 
 		mock_init_api.return_value = mock_api_list
 
-		# Define the mock response from the get method
+		# Define the mock response from the get method, honouring the 'offset' and 'per_page' parameters
 		order_counts = [10, 20, 30]
 		for x, woocommerce_api in enumerate(mock_api_list):
-			mock_get_response = Mock()
-			mock_get_response.status_code = 200
-			nr_of_orders = order_counts[x]
-			mock_get_response.json.return_value = wc_response_for_list_of_orders(
-				nr_of_orders, woocommerce_api.woocommerce_server_url
+			woocommerce_api.api.get.side_effect = mock_get_for_list_of_orders(
+				order_counts[x], woocommerce_api.woocommerce_server_url
 			)
-			mock_get_response.headers = {"x-wp-total": nr_of_orders}
-
-			# Set the mock response to be returned when get is called on the mock API
-			woocommerce_api.api.get.return_value = mock_get_response
 
 		# Parameterize this test for different combinations of 'page_length' and 'start' arguments
 		test_parameters = [
@@ -156,6 +153,180 @@ class TestWooCommerceOrder(FrappeTestCase):
 					param.expected_order_counts,
 				)
 
+	def test_get_page_of_records_sweeps_all_servers_with_one_request_per_server_per_page(
+		self, mock_init_api
+	):
+		"""
+		Test that following the cursor returned by get_page_of_records visits every order once,
+		with one API call per page to each server that still has orders
+		"""
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url=f"http://site{x}.example.com",
+				woocommerce_server=f"site{x}.example.com",
+			)
+			for x in range(1, 4)
+		]
+		mock_init_api.return_value = mock_api_list
+		order_counts = [10, 20, 30]
+		for x, woocommerce_api in enumerate(mock_api_list):
+			woocommerce_api.api.get.side_effect = mock_get_for_list_of_orders(
+				order_counts[x], woocommerce_api.woocommerce_server_url
+			)
+
+		pages = []
+		cursor = None
+		while True:
+			orders, cursor = WooCommerceOrder.get_page_of_records({"page_length": 10, "cursor": cursor})
+			pages.append(orders)
+			if not cursor:
+				break
+
+		self.assertEqual([len(orders) for orders in pages], [10] * 6)
+		self.assertEqual(
+			[woocommerce_api.api.get.call_count for woocommerce_api in mock_api_list], [1, 3, 6]
+		)
+		self.assertEqual(
+			[pages[-1][0].woocommerce_server, pages[-1][-1].woocommerce_server],
+			["site3.example.com", "site3.example.com"],
+		)
+
+	def test_get_list_merges_orders_from_all_servers_by_date_created(self, mock_init_api):
+		"""
+		Test that get_list merges the orders of all servers, newest first
+		"""
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url=f"http://site{x}.example.com",
+				woocommerce_server=f"site{x}.example.com",
+			)
+			for x in range(1, 3)
+		]
+		mock_init_api.return_value = mock_api_list
+		dates_created = [["2023-01-05", "2023-01-03", "2023-01-01"], ["2023-01-06", "2023-01-04"]]
+		for x, woocommerce_api in enumerate(mock_api_list):
+			woocommerce_api.api.get.side_effect = mock_get_for_list_of_orders(
+				len(dates_created[x]), woocommerce_api.woocommerce_server_url, dates_created[x]
+			)
+
+		orders = WooCommerceOrder.get_list({"page_length": 4})
+
+		self.assertEqual(
+			[(order.woocommerce_server, order.date_created_gmt) for order in orders],
+			[
+				("site2.example.com", "2023-01-06T00:00:00"),
+				("site1.example.com", "2023-01-05T00:00:00"),
+				("site2.example.com", "2023-01-04T00:00:00"),
+				("site1.example.com", "2023-01-03T00:00:00"),
+			],
+		)
+
+	@patch("woocommerce_fusion.woocommerce.woocommerce_api.frappe.msgprint")
+	def test_get_list_returns_partial_results_if_a_server_fails(self, mock_msgprint, mock_init_api):
+		"""
+		Test that the list view still shows the orders of the other servers if one server fails,
+		and notifies the user
+		"""
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url=f"http://site{x}.example.com",
+				woocommerce_server=f"site{x}.example.com",
+			)
+			for x in range(1, 3)
+		]
+		mock_init_api.return_value = mock_api_list
+		mock_api_list[0].api.get.side_effect = mock_get_for_list_of_orders(
+			5, mock_api_list[0].woocommerce_server_url
+		)
+		mock_api_list[1].api.get.side_effect = TimeoutError()
+
+		orders = WooCommerceOrder.get_list({"page_length": 10})
+
+		self.assertEqual(len(orders), 5)
+		mock_msgprint.assert_called_once()
+		self.assertIn("site2.example.com", mock_msgprint.call_args.args[0])
+
+	def test_get_count_requests_minimal_page_with_filters_and_caches_count(self, mock_init_api):
+		"""
+		Test that get_count reads the count from a filtered, single-ID page, and caches it
+		"""
+		frappe.cache().delete_keys(WC_COUNT_CACHE_KEY)
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url="http://site1.example.com",
+				woocommerce_server="site1.example.com",
+			)
+		]
+		mock_init_api.return_value = mock_api_list
+		mock_get_response = Mock()
+		mock_get_response.status_code = 200
+		mock_get_response.headers = {"x-wp-total": 42}
+		mock_api_list[0].api.get.return_value = mock_get_response
+
+		args = {"filters": [["WooCommerce Order", "status", "=", "processing"]]}
+		self.assertEqual(WooCommerceOrder.get_count(args), 42)
+		self.assertEqual(WooCommerceOrder.get_count(args), 42)
+
+		mock_api_list[0].api.get.assert_called_once_with(
+			"orders", params={"per_page": 1, "_fields": "id", "status": "processing"}
+		)
+
+	def test_get_count_is_cached_when_the_request_changes_its_params(self, mock_init_api):
+		"""
+		Test that counts of concurrent requests are cached, even if the request layer adds
+		authentication parameters to the params it is given
+		"""
+		frappe.cache().delete_keys(WC_COUNT_CACHE_KEY)
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url=f"http://site{x}.example.com",
+				woocommerce_server=f"site{x}.example.com",
+			)
+			for x in range(1, 3)
+		]
+		mock_init_api.return_value = mock_api_list
+		mock_get_response = Mock()
+		mock_get_response.status_code = 200
+		mock_get_response.headers = {"x-wp-total": 5}
+
+		def get_with_query_string_auth(endpoint, params):
+			params.update({"consumer_key": "ck", "consumer_secret": "cs"})
+			return mock_get_response
+
+		for woocommerce_api in mock_api_list:
+			woocommerce_api.api.get.side_effect = get_with_query_string_auth
+
+		self.assertEqual(WooCommerceOrder.get_count({}), 10)
+		self.assertEqual(WooCommerceOrder.get_count({}), 10)
+
+		# Every server is counted once, and gets its own params
+		self.assertEqual([api.api.get.call_count for api in mock_api_list], [1, 1])
+		self.assertIsNot(
+			mock_api_list[0].api.get.call_args.kwargs["params"],
+			mock_api_list[1].api.get.call_args.kwargs["params"],
+		)
+
+	def test_get_json_fields_is_memoized_per_doctype(self, mock_init_api):
+		"""
+		Test that the JSON fieldnames are only looked up once per doctype
+		"""
+		with patch(
+			"woocommerce_fusion.woocommerce.woocommerce_api.frappe.get_meta", wraps=frappe.get_meta
+		) as mock_get_meta:
+			frappe.local.cache.pop("woocommerce_json_fields", None)
+			json_fields = WooCommerceOrder.get_json_fields()
+			for _i in range(5):
+				WooCommerceOrder.serialize_attributes_of_type_dict_or_list({"line_items": []})
+
+		self.assertIn("line_items", json_fields)
+		self.assertIs(WooCommerceOrder.get_json_fields(), json_fields)
+		mock_get_meta.assert_called_once_with("WooCommerce Order")
+
 	def test_load_from_db_initialises_doctype_with_all_values(self, mock_init_api):
 		"""
 		Test that load_from_db returns an Order
@@ -235,6 +406,29 @@ class TestWooCommerceOrder(FrappeTestCase):
 		# Verify that the orders endpoint is called
 		self.assertEqual(mock_api_list[0].api.get.call_args.args[0], f"orders/{order_id}")
 
+	def test_load_from_db_raises_does_not_exist_for_deleted_order(self, mock_init_api):
+		"""
+		Test that load_from_db raises DoesNotExistError for an Order that was permanently deleted
+		"""
+		mock_init_api.return_value = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url="http://site1.example.com",
+				woocommerce_server="site1.example.com",
+				wc_plugin_advanced_shipment_tracking=0,
+			)
+		]
+		mock_get_response = Mock()
+		mock_get_response.status_code = 404
+		mock_get_response.json.return_value = {"code": "woocommerce_rest_shop_order_invalid_id"}
+		mock_init_api.return_value[0].api.get.return_value = mock_get_response
+
+		woocommerce_order = frappe.get_doc(
+			{"doctype": "WooCommerce Order", "name": f"site1.example.com{WC_ORDER_DELIMITER}1"}
+		)
+		with self.assertRaises(frappe.DoesNotExistError):
+			woocommerce_order.load_from_db()
+
 	def test_db_insert_makes_post_call(self, mock_init_api):
 		"""
 		Test that db_insert makes a POST call to the WooCommerce API
@@ -377,6 +571,72 @@ class TestWooCommerceOrder(FrappeTestCase):
 		self.assertTrue("status" in mock_api_list[0].api.put.call_args.kwargs["data"])
 		self.assertEqual(mock_api_list[0].api.put.call_args.kwargs["data"]["status"], "Hello World")
 
+	@patch(
+		"woocommerce_fusion.woocommerce.doctype.woocommerce_order.woocommerce_order.WooCommerceOrder.update_shipment_tracking"
+	)
+	def test_batch_writer_makes_single_post_call_to_batch_endpoint(
+		self, mock_update_shipment_tracking, mock_init_api
+	):
+		"""
+		Test that the batch writer combines creates and updates in one POST call to the batch endpoint,
+		and maps the results back to the documents
+		"""
+		woocommerce_server_url = "http://site1.example.com"
+
+		# Setup mock API
+		mock_api_list = [
+			WooCommerceOrderAPI(
+				api=Mock(),
+				woocommerce_server_url=woocommerce_server_url,
+				woocommerce_server="site1.example.com",
+				wc_plugin_advanced_shipment_tracking=0,
+			)
+		]
+		mock_init_api.return_value = mock_api_list
+
+		# Define the mock response from the post method, with a failure for the second update
+		mock_post_response = Mock()
+		mock_post_response.status_code = 200
+		mock_post_response.json.return_value = {
+			"create": [{"id": 69, "date_modified": "2024-01-01"}],
+			"update": [
+				{"id": 1, "date_modified": "2024-01-02"},
+				{"id": 2, "error": {"code": "woocommerce_rest_shop_order_invalid_id", "message": "Invalid ID."}},
+			],
+		}
+		mock_api_list[0].api.post.return_value = mock_post_response
+
+		# Queue one new order and two updated orders
+		batch = WooCommerceOrder.get_batch_writer()
+		new_order = frappe.get_doc({"doctype": "WooCommerce Order"})
+		new_order.woocommerce_server = "site1.example.com"
+		new_order.status = "pending"
+		batch.insert(new_order)
+		for order_id in (1, 2):
+			woocommerce_order = frappe.get_doc({"doctype": "WooCommerce Order"})
+			woocommerce_order.name = generate_woocommerce_record_name_from_domain_and_id(
+				"site1.example.com", order_id
+			)
+			woocommerce_order._doc_before_save = deepcopy(woocommerce_order)
+			woocommerce_order.status = "completed"
+			batch.update(woocommerce_order)
+
+		results = batch.flush()
+
+		# Check that a single batch request was made
+		mock_api_list[0].api.post.assert_called_once()
+		self.assertEqual(mock_api_list[0].api.post.call_args.args[0], "orders/batch")
+		data = mock_api_list[0].api.post.call_args.kwargs["data"]
+		self.assertEqual(data["create"][0]["status"], "pending")
+		self.assertEqual(data["update"], [{"status": "completed", "id": 1}, {"status": "completed", "id": 2}])
+
+		# Check that the results are mapped back to the documents
+		self.assertEqual([result.success for result in results], [True, True, False])
+		self.assertEqual(new_order.woocommerce_id, 69)
+		self.assertEqual(results[1].doc.woocommerce_date_modified, "2024-01-02")
+		self.assertEqual(results[2].error, "Invalid ID.")
+		self.assertEqual(len(batch), 0)
+
 	def test_get_additional_order_attributes_makes_api_get(self, mock_init_api):
 		"""
 		Test that the get_additional_order_attributes method makes an API call
@@ -523,6 +783,26 @@ class TestWooCommerceOrder(FrappeTestCase):
 		self.assertEqual(order_id, 3)
 
 
+def mock_get_for_list_of_orders(nr_of_orders, site, dates_created=None):
+	"""
+	Generate a side effect for a mocked API get method, returning the requested page of a dummy list
+	of orders
+	"""
+
+	def get(endpoint, params):
+		orders = wc_response_for_list_of_orders(nr_of_orders, site)
+		for order, date_created in zip(orders, dates_created or []):
+			order.date_created_gmt = f"{date_created}T00:00:00"
+		offset = params.get("offset", 0)
+		mock_get_response = Mock()
+		mock_get_response.status_code = 200
+		mock_get_response.json.return_value = orders[offset : offset + params["per_page"]]
+		mock_get_response.headers = {"x-wp-total": nr_of_orders}
+		return mock_get_response
+
+	return get
+
+
 def wc_response_for_list_of_orders(nr_of_orders=5, site="example.com"):
 	"""
 	Generate a dummy list of orders as if it was returned from the WooCommerce API
@@ -640,7 +920,9 @@ class TestAPIWithRequestLogging(FrappeTestCase):
 	)
 	def test_request_success(self, mock_enqueue):
 		# Mock the parent class's _API__request method
-		with patch.object(API, "_API__request", return_value="success_response") as mock_super:
+		with patch.object(
+			APIWithPooledSession, "_API__request", return_value="success_response"
+		) as mock_super:
 			# Make a request
 			response = self.api._API__request("GET", "test_endpoint", {"key": "value"})
 
@@ -649,3 +931,49 @@ class TestAPIWithRequestLogging(FrappeTestCase):
 
 			# Verify the response is correct
 			self.assertEqual(response, "success_response")
+
+	@patch("woocommerce_fusion.woocommerce.woocommerce_api.frappe.msgprint")
+	def test_concurrent_requests_are_logged_on_the_calling_thread(self, mock_msgprint):
+		"""
+		Test that requests sent from worker threads are logged afterwards on the calling thread, and
+		that a server that times out doesn't hold up the response
+		"""
+		release = threading.Event()
+		response = Mock()
+		response.status_code = 200
+		apis = [
+			APIWithRequestLogging(
+				url=f"https://site{x}.example.com", consumer_key="bar", consumer_secret="baz", timeout=1
+			)
+			for x in range(1, 4)
+		]
+		apis[0].request_without_logging = Mock(return_value=response)
+		apis[1].request_without_logging = Mock(side_effect=ConnectionError("Connection refused"))
+		apis[2].request_without_logging = Mock(side_effect=lambda *args, **kwargs: release.wait(10))
+		logging_threads = []
+		for api in apis:
+			api.log_request = Mock(
+				side_effect=lambda *args, **kwargs: logging_threads.append(threading.current_thread())
+			)
+
+		requests = [
+			(
+				WooCommerceAPI(api=api, woocommerce_server_url=api.url, woocommerce_server=f"site{x}"),
+				"orders",
+				{"per_page": 1},
+			)
+			for x, api in enumerate(apis, start=1)
+		]
+		try:
+			responses = get_from_wc_servers_concurrently(
+				requests, error_text="get_list failed", allow_partial_results=True
+			)
+		finally:
+			release.set()
+
+		self.assertEqual(list(responses), ["site1"])
+		apis[0].log_request.assert_called_once_with("GET", "orders", None, {"per_page": 1}, response)
+		self.assertIn("Connection refused", apis[1].log_request.call_args.kwargs["error"])
+		self.assertIn("Timed out", apis[2].log_request.call_args.kwargs["error"])
+		self.assertEqual(logging_threads, [threading.current_thread()] * 3)
+		mock_msgprint.assert_called_once()
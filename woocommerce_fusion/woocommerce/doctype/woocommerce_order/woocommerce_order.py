@@ -6,13 +6,13 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, List
 
-import frappe
-
 from woocommerce_fusion.tasks.utils import APIWithRequestLogging
 from woocommerce_fusion.woocommerce.woocommerce_api import (
 	WooCommerceAPI,
 	WooCommerceResource,
 	get_domain_and_id_from_woocommerce_record_name,
+	get_from_wc_server_registry,
+	get_wc_servers,
 	log_and_raise_error,
 )
 
@@ -58,25 +58,31 @@ class WooCommerceOrder(WooCommerceResource):
 		"""
 		Initialise the WooCommerce API
 		"""
-		wc_servers = frappe.get_all("WooCommerce Server")
-		wc_servers = [frappe.get_doc("WooCommerce Server", server.name) for server in wc_servers]
-
-		wc_api_list = [
-			WooCommerceOrderAPI(
-				api=APIWithRequestLogging(
-					url=server.woocommerce_server_url,
-					consumer_key=server.api_consumer_key,
-					consumer_secret=server.api_consumer_secret,
-					version="wc/v3",
-					timeout=40,
-				),
-				woocommerce_server_url=server.woocommerce_server_url,
-				woocommerce_server=server.name,
-				wc_plugin_advanced_shipment_tracking=server.wc_plugin_advanced_shipment_tracking,
-			)
-			for server in wc_servers
-			if server.enable_sync == 1
-		]
+		wc_api_list = get_from_wc_server_registry(
+			"WooCommerceOrderAPI",
+			lambda: [
+				WooCommerceOrderAPI(
+					api=APIWithRequestLogging(
+						url=server.woocommerce_server_url,
+						consumer_key=server.api_consumer_key,
+						consumer_secret=server.api_consumer_secret,
+						version="wc/v3",
+						timeout=server.api_timeout,
+						pool_maxsize=server.api_pool_size,
+						max_retries=server.api_max_retries,
+						rate_limit=server.api_rate_limit,
+						burst=server.api_burst,
+						failure_threshold=server.circuit_breaker_threshold,
+						cooldown=server.circuit_breaker_cooldown,
+					),
+					woocommerce_server_url=server.woocommerce_server_url,
+					woocommerce_server=server.name,
+					wc_plugin_advanced_shipment_tracking=server.wc_plugin_advanced_shipment_tracking,
+				)
+				for server in get_wc_servers()
+				if server.enable_sync == 1
+			],
+		)
 
 		return wc_api_list
 
@@ -84,7 +90,8 @@ class WooCommerceOrder(WooCommerceResource):
 	# nosemgrep
 	@staticmethod
 	def get_list(args):
-		return WooCommerceOrder.get_list_of_records(args)
+		# The list view shows the records of the servers that responded in time
+		return WooCommerceOrder.get_list_of_records({**args, "allow_partial_results": True})
 
 	def after_load_from_db(self, order: Dict):
 		return self.get_additional_order_attributes(order)
@@ -93,7 +100,7 @@ class WooCommerceOrder(WooCommerceResource):
 	# nosemgrep
 	@staticmethod
 	def get_count(args) -> int:
-		return WooCommerceOrder.get_count_of_records(args)
+		return WooCommerceOrder.get_count_of_records({**args, "allow_partial_results": True})
 
 	def before_db_update(self, order: Dict):
 		# Drop all fields except for 'status', 'shipment_trackings' and 'line_items'
@@ -177,7 +184,10 @@ class WooCommerceOrder(WooCommerceResource):
 		if self.current_wc_api.wc_plugin_advanced_shipment_tracking and self.shipment_trackings:
 
 			# Verify if the 'shipment_trackings' field changed
-			if self.shipment_trackings != self._doc_before_save.shipment_trackings:
+			if (
+				not self._doc_before_save
+				or self.shipment_trackings != self._doc_before_save.shipment_trackings
+			):
 				# Parse JSON
 				new_shipment_tracking = json.loads(self.shipment_trackings)
 
@@ -2,7 +2,7 @@
 # For license information, please see license.txt
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, List
 
 from woocommerce_fusion.woocommerce.woocommerce_api import WooCommerceAPI, WooCommerceResource
 
@@ -28,16 +28,31 @@ class WooCommerceProduct(WooCommerceResource):
 	# nosemgrep
 	@staticmethod
 	def get_list(args):
+		# The list view shows the records of the servers that responded in time
+		args = {**args, "allow_partial_results": True}
 		products = WooCommerceProduct.get_list_of_records(args)
+		return WooCommerceProduct.extend_with_variations(products, args)
 
-		# Extend the list with product variants
-		product_ids_with_variants = [
-			product.get("id") for product in products if product.get("type") == "variable"
-		]
-		for id in product_ids_with_variants:
-			args["endpoint"] = f"products/{id}/variations"
-			variants = WooCommerceProduct.get_list_of_records(args)
-			products.extend(variants)
+	@staticmethod
+	def extend_with_variations(products: List, args) -> List:
+		"""
+		Extend a list of products with the variations of its variable products
+		"""
+		product_with_variants = [product for product in products if product.get("type") == "variable"]
+		for product in product_with_variants:
+			variation_args = {
+				**args,
+				"endpoint": f"products/{product.get('id')}/variations",
+				"servers": [product.get("woocommerce_server")],
+				"start": 0,
+				"cursor": None,
+			}
+			while True:
+				variants, next_cursor = WooCommerceProduct.get_page_of_records(variation_args)
+				products.extend(variants)
+				if not next_cursor:
+					break
+				variation_args["cursor"] = next_cursor
 
 		return products
 
@@ -68,7 +83,7 @@ class WooCommerceProduct(WooCommerceResource):
 	# nosemgrep
 	@staticmethod
 	def get_count(args) -> int:
-		return WooCommerceProduct.get_count_of_records(args)
+		return WooCommerceProduct.get_count_of_records({**args, "allow_partial_results": True})
 
 	def before_db_insert(self, product: Dict):
 		return self.clean_up_product_before_write(product)
@@ -1,9 +1,69 @@
 # Copyright (c) 2023, Dirk van der Laarse and Contributors
 # See license.txt
 
-# import frappe
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now
+
+from woocommerce_fusion.tasks.utils import insert_woocommerce_request_logs
+from woocommerce_fusion.woocommerce.doctype.woocommerce_request_log.woocommerce_request_log import (
+	WooCommerceRequestLog,
+)
 
 
 class TestWooCommerceRequestLog(FrappeTestCase):
-	pass
+	def insert_logs(self, endpoint, creation, count):
+		entry = {
+			"creation": creation,
+			"user": "Administrator",
+			"url": "https://example.com",
+			"endpoint": endpoint,
+			"method": "GET",
+			"params": None,
+			"data": None,
+			"response": None,
+			"error": None,
+			"status": "Success",
+			"traceback": None,
+			"time_elapsed": 0.1,
+		}
+		insert_woocommerce_request_logs([entry] * count)
+
+	@patch(
+		"woocommerce_fusion.woocommerce.doctype.woocommerce_request_log.woocommerce_request_log.CLEAR_LOGS_CHUNK_SIZE",
+		2,
+	)
+	@patch(
+		"woocommerce_fusion.woocommerce.doctype.woocommerce_request_log.woocommerce_request_log.frappe.db.commit"
+	)
+	def test_clear_old_logs_in_chunks_and_archive(self, mock_commit):
+		endpoint = f"orders/{frappe.generate_hash(length=8)}"
+		self.insert_logs(endpoint, add_days(now(), -40), 5)
+		self.insert_logs(endpoint, now(), 1)
+		frappe.db.set_single_value("WooCommerce Integration Settings", "archive_request_logs", 1)
+
+		with patch(
+			"woocommerce_fusion.woocommerce.doctype.woocommerce_request_log.woocommerce_request_log.frappe.get_site_path",
+			return_value=os.path.join(frappe.get_site_path("private"), "test_request_log_archive"),
+		):
+			WooCommerceRequestLog.clear_old_logs(days=30)
+
+		frappe.db.set_single_value("WooCommerce Integration Settings", "archive_request_logs", 0)
+
+		# Old logs are deleted in chunks of 2, with a commit after every chunk
+		self.assertEqual(frappe.db.count("WooCommerce Request Log", {"endpoint": endpoint}), 1)
+		self.assertEqual(mock_commit.call_count, 3)
+
+		# Deleted logs are archived
+		archive_folder = os.path.join(frappe.get_site_path("private"), "test_request_log_archive")
+		archived_logs = []
+		for filename in os.listdir(archive_folder):
+			with gzip.open(os.path.join(archive_folder, filename), "rt") as archive:
+				archived_logs.extend(json.loads(line) for line in archive)
+			os.remove(os.path.join(archive_folder, filename))
+		self.assertEqual(len([log for log in archived_logs if log["endpoint"] == endpoint]), 5)
@@ -1,15 +1,67 @@
 # Copyright (c) 2023, Dirk van der Laarse and contributors
 # For license information, please see license.txt
 
+import gzip
+import json
+import os
+from typing import List
+
 import frappe
 from frappe.model.document import Document
+from frappe.utils import add_days, cint, now_datetime, nowdate
+
+CLEAR_LOGS_CHUNK_SIZE = 5000
+ARCHIVE_FOLDER = "woocommerce_request_logs"
 
 
 class WooCommerceRequestLog(Document):
 	@staticmethod
 	def clear_old_logs(days=30):
-		from frappe.query_builder import Interval
-		from frappe.query_builder.functions import Now
-
+		"""
+		Delete logs older than the given number of days, in chunks so that the table isn't locked
+		for long periods. Logs are archived first if enabled in 'WooCommerce Integration Settings'
+		"""
 		table = frappe.qb.DocType("WooCommerce Request Log")
-		frappe.db.delete(table, filters=(table.modified < (Now() - Interval(days=days))))
+		cutoff = add_days(now_datetime(), -days)
+		archive = cint(
+			frappe.db.get_single_value("WooCommerce Integration Settings", "archive_request_logs")
+		)
+
+		while True:
+			query = (
+				frappe.qb.from_(table)
+				.where(table.creation < cutoff)
+				.orderby(table.creation)
+				.limit(CLEAR_LOGS_CHUNK_SIZE)
+			)
+			if archive:
+				logs = query.select("*").run(as_dict=True)
+				names = [log.name for log in logs]
+				archive_logs(logs)
+			else:
+				names = query.select(table.name).run(pluck=True)
+
+			if not names:
+				break
+
+			frappe.db.delete(table, filters=table.name.isin(names))
+			# nosemgrep
+			frappe.db.commit()
+
+			if len(names) < CLEAR_LOGS_CHUNK_SIZE:
+				break
+
+
+def archive_logs(logs: List[dict]):
+	"""
+	Append logs to today's gzip compressed JSON Lines archive in the private folder of the site
+	"""
+	if not logs:
+		return
+
+	folder = frappe.get_site_path("private", ARCHIVE_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+	path = os.path.join(folder, f"woocommerce_request_log_{nowdate()}.jsonl.gz")
+	with gzip.open(path, "at", encoding="utf-8") as archive:
+		for log in logs:
+			archive.write(json.dumps(log, default=str) + "\n")
@@ -1,9 +1,32 @@
 # Copyright (c) 2023, Dirk van der Laarse and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from woocommerce_fusion.woocommerce.woocommerce_api import clear_wc_server_registry, get_wc_servers
+
 
 class TestWooCommerceServer(FrappeTestCase):
-	pass
+	@patch("woocommerce_fusion.woocommerce.woocommerce_api.frappe.get_cached_doc")
+	@patch("woocommerce_fusion.woocommerce.woocommerce_api.frappe.get_all")
+	def test_wc_servers_are_cached_until_registry_is_cleared(self, mock_get_all, mock_get_cached_doc):
+		"""
+		Test that WooCommerce Server names are only read again after the registry has been invalidated,
+		and that the docs are read from the document cache on every call
+		"""
+		mock_get_all.return_value = ["woo1.example.com"]
+		clear_wc_server_registry()
+
+		get_wc_servers()
+		servers = get_wc_servers()
+		self.assertEqual(mock_get_all.call_count, 1)
+		self.assertEqual(mock_get_cached_doc.call_count, 2)
+		mock_get_cached_doc.assert_called_with("WooCommerce Server", "woo1.example.com")
+		self.assertEqual(servers, [mock_get_cached_doc.return_value])
+
+		clear_wc_server_registry()
+		get_wc_servers()
+		self.assertEqual(mock_get_all.call_count, 2)
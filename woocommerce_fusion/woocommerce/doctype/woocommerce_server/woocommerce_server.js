@@ -50,17 +50,33 @@ frappe.ui.form.on('WooCommerce Server', {
 					read_only: 1
 				},
 				{
-					label: __('Topic'),
+					label: __('Order Topics'),
 					fieldname: 'topic',
 					fieldtype: 'Data',
-					default: 'Order created',
+					default: 'Order created, Order updated, Order deleted, Order restored',
+					description: __('Create a webhook for each topic'),
 					read_only: 1
 				},
 				{
-					label: __('Delivery URL'),
+					label: __('Order Delivery URL'),
 					fieldname: 'url',
 					fieldtype: 'Data',
-					default: '<site url here>/api/method/woocommerce_fusion.woocommerce_endpoint.order_created',
+					default: '<site url here>/api/method/woocommerce_fusion.woocommerce_endpoint.order',
+					read_only: 1
+				},
+				{
+					label: __('Product Topics'),
+					fieldname: 'product_topic',
+					fieldtype: 'Data',
+					default: 'Product created, Product updated, Product deleted, Product restored',
+					description: __('Create a webhook for each topic'),
+					read_only: 1
+				},
+				{
+					label: __('Product Delivery URL'),
+					fieldname: 'product_url',
+					fieldtype: 'Data',
+					default: '<site url here>/api/method/woocommerce_fusion.woocommerce_endpoint.product',
 					read_only: 1
 				},
 				{
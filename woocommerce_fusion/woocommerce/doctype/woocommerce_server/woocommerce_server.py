@@ -9,7 +9,11 @@ from frappe.model.document import Document
 from frappe.utils.caching import redis_cache
 from woocommerce import API
 
-from woocommerce_fusion.woocommerce.woocommerce_api import parse_domain_from_url
+from woocommerce_fusion.tasks.utils import clear_sessions
+from woocommerce_fusion.woocommerce.woocommerce_api import (
+	clear_wc_server_registry,
+	parse_domain_from_url,
+)
 
 
 class WooCommerceServer(Document):
@@ -32,6 +36,17 @@ class WooCommerceServer(Document):
 		if not self.secret:
 			self.secret = frappe.generate_hash()
 
+	def on_update(self):
+		# Discard pooled HTTP sessions for this site, so that changed settings take effect
+		doc_before_save = self.get_doc_before_save()
+		if doc_before_save and doc_before_save.woocommerce_server_url != self.woocommerce_server_url:
+			clear_sessions(doc_before_save.woocommerce_server_url)
+		clear_sessions(self.woocommerce_server_url)
+		clear_wc_server_registry()
+
+	def on_trash(self):
+		clear_wc_server_registry()
+
 	def get_shipment_providers(self):
 		"""
 		Fetches the names of all shipment providers from a given WooCommerce server.
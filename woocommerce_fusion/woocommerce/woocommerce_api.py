@@ -1,16 +1,47 @@
+import base64
+import contextvars
+import hashlib
+import heapq
 import json
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple, Union
+from itertools import islice
+from time import monotonic
+from traceback import format_exception
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 import frappe
 from frappe import _
 from frappe.model.document import Document
+from frappe.utils import cint
+from requests import Response
 
 from woocommerce_fusion.exceptions import SyncDisabledError
-from woocommerce_fusion.tasks.utils import APIWithRequestLogging
+from woocommerce_fusion.tasks.utils import DEFAULT_TIMEOUT, APIWithRequestLogging
 
 WC_RESOURCE_DELIMITER = "~"
+WC_RECORDS_PER_PAGE_LIMIT = 100
+WC_BATCH_SIZE_LIMIT = 100
+WC_SERVER_REGISTRY_VERSION_KEY = "woocommerce_server_registry_version"
+WC_LIST_CURSOR_CACHE_KEY = "woocommerce_list_cursor"
+WC_LIST_CURSOR_CACHE_EXPIRY = 300
+WC_COUNT_CACHE_KEY = "woocommerce_count"
+WC_COUNT_CACHE_EXPIRY = 60
+
+# Fields that are always requested when a list query only asks for specific fields, as these are
+# needed to initialise a document and to merge the records of different servers
+WC_REQUIRED_FIELDS = (
+	"id",
+	"date_created",
+	"date_created_gmt",
+	"date_modified",
+	"date_modified_gmt",
+)
+
+# Worker-local cache of WooCommerce Server names and API's, invalidated by a version stamp in Redis
+_wc_server_registry = {}
 
 
 @dataclass
@@ -36,24 +67,30 @@ class WooCommerceResource(Document):
 		"""
 		Initialise the WooCommerce API
 		"""
-		wc_servers = frappe.get_all("WooCommerce Server")
-		wc_servers = [frappe.get_doc("WooCommerce Server", server.name) for server in wc_servers]
-
-		wc_api_list = [
-			WooCommerceAPI(
-				api=APIWithRequestLogging(
-					url=server.woocommerce_server_url,
-					consumer_key=server.api_consumer_key,
-					consumer_secret=server.api_consumer_secret,
-					version="wc/v3",
-					timeout=40,
-				),
-				woocommerce_server_url=server.woocommerce_server_url,
-				woocommerce_server=server.name,
-			)
-			for server in wc_servers
-			if server.enable_sync == 1
-		]
+		wc_api_list = get_from_wc_server_registry(
+			"WooCommerceAPI",
+			lambda: [
+				WooCommerceAPI(
+					api=APIWithRequestLogging(
+						url=server.woocommerce_server_url,
+						consumer_key=server.api_consumer_key,
+						consumer_secret=server.api_consumer_secret,
+						version="wc/v3",
+						timeout=server.api_timeout,
+						pool_maxsize=server.api_pool_size,
+						max_retries=server.api_max_retries,
+						rate_limit=server.api_rate_limit,
+						burst=server.api_burst,
+						failure_threshold=server.circuit_breaker_threshold,
+						cooldown=server.circuit_breaker_cooldown,
+					),
+					woocommerce_server_url=server.woocommerce_server_url,
+					woocommerce_server=server.name,
+				)
+				for server in get_wc_servers()
+				if server.enable_sync == 1
+			],
+		)
 
 		if len(wc_api_list) == 0:
 			frappe.throw(_("At least one WooCommerce Server should be Enabled"), SyncDisabledError)
@@ -84,13 +121,20 @@ class WooCommerceResource(Document):
 
 		# Get WooCommerce Record
 		try:
-			record = self.current_wc_api.api.get(f"{self.resource}/{record_id}").json()
+			response = self.current_wc_api.api.get(f"{self.resource}/{record_id}")
+			record = response.json()
 		except Exception as err:
 			error_text = (
 				f"load_from_db failed (WooCommerce {self.resource} #{record_id})\n\n{frappe.get_traceback()}"
 			)
 			log_and_raise_error(error_text)
 
+		# Records that were permanently deleted in WooCommerce are not found
+		if response.status_code == 404:
+			frappe.throw(
+				_("{0} {1} does not exist").format(_(self.doctype), self.name), frappe.DoesNotExistError
+			)
+
 		if "id" not in record:
 			log_and_raise_error(
 				error_text=f"load_from_db failed (WooCommerce {self.resource} #{record_id})\nOrder:\n{str(record)}"
@@ -113,106 +157,165 @@ class WooCommerceResource(Document):
 	def get_list_of_records(cls, args) -> list[Union[Dict, "WooCommerceResource"]]:
 		"""
 		Returns List of WooCommerce Records (List view and Report view).
+		"""
+		records, _next_cursor = cls.get_page_of_records(args)
+		return records
 
-		First make a single API call for each API in the list and check if its total record count
-		falls within the required range. If not, we adjust the offset for the next API and
-		continue to the next one. Otherwise, we start retrieving the required records.
+	@classmethod
+	def get_page_of_records(
+		cls, args
+	) -> Tuple[list[Union[Dict, "WooCommerceResource"]], Optional[str]]:
+		"""
+		Returns a page of WooCommerce Records, and an opaque cursor for the next page (None if there
+		are no more records). If '_fields' is passed in the args, only those WooCommerce fields are
+		requested.
+
+		The servers are queried concurrently and their records are merged, newest first, by creation
+		date (ties are broken by the order of the servers). The cursor holds the offset reached on each
+		server, so that sweeping through all records costs one request per server per page. When paging
+		by 'start' instead, the cursor left by the previous page is looked up in the cache, and if it
+		has expired, the records before 'start' are skipped in pages of 100.
 		"""
 		# Initialise the WC API
 		wc_api_list = cls._init_api()
 
-		if len(wc_api_list) > 0:
-			wc_records_per_page_limit = 100
-
-			# Map Frappe query parameters to WooCommerce query parameters
-			params = {}
-			per_page = (
-				min(int(args["page_length"]), wc_records_per_page_limit)
-				if args and "page_length" in args
-				else wc_records_per_page_limit
-			)
-			offset = int(args["start"]) if args and "start" in args else 0
-			params["per_page"] = min(per_page + offset, wc_records_per_page_limit)
-
-			# Map Frappe filters to WooCommerce parameters
-			if "filters" in args and args["filters"]:
-				updated_params = get_wc_parameters_from_filters(args["filters"])
-				params.update(updated_params)
-
-			# Initialse required variables
-			all_results = []
-			total_processed = 0
-
-			for wc_server in wc_api_list:
-				# Skip this API call if one or more servers were specified
-				if args.get("servers", None):
-					if wc_server.woocommerce_server not in args["servers"]:
-						continue
-
-				current_offset = 0
-
-				# Get WooCommerce Records
-				params["offset"] = current_offset
-				try:
-					endpoint = args["endpoint"] if "endpoint" in args else cls.resource
-					response = wc_server.api.get(endpoint, params=params)
-				except Exception as err:
-					log_and_raise_error(err, error_text="get_list failed")
-				if response.status_code != 200:
-					log_and_raise_error(error_text="get_list failed", response=response)
+		# Skip servers if one or more servers were specified
+		if args.get("servers", None):
+			wc_api_list = [
+				wc_server for wc_server in wc_api_list if wc_server.woocommerce_server in args["servers"]
+			]
+
+		# Map Frappe query parameters to WooCommerce query parameters
+		params = {"orderby": "date", "order": "desc"}
+		page_length = (
+			min(int(args["page_length"]), WC_RECORDS_PER_PAGE_LIMIT)
+			if args.get("page_length")
+			else WC_RECORDS_PER_PAGE_LIMIT
+		)
 
-				# Store the count of total records in this API
-				count_of_total_records_in_api = int(response.headers["x-wp-total"])
+		# Map Frappe filters to WooCommerce parameters
+		if "filters" in args and args["filters"]:
+			updated_params = get_wc_parameters_from_filters(args["filters"])
+			params.update(updated_params)
+
+		# Only request the given WooCommerce fields, along with the fields required for a document
+		if args.get("_fields", None):
+			params["_fields"] = ",".join(sorted(set(args["_fields"]) | set(WC_REQUIRED_FIELDS)))
+
+		endpoint = args["endpoint"] if "endpoint" in args else cls.resource
+		allow_partial_results = args.get("allow_partial_results", False)
+
+		# Find the offset on each server where this page starts
+		start = int(args["start"]) if args.get("start") else 0
+		cursor_cache_key = None
+		if args.get("cursor", None):
+			offsets = decode_list_cursor(args["cursor"])
+		else:
+			cursor_cache_key = get_list_cursor_cache_key(endpoint, params, wc_api_list)
+			offsets = {wc_server.woocommerce_server: 0 for wc_server in wc_api_list}
+			if start and (cached_cursor := frappe.cache().get_value(f"{cursor_cache_key}|{start}")):
+				offsets = decode_list_cursor(cached_cursor)
+			else:
+				skip = start
+				while skip > 0 and offsets:
+					skipped, offsets = cls.get_merged_records(
+						wc_api_list,
+						endpoint,
+						params,
+						offsets,
+						min(skip, WC_RECORDS_PER_PAGE_LIMIT),
+						allow_partial_results,
+					)
+					if not skipped:
+						break
+					skip -= len(skipped)
 
-				# Skip this API if all its records fall before the required offset
-				if count_of_total_records_in_api <= offset - total_processed:
-					total_processed += count_of_total_records_in_api
-					continue
+		merged_records, offsets = cls.get_merged_records(
+			wc_api_list, endpoint, params, offsets, page_length, allow_partial_results
+		)
 
-				# Parse the response
-				results = response.json()
+		# Add frappe fields to records
+		all_results = []
+		for wc_server, record in merged_records:
+			cls.pre_init_document(record=record, woocommerce_server_url=wc_server.woocommerce_server_url)
 
-				# If we're still here, it means that this API has some records in the required range
-				while True:
-					if len(all_results) >= per_page:
-						if args.get("as_doc", None):
-							return [frappe.get_doc(record) for record in all_results]
-						else:
-							return all_results
+			cls.during_get_list_of_records(record)
 
-					# Adjust indices based on remaining offset and records to collect
-					start = max(0, offset - total_processed)
-					end = min(len(results), per_page - len(all_results) + start)
+			all_results.append(record)
 
-					# Add frappe fields to records
-					for record in results[start:end]:
-						cls.pre_init_document(record=record, woocommerce_server_url=wc_server.woocommerce_server_url)
+		next_cursor = encode_list_cursor(offsets) if offsets else None
+		if next_cursor and cursor_cache_key:
+			frappe.cache().set_value(
+				f"{cursor_cache_key}|{start + len(all_results)}",
+				next_cursor,
+				expires_in_sec=WC_LIST_CURSOR_CACHE_EXPIRY,
+			)
 
-						cls.during_get_list_of_records(record)
+		if args.get("as_doc", None):
+			return [frappe.get_doc(record) for record in all_results], next_cursor
+		else:
+			return all_results, next_cursor
 
-					all_results.extend(results[start:end])
-					total_processed += len(results)
+	@staticmethod
+	def get_merged_records(
+		wc_api_list: List[WooCommerceAPI],
+		endpoint: str,
+		params: Dict,
+		offsets: Dict[str, int],
+		limit: int,
+		allow_partial_results: bool = False,
+	) -> Tuple[List[Tuple[WooCommerceAPI, Dict]], Dict[str, int]]:
+		"""
+		Get up to 'limit' records, starting at the given offset on each server, merged by creation date.
 
-					# Check if there are no more records available or required
-					if len(results) < per_page:
-						break
+		Returns the records (with the server each came from), and the offsets for the next call. Servers
+		without further records are left out of the offsets, and servers that did not respond keep their
+		offset.
+		"""
+		wc_servers = [wc_server for wc_server in wc_api_list if wc_server.woocommerce_server in offsets]
+		responses = get_from_wc_servers_concurrently(
+			[
+				(
+					wc_server,
+					endpoint,
+					{**params, "per_page": limit, "offset": offsets[wc_server.woocommerce_server]},
+				)
+				for wc_server in wc_servers
+			],
+			error_text="get_list failed",
+			allow_partial_results=allow_partial_results,
+		)
 
-					current_offset += params["per_page"]
+		# Each server returns its records newest first, so a k-way merge keeps that order across servers
+		records_per_server = [
+			[(wc_server, record) for record in responses[wc_server.woocommerce_server].json()[:limit]]
+			for wc_server in wc_servers
+			if wc_server.woocommerce_server in responses
+		]
+		merged_records = list(
+			islice(
+				heapq.merge(
+					*records_per_server,
+					key=lambda server_and_record: server_and_record[1].get("date_created_gmt") or "",
+					reverse=True,
+				),
+				limit,
+			)
+		)
 
-					# Get WooCommerce Records
-					params["offset"] = current_offset
-					try:
-						response = wc_server.api.get(cls.resource, params=params)
-					except Exception as err:
-						log_and_raise_error(err, error_text="get_list failed")
-					if response.status_code != 200:
-						log_and_raise_error(error_text="get_list failed", response=response)
-					results = response.json()
+		# Advance the offset of each server by the number of its records that made it into the page
+		taken = Counter(wc_server.woocommerce_server for wc_server, record in merged_records)
+		next_offsets = {}
+		for wc_server in wc_servers:
+			server_name = wc_server.woocommerce_server
+			if server_name not in responses:
+				next_offsets[server_name] = offsets[server_name]
+				continue
+			next_offset = offsets[server_name] + taken[server_name]
+			if next_offset < int(responses[server_name].headers["x-wp-total"]):
+				next_offsets[server_name] = next_offset
 
-			if args.get("as_doc", None):
-				return [frappe.get_doc(record) for record in all_results]
-			else:
-				return all_results
+		return merged_records, next_offsets
 
 	@classmethod
 	def during_get_list_of_records(cls, record: Document):
@@ -224,22 +327,45 @@ class WooCommerceResource(Document):
 	def get_count_of_records(cls, args) -> int:
 		"""
 		Returns count of WooCommerce Records (List view and Report view)
+
+		Only a single record ID is requested from each server, as the count is read from the
+		'x-wp-total' header. Counts are cached per server and set of filters.
 		"""
 		# Initialise the WC API
 		wc_api_list = cls._init_api()
-		total_count = 0
 
+		# Request the smallest possible page, filtered in the same way as the list
+		params = {"per_page": 1, "_fields": "id"}
+		if args.get("filters", None):
+			params.update(get_wc_parameters_from_filters(args["filters"]))
+
+		wc_settings = frappe.get_cached_doc("WooCommerce Integration Settings")
+		count_cache_ttl = cint(wc_settings.count_cache_ttl) or WC_COUNT_CACHE_EXPIRY
+
+		# The cache keys are derived before the requests, as the request layer may add authentication
+		# parameters to the params it is given
+		total_count = 0
+		wc_servers_to_count = {}
 		for wc_server in wc_api_list:
-			# Get WooCommerce Records
-			try:
-				response = wc_server.api.get(cls.resource)
-			except Exception as err:
-				log_and_raise_error(err, error_text="get_count failed")
-			if response.status_code != 200:
-				log_and_raise_error(error_text="get_count failed", response=response)
+			cache_key = get_count_cache_key(cls.resource, params, wc_server)
+			count = frappe.cache().get_value(cache_key)
+			if count is None:
+				wc_servers_to_count[cache_key] = wc_server
+			else:
+				total_count += count
 
-			if "x-wp-total" in response.headers:
-				total_count += int(response.headers["x-wp-total"])
+		# Each request gets its own copy of the params, as the requests are sent concurrently
+		responses = get_from_wc_servers_concurrently(
+			[(wc_server, cls.resource, dict(params)) for wc_server in wc_servers_to_count.values()],
+			error_text="get_count failed",
+			allow_partial_results=args.get("allow_partial_results", False),
+		)
+
+		for cache_key, wc_server in wc_servers_to_count.items():
+			if response := responses.get(wc_server.woocommerce_server):
+				count = int(response.headers.get("x-wp-total", 0))
+				frappe.cache().set_value(cache_key, count, expires_in_sec=count_cache_ttl)
+				total_count += count
 
 		return total_count
 
@@ -264,10 +390,7 @@ class WooCommerceResource(Document):
 		)
 
 		# Prepare data
-		record_data = self.to_dict()
-		record = self.deserialize_attributes_of_type_dict_or_list(record_data)
-
-		record = self.before_db_insert(record)
+		record = self.prepare_record_for_db_insert()
 
 		endpoint = (
 			f"{self.resource}/{self.parent_id}/{self.child_resource}"
@@ -286,33 +409,71 @@ class WooCommerceResource(Document):
 	def before_db_insert(self, record: Dict):
 		return record
 
-	def db_update(self, *args, **kwargs):
+	def prepare_record_for_db_insert(self) -> Dict:
 		"""
-		Updates a WooCommerce Record
+		Returns the data that should be posted to WooCommerce to create this record
 		"""
-		# Verify that the WC API has been initialised
-		if not self.wc_api_list:
-			self.init_api()
+		record_data = self.to_dict()
+		record = self.deserialize_attributes_of_type_dict_or_list(record_data)
 
-		# Prepare data
+		return self.before_db_insert(record)
+
+	def prepare_record_for_db_update(self) -> Dict:
+		"""
+		Returns the data that should be put to WooCommerce to update this record, i.e. only the
+		fields that changed since the document was loaded
+		"""
 		record_data = self.to_dict()
 		record = self.deserialize_attributes_of_type_dict_or_list(record_data)
 
 		record = self.before_db_update(record)
 
 		# Drop fields with values that are unchanged
-		record_data_before_save = self._doc_before_save.to_dict()
-		record_before_save = self.deserialize_attributes_of_type_dict_or_list(record_data_before_save)
-		if self.field_setter_map:
-			for new_key, old_key in self.field_setter_map.items():
-				record_before_save[old_key] = record_before_save[new_key]
-		keys_to_pop = [
-			key
-			for key, value in record.items()
-			if record_before_save.get(key) == value or str(record_before_save.get(key)) == str(value)
-		]
-		for key in keys_to_pop:
-			record.pop(key)
+		if self._doc_before_save:
+			record_data_before_save = self._doc_before_save.to_dict()
+			record_before_save = self.deserialize_attributes_of_type_dict_or_list(record_data_before_save)
+			if self.field_setter_map:
+				for new_key, old_key in self.field_setter_map.items():
+					record_before_save[old_key] = record_before_save[new_key]
+			keys_to_pop = [
+				key
+				for key, value in record.items()
+				if record_before_save.get(key) == value or str(record_before_save.get(key)) == str(value)
+			]
+			for key in keys_to_pop:
+				record.pop(key)
+
+		return record
+
+	def get_batch_endpoint(self) -> str:
+		"""
+		Returns the WooCommerce batch endpoint for this record, e.g. "products/batch" or
+		"products/11/variations/batch"
+		"""
+		return (
+			f"{self.resource}/{self.parent_id}/{self.child_resource}/batch"
+			if self.parent_id and self.child_resource
+			else f"{self.resource}/batch"
+		)
+
+	@classmethod
+	def get_batch_writer(cls, batch_size: int = WC_BATCH_SIZE_LIMIT) -> "WooCommerceBatchWriter":
+		"""
+		Returns a WooCommerceBatchWriter for this resource, which creates and updates records
+		with WooCommerce's batch endpoints
+		"""
+		return WooCommerceBatchWriter(resource_class=cls, batch_size=batch_size)
+
+	def db_update(self, *args, **kwargs):
+		"""
+		Updates a WooCommerce Record
+		"""
+		# Verify that the WC API has been initialised
+		if not self.wc_api_list:
+			self.init_api()
+
+		# Prepare data
+		record = self.prepare_record_for_db_update()
 
 		# Parse the server domain and id from the Document name
 		wc_server_domain, id = get_domain_and_id_from_woocommerce_record_name(self.name)
@@ -401,10 +562,9 @@ class WooCommerceResource(Document):
 		This function iterates over the fields of the input object that are expected to be in JSON format,
 		and if the field is present in the object, it transforms the field's value into a JSON-formatted string.
 		"""
-		json_fields = cls.get_json_fields()
-		for field in json_fields:
-			if field.fieldname in obj:
-				obj[field.fieldname] = json.dumps(obj[field.fieldname])
+		for fieldname in cls.get_json_fields():
+			if fieldname in obj:
+				obj[fieldname] = json.dumps(obj[fieldname])
 		return obj
 
 	@classmethod
@@ -415,24 +575,209 @@ class WooCommerceResource(Document):
 		This function iterates over the fields of the input object that are expected to be in JSON format,
 		and if the field is present in the object, it transforms the field's value from a JSON-formatted string.
 		"""
-		json_fields = cls.get_json_fields()
-		for field in json_fields:
-			if field.fieldname in obj and obj[field.fieldname]:
-				obj[field.fieldname] = json.loads(obj[field.fieldname])
+		for fieldname in cls.get_json_fields():
+			if fieldname in obj and obj[fieldname]:
+				obj[fieldname] = json.loads(obj[fieldname])
 		return obj
 
 	@classmethod
-	def get_json_fields(cls):
+	def get_json_fields(cls) -> FrozenSet[str]:
 		"""
-		Returns a list of fields that have been defined with type "JSON"
+		Returns the fieldnames of fields that have been defined with type "JSON"
+
+		The fieldnames are read from the DocType's metadata, which Frappe caches and clears when the
+		DocType changes during a migration, and are kept for the rest of the request or job.
 		"""
-		fields = frappe.db.get_all(
-			"DocField",
-			{"parent": cls.doctype, "fieldtype": "JSON"},
-			["name", "fieldname", "fieldtype"],
+		return frappe.local_cache(
+			"woocommerce_json_fields",
+			cls.doctype,
+			lambda: frozenset(
+				field.fieldname for field in frappe.get_meta(cls.doctype).get("fields", {"fieldtype": "JSON"})
+			),
 		)
 
-		return fields
+
+@dataclass
+class WooCommerceBatchResult:
+	"""Class for keeping track of the outcome of a single operation in a batch request."""
+
+	doc: WooCommerceResource
+	action: str
+	success: bool
+	error: Optional[str] = None
+
+
+class WooCommerceBatchWriter:
+	"""
+	Accumulates create and update operations on WooCommerce Records, and writes them to WooCommerce
+	with the resource's batch endpoint (e.g. products/batch), in chunks of up to 100 records.
+
+	Updated documents should have _doc_before_save set, so that only changed fields are sent.
+	"""
+
+	def __init__(self, resource_class: type, batch_size: int = WC_BATCH_SIZE_LIMIT):
+		if batch_size < 1 or batch_size > WC_BATCH_SIZE_LIMIT:
+			raise ValueError(f"batch_size should be between 1 and {WC_BATCH_SIZE_LIMIT}")
+		self.resource_class = resource_class
+		self.batch_size = batch_size
+		self.wc_api_list = None
+		self.pending: List[Tuple[str, WooCommerceResource]] = []
+
+	def insert(self, doc: WooCommerceResource):
+		"""
+		Queue the creation of a new WooCommerce Record
+		"""
+		self.pending.append(("create", doc))
+
+	def update(self, doc: WooCommerceResource):
+		"""
+		Queue an update of an existing WooCommerce Record
+		"""
+		self.pending.append(("update", doc))
+
+	def __len__(self):
+		return len(self.pending)
+
+	def flush(self) -> List[WooCommerceBatchResult]:
+		"""
+		Write all queued operations to WooCommerce and return the result of every operation
+		"""
+		if not self.wc_api_list:
+			self.wc_api_list = self.resource_class._init_api()
+
+		# Group operations by WooCommerce server and batch endpoint
+		groups = {}
+		for action, doc in self.pending:
+			if action == "create":
+				wc_server = doc.woocommerce_server
+			else:
+				wc_server, record_id = get_domain_and_id_from_woocommerce_record_name(doc.name)
+			groups.setdefault((wc_server, doc.get_batch_endpoint()), []).append((action, doc))
+		self.pending = []
+
+		results = []
+		for (wc_server, endpoint), operations in groups.items():
+			wc_api = next(
+				(api for api in self.wc_api_list if wc_server in api.woocommerce_server_url), None
+			)
+			for i in range(0, len(operations), self.batch_size):
+				results.extend(self.post_batch(wc_api, endpoint, operations[i : i + self.batch_size]))
+
+		return results
+
+	def post_batch(
+		self,
+		wc_api: Optional[WooCommerceAPI],
+		endpoint: str,
+		operations: List[Tuple[str, WooCommerceResource]],
+	) -> List[WooCommerceBatchResult]:
+		"""
+		Make a single batch request and map the result of every item back to its document
+		"""
+		if not wc_api:
+			error_text = _("No enabled WooCommerce Server found")
+			return [
+				WooCommerceBatchResult(doc=doc, action=action, success=False, error=error_text)
+				for action, doc in operations
+			]
+
+		creates = [doc for action, doc in operations if action == "create"]
+		updates = [doc for action, doc in operations if action == "update"]
+		data = {
+			"create": [doc.prepare_record_for_db_insert() for doc in creates],
+			"update": [],
+		}
+		for doc in updates:
+			record = doc.prepare_record_for_db_update()
+			record["id"] = get_domain_and_id_from_woocommerce_record_name(doc.name)[1]
+			data["update"].append(record)
+
+		try:
+			response = wc_api.api.post(endpoint, data=data)
+		except Exception:
+			error_text = f"batch write failed\n\n{frappe.get_traceback()}"
+			frappe.log_error("WooCommerce Error", error_text)
+			return [
+				WooCommerceBatchResult(doc=doc, action=action, success=False, error=error_text)
+				for action, doc in operations
+			]
+		if response.status_code not in (200, 201):
+			error_text = f"batch write failed\nResponse Code: {response.status_code}\nResponse Text: {response.text}"
+			frappe.log_error("WooCommerce Error", error_text)
+			return [
+				WooCommerceBatchResult(doc=doc, action=action, success=False, error=error_text)
+				for action, doc in operations
+			]
+
+		response_data = response.json()
+		results = []
+		for action, docs in (("create", creates), ("update", updates)):
+			items = response_data.get(action) or []
+			for i, doc in enumerate(docs):
+				item = items[i] if i < len(items) else {"error": {"message": "Missing in batch response"}}
+				if "error" in item:
+					results.append(
+						WooCommerceBatchResult(
+							doc=doc, action=action, success=False, error=item["error"].get("message")
+						)
+					)
+					continue
+				if action == "create":
+					doc.woocommerce_id = item["id"]
+				doc.woocommerce_date_modified = item["date_modified"]
+				if action == "update":
+					doc.after_db_update()
+				results.append(WooCommerceBatchResult(doc=doc, action=action, success=True))
+
+		return results
+
+
+def get_wc_server_registry_version() -> str:
+	"""
+	Returns the current version stamp of the WooCommerce Server registry, shared by all workers through Redis
+	"""
+	version = frappe.cache().get_value(WC_SERVER_REGISTRY_VERSION_KEY)
+	if not version:
+		version = frappe.generate_hash(length=10)
+		frappe.cache().set_value(WC_SERVER_REGISTRY_VERSION_KEY, version)
+	return version
+
+
+def clear_wc_server_registry():
+	"""
+	Invalidate the cached WooCommerce Servers and API's in all workers
+	"""
+	frappe.cache().set_value(WC_SERVER_REGISTRY_VERSION_KEY, frappe.generate_hash(length=10))
+
+
+def get_from_wc_server_registry(key: str, builder: Callable) -> List:
+	"""
+	Returns a copy of a list that is derived from WooCommerce Server docs, from the worker-local registry.
+
+	The list is rebuilt with builder() if it is missing or if the registry version stamp has changed.
+	"""
+	version = get_wc_server_registry_version()
+	registry_key = (frappe.local.site, key)
+	cached = _wc_server_registry.get(registry_key)
+	if not cached or cached[0] != version:
+		cached = (version, builder())
+		_wc_server_registry[registry_key] = cached
+	return list(cached[1])
+
+
+def get_wc_servers() -> List[Document]:
+	"""
+	Returns all WooCommerce Server docs.
+
+	Only the names are kept in the worker-local registry. The docs are read from the document cache,
+	so that jobs don't share the same Document objects
+	"""
+	return [
+		frappe.get_cached_doc("WooCommerce Server", name)
+		for name in get_from_wc_server_registry(
+			"WooCommerce Server", lambda: frappe.get_all("WooCommerce Server", pluck="name")
+		)
+	]
 
 
 def generate_woocommerce_record_name_from_domain_and_id(
@@ -544,3 +889,139 @@ def get_domain_and_id_from_woocommerce_record_name(
 	"""
 	domain, record_id = name.split(delimiter)
 	return domain, int(record_id)
+
+
+def get_from_wc_servers_concurrently(
+	requests: List[Tuple[WooCommerceAPI, str, Dict]],
+	error_text: str,
+	allow_partial_results: bool = False,
+) -> Dict[str, Response]:
+	"""
+	Make GET requests to WooCommerce servers concurrently, given as (server, endpoint, params) tuples.
+
+	Returns the responses keyed by WooCommerce Server name. Each server gets its API timeout to
+	respond. If allow_partial_results is set, servers that fail or time out are left out of the
+	responses and the user is notified, otherwise an error is raised.
+	"""
+	futures = {}
+	executor = None
+	if len(requests) > 1:
+		executor = ThreadPoolExecutor(max_workers=len(requests))
+		# Each thread gets a copy of the context, so that the site's Redis keys are available. The
+		# requests are logged on this thread, as the database connection must not be shared
+		for wc_server, endpoint, params in requests:
+			futures[wc_server.woocommerce_server] = executor.submit(
+				contextvars.copy_context().run, send_get_request, wc_server.api, endpoint, params
+			)
+
+	started = monotonic()
+	responses = {}
+	failed_servers = []
+	try:
+		for wc_server, endpoint, params in requests:
+			server_name = wc_server.woocommerce_server
+			try:
+				if server_name in futures:
+					timeout = cint(wc_server.api.timeout) or DEFAULT_TIMEOUT
+					response = futures[server_name].result(timeout=max(0, started + timeout - monotonic()))
+				else:
+					response = wc_server.api.get(endpoint, params=params)
+			except Exception as err:
+				if not allow_partial_results:
+					log_and_raise_error(err, error_text=f"{error_text} ({server_name})")
+				failed_servers.append(server_name)
+				continue
+			if response.status_code != 200:
+				if not allow_partial_results:
+					log_and_raise_error(error_text=f"{error_text} ({server_name})", response=response)
+				failed_servers.append(server_name)
+				continue
+			responses[server_name] = response
+	finally:
+		if executor:
+			# Don't wait for servers that timed out, their threads finish in the background without
+			# using the database connection
+			executor.shutdown(wait=False, cancel_futures=True)
+			for wc_server, endpoint, params in requests:
+				log_threaded_request(wc_server.api, endpoint, params, futures[wc_server.woocommerce_server])
+
+	if failed_servers:
+		frappe.msgprint(
+			_("WooCommerce Server(s) {0} could not be reached in time, results are incomplete").format(
+				", ".join(failed_servers)
+			),
+			indicator="orange",
+			alert=True,
+		)
+
+	return responses
+
+
+def send_get_request(api, endpoint: str, params: Dict) -> Response:
+	"""
+	Send a GET request from a worker thread, without logging it
+	"""
+	if isinstance(api, APIWithRequestLogging):
+		return api.request_without_logging("GET", endpoint, params=params)
+	return api.get(endpoint, params=params)
+
+
+def log_threaded_request(api, endpoint: str, params: Dict, future: Future):
+	"""
+	Log a GET request that was sent from a worker thread by send_get_request. Requests that are still
+	running are logged as timed out
+	"""
+	if not isinstance(api, APIWithRequestLogging) or future.cancelled():
+		return
+	if not future.done():
+		api.log_request("GET", endpoint, None, params, None, error="Timed out waiting for a response")
+		return
+	error = future.exception()
+	if error:
+		api.log_request("GET", endpoint, None, params, None, error="".join(format_exception(error)))
+	else:
+		api.log_request("GET", endpoint, None, params, future.result())
+
+
+def get_list_cursor_cache_key(
+	endpoint: str, params: Dict, wc_api_list: List[WooCommerceAPI]
+) -> str:
+	"""
+	Returns the cache key prefix for cursors of a list query
+	"""
+	query_hash = get_query_hash(
+		endpoint, params, [wc_server.woocommerce_server for wc_server in wc_api_list]
+	)
+	return f"{WC_LIST_CURSOR_CACHE_KEY}|{query_hash}"
+
+
+def get_count_cache_key(endpoint: str, params: Dict, wc_server: WooCommerceAPI) -> str:
+	"""
+	Returns the cache key for the count of a query on a WooCommerce server
+	"""
+	query_hash = get_query_hash(endpoint, params)
+	return f"{WC_COUNT_CACHE_KEY}|{wc_server.woocommerce_server}|{query_hash}"
+
+
+def get_query_hash(*query) -> str:
+	return hashlib.md5(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def encode_list_cursor(offsets: Dict[str, int]) -> str:
+	"""
+	Encode the offsets reached on each WooCommerce server as an opaque cursor
+	"""
+	return base64.urlsafe_b64encode(json.dumps(offsets).encode()).decode()
+
+
+def decode_list_cursor(cursor: str) -> Dict[str, int]:
+	"""
+	Decode a cursor returned by WooCommerceResource.get_page_of_records
+
+	E.g. "eyJzaXRlMS5leGFtcGxlLmNvbSI6IDEwMH0=" returns {"site1.example.com": 100}
+	"""
+	try:
+		offsets = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+		return {woocommerce_server: int(offset) for woocommerce_server, offset in offsets.items()}
+	except Exception:
+		frappe.throw(_("Invalid cursor"))
@@ -3,24 +3,23 @@ import hashlib
 import hmac
 import json
 from http import HTTPStatus
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 
 import frappe
 from frappe import _
 from werkzeug.wrappers import Response
 
-from woocommerce_fusion.tasks.sync_sales_orders import run_sales_order_sync
-from woocommerce_fusion.woocommerce.woocommerce_api import (
-	WC_RESOURCE_DELIMITER,
-	parse_domain_from_url,
-)
+from woocommerce_fusion.tasks.webhooks import WC_WEBHOOK_EVENTS, receive_webhook
+from woocommerce_fusion.woocommerce.woocommerce_api import parse_domain_from_url
 
 
 def validate_request() -> Tuple[bool, Optional[HTTPStatus], Optional[str]]:
 	# Get relevant WooCommerce Server
 	try:
 		webhook_source_url = frappe.get_request_header("x-wc-webhook-source", "")
-		wc_server = frappe.get_doc("WooCommerce Server", parse_domain_from_url(webhook_source_url))
+		wc_server = frappe.get_cached_doc(
+			"WooCommerce Server", parse_domain_from_url(webhook_source_url)
+		)
 	except Exception:
 		return False, HTTPStatus.BAD_REQUEST, _("Missing Header")
 
@@ -28,41 +27,78 @@ def validate_request() -> Tuple[bool, Optional[HTTPStatus], Optional[str]]:
 	sig = base64.b64encode(
 		hmac.new(wc_server.secret.encode("utf8"), frappe.request.data, hashlib.sha256).digest()
 	)
-	# if (
-	# 	frappe.request.data
-	# 	and not sig == frappe.get_request_header("x-wc-webhook-signature", "").encode()
-	# ):
-	# 	return False, HTTPStatus.UNAUTHORIZED, _("Unauthorized")
+	# The payload is used to create and update documents, so it must be signed by WooCommerce
+	if not hmac.compare_digest(sig, frappe.get_request_header("x-wc-webhook-signature", "").encode()):
+		return False, HTTPStatus.UNAUTHORIZED, _("Unauthorized")
 
 	frappe.set_user(wc_server.creation_user)
 	return True, None, None
 
 
-@frappe.whitelist(allow_guest=True, methods=["POST"])
-def order_created(*args, **kwargs):
+def get_webhook_payload() -> Tuple[Optional[Union[Dict, bytes]], Optional[str]]:
+	"""
+	Returns the payload and the event (e.g. 'created') of a WooCommerce webhook request
 	"""
-	Accepts payload data from WooCommerce "Order Created" webhook
+	if not (frappe.request and frappe.request.data):
+		return None, None
+
+	try:
+		payload = json.loads(frappe.request.data)
+	except ValueError:
+		# woocommerce returns 'webhook_id=value' for the first request which is not JSON
+		payload = frappe.request.data
+	return payload, frappe.get_request_header("x-wc-webhook-event")
+
+
+def receive_webhook_request(resource: str) -> Response:
+	"""
+	Validate a WooCommerce webhook request and put it in the webhook inbox. The webhook is processed
+	by a background job, so that WooCommerce gets a response straight away
 	"""
 	valid, status, msg = validate_request()
 	if not valid:
 		return Response(response=msg, status=status)
 
-	if frappe.request and frappe.request.data:
-		try:
-			order = json.loads(frappe.request.data)
-		except ValueError:
-			# woocommerce returns 'webhook_id=value' for the first request which is not JSON
-			order = frappe.request.data
-		event = frappe.get_request_header("x-wc-webhook-event")
-	else:
+	payload, event = get_webhook_payload()
+	if payload is None:
 		return Response(response=_("Missing Header"), status=HTTPStatus.BAD_REQUEST)
-
-	if event == "created":
-		webhook_source_url = frappe.get_request_header("x-wc-webhook-source", "")
-		woocommerce_order_name = (
-			f"{parse_domain_from_url(webhook_source_url)}{WC_RESOURCE_DELIMITER}{order['id']}"
-		)
-		frappe.enqueue(run_sales_order_sync, queue="long", woocommerce_order_name=woocommerce_order_name)
+	if not isinstance(payload, dict):
 		return Response(status=HTTPStatus.OK)
-	else:
+	if event not in WC_WEBHOOK_EVENTS[resource]:
 		return Response(response=_("Event not supported"), status=HTTPStatus.BAD_REQUEST)
+
+	receive_webhook(
+		resource,
+		event,
+		woocommerce_server_url=frappe.get_request_header("x-wc-webhook-source", ""),
+		payload=payload,
+		delivery_id=frappe.get_request_header("x-wc-webhook-delivery-id"),
+	)
+	return Response(status=HTTPStatus.OK)
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def order_created(*args, **kwargs):
+	"""
+	Accepts payload data from WooCommerce "Order Created" webhook. Kept for webhooks that were
+	configured before the other order events were supported
+	"""
+	return order(*args, **kwargs)
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def order(*args, **kwargs):
+	"""
+	Accepts payload data from WooCommerce "Order created", "Order updated", "Order deleted" and
+	"Order restored" webhooks
+	"""
+	return receive_webhook_request("orders")
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def product(*args, **kwargs):
+	"""
+	Accepts payload data from WooCommerce "Product created", "Product updated", "Product deleted"
+	and "Product restored" webhooks
+	"""
+	return receive_webhook_request("products")